@@ -1,14 +1,21 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_data_files
 from PyInstaller.utils.hooks import collect_submodules
+import os
 
 datas = []
-hiddenimports = ['sshtunnel', 'paramiko']
+hiddenimports = ['sshtunnel', 'paramiko', 'waitress']
 datas += collect_data_files('cryptography')
 datas += collect_data_files('bcrypt')
 datas += collect_data_files('nacl')
 hiddenimports += collect_submodules('mysql.connector')
 hiddenimports += collect_submodules('mysql.connector.plugins')
+hiddenimports += collect_submodules('uvicorn')
+hiddenimports += ['a2wsgi']
+
+# BACKEND_PROFILE_IMPORTS=1 pyinstaller BackendGDP.spec : build instrumentée,
+# "-X importtime" sur stderr (exploité par bench/startup.py --target frozen --importtime)
+options = [('X importtime', None, 'OPTION')] if os.getenv('BACKEND_PROFILE_IMPORTS') == '1' else []
 
 
 a = Analysis(
@@ -29,6 +36,7 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
+    options,
     a.binaries,
     a.datas,
     [],
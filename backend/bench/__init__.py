@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Banc d'essai du backend (hors production)
+- gen_data : jeu de données synthétique (tableau_production_2, clients, donnees, GDP)
+- loadgen  : rejoue le trafic des postes clients et mesure p50/p95/p99 + RPS par endpoint
+Voir README.txt pour la base de substitution locale (DB_MODE=direct).
+"""
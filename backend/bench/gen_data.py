@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Jeu de données synthétique pour le banc d'essai
+- tableau_production_2 : toutes les colonnes MODxx, dates texte en formats mêlés
+  (JJ/MM/AAAA, JJ-MM-AAAA, AAAA-MM-JJ, vides), montants texte ("1 234,50 €", "1234.5", "")
+- clients / donnees / GDP : volumes réalistes rapportés au nombre de commandes
+- tailles : 1k | 100k | 1M (ou un entier), graine fixe → jeux reproductibles
+
+Usage (base locale, jamais la production ; MYSQL_DB autre que "bench" refusé sans --i-know) :
+  MYSQL_HOST=127.0.0.1 MYSQL_PORT=3306 MYSQL_DB=bench MYSQL_USER=bench MYSQL_PWD=bench \\
+  python -m bench.gen_data --size 100k --drop
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+import mysql.connector
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+BENCH_DB = "bench"  # seul nom de base écrit sans --i-know (DROP TABLE, REPLACE INTO GDP / identifiant)
+BATCH_ROWS = 2_000
+
+MOD_COLUMNS = (
+    "MOD10R", "MOD10S", "MOD14R", "MOD14S", "MOD14RDV", "MOD14SDV", "MOD15R", "MOD15S",
+    "MOD21C", "MOD21CDV", "MOD21R", "MOD21RDV", "MOD21RPT", "MOD21S", "MOD21SDV", "MOD21SPT",
+    "MOD24R", "MOD24S", "MOD28R", "MOD28S",
+)
+DATE_COLUMNS = ("DATE_PLANNING", "LIVRAISON_PREVUE", "DATE_LIVRAISON", "DATE_PRODUCTION", "DATE_STOCK")
+TEXT_COLUMNS = (
+    "N_CLIENT", "NOM_CLIENT", "STATUT", "MONTANT_HT", "N_DEVIS", "NOM_COMMERCIAL",
+    "RAL_BDC", "RAL_MODULE", "EPAPER", "QTE_EPAPER", "STATUT_EPAPER",
+    "TYPE_DE_CONNEXION", "BORNE_DE_COMMANDE", "TRANSPORT", "PAYS", "GEOGRAPHIE", "COORDONNEES",
+    "VOIE_INSTALLATION", "CP_INSTALLATION", "VILLE_INSTALLATION",
+    "VOIE_FACTURATION", "CP_FACTURATION", "VILLE_FACTURATION",
+    "CONTACT_CLIENT", "TELEPHONE_CLIENT", "EMAIL_CLIENT", "EMAIL_FACTURATION",
+    "MARKETING", "MARKETING_CREATION", "MARKETING_IMPRESSION", "MARKETING_BANDEAUX",
+    "BATIMENT_MODULAIRE", "BATIMENT_MODULAIRE_TAILLE", "BATIMENT_MODULAIRE_RAL",
+    "MODE_PAIEMENT", "ORG_FINANCEMENT",
+)
+ORDER_COLUMNS = TEXT_COLUMNS + DATE_COLUMNS + MOD_COLUMNS + ("REMARQUES",)
+
+STATUTS = (
+    ("EN ATTENTE", 20), ("EN ATTENTE DE PRODUCTION", 10), ("EN PRODUCTION", 10),
+    ("STOCK", 5), ("LIVREE", 45), ("Livrée", 5), ("ANNULEE", 5),
+)
+VILLES = ("Paris", "Lyon", "Marseille", "Lille", "Nantes", "Bordeaux", "Toulouse", "Strasbourg", "Bruxelles", "Genève")
+PAYS = ("France", "France", "France", "France", "Belgique", "Suisse")
+COMMERCIAUX = ("DUPONT", "MARTIN", "BERNARD", "PETIT", "ROBERT")
+CONNEXIONS = ("4G", "ETHERNET", "WIFI", "")
+TRANSPORTS = ("Transporteur", "Enlèvement", "Livraison LCF", "")
+
+
+def _date_text(rnd: random.Random, d: date) -> str:
+    """Même date, au format hétérogène rencontré en base."""
+    r = rnd.random()
+    if r < 0.70:
+        return d.strftime("%d/%m/%Y")
+    if r < 0.82:
+        return d.strftime("%d-%m-%Y")
+    if r < 0.90:
+        return d.strftime("%Y-%m-%d")
+    return ""
+
+
+def _amount_text(rnd: random.Random) -> str:
+    v = round(rnd.uniform(800, 60_000), 2)
+    r = rnd.random()
+    if r < 0.45:
+        return f"{v:,.2f} €".replace(",", " ").replace(".", ",")
+    if r < 0.75:
+        return f"{v}"
+    if r < 0.90:
+        return f"{v:.2f}".replace(".", ",")
+    return ""
+
+
+def _order_row(rnd: random.Random, n_clients: int, today: date) -> tuple:
+    client = rnd.randrange(1, n_clients + 1)
+    statut = rnd.choices([s for s, _ in STATUTS], weights=[w for _, w in STATUTS])[0]
+    planning = today - timedelta(days=rnd.randint(-60, 3 * 365))
+    ville = rnd.choice(VILLES)
+    cp = f"{rnd.randint(1000, 95999):05d}"
+    voie = f"{rnd.randint(1, 250)} rue {rnd.choice(('de la Gare', 'Victor Hugo', 'du Port', 'des Lilas'))}"
+    text = {
+        "N_CLIENT": f"C{client:06d}",
+        "NOM_CLIENT": f"CLIENT {client:06d}",
+        "STATUT": statut,
+        "MONTANT_HT": _amount_text(rnd),
+        "N_DEVIS": f"D{rnd.randint(10000, 99999)}",
+        "NOM_COMMERCIAL": rnd.choice(COMMERCIAUX),
+        "RAL_BDC": f"RAL {rnd.randint(1000, 9023)}",
+        "RAL_MODULE": f"RAL {rnd.randint(1000, 9023)}",
+        "EPAPER": rnd.choice(("OUI", "NON", "")),
+        "QTE_EPAPER": str(rnd.randint(0, 40)) if rnd.random() < 0.3 else "",
+        "STATUT_EPAPER": rnd.choice(("", "A COMMANDER", "COMMANDE", "RECU")),
+        "TYPE_DE_CONNEXION": rnd.choice(CONNEXIONS),
+        "BORNE_DE_COMMANDE": rnd.choice(("OUI", "NON", "")),
+        "TRANSPORT": rnd.choice(TRANSPORTS),
+        "PAYS": rnd.choice(PAYS),
+        "GEOGRAPHIE": rnd.choice(("Nord", "Sud", "Est", "Ouest", "IDF", "")),
+        "COORDONNEES": f"{rnd.uniform(42.3, 51.0):.6f}, {rnd.uniform(-4.7, 8.2):.6f}" if rnd.random() < 0.6 else "",
+        "VOIE_INSTALLATION": voie, "CP_INSTALLATION": cp, "VILLE_INSTALLATION": ville,
+        "VOIE_FACTURATION": voie, "CP_FACTURATION": cp, "VILLE_FACTURATION": ville,
+        "CONTACT_CLIENT": f"Contact {client}",
+        "TELEPHONE_CLIENT": f"0{rnd.randint(100000000, 799999999)}",
+        "EMAIL_CLIENT": f"client{client}@example.test",
+        "EMAIL_FACTURATION": f"compta{client}@example.test",
+        "MARKETING": rnd.choice(("OUI", "NON", "")),
+        "MARKETING_CREATION": rnd.choice(("", "A FAIRE", "FAIT")),
+        "MARKETING_IMPRESSION": rnd.choice(("", "A FAIRE", "FAIT")),
+        "MARKETING_BANDEAUX": rnd.choice(("", "OUI", "NON")),
+        "BATIMENT_MODULAIRE": rnd.choice(("NON", "NON", "NON", "OUI")),
+        "BATIMENT_MODULAIRE_TAILLE": rnd.choice(("", "", "6M", "12M")),
+        "BATIMENT_MODULAIRE_RAL": "",
+        "MODE_PAIEMENT": rnd.choice(("VIREMENT", "LEASING", "CHEQUE", "")),
+        "ORG_FINANCEMENT": rnd.choice(("", "", "LOCAM", "GRENKE")),
+    }
+    dates = {
+        "DATE_PLANNING": _date_text(rnd, planning),
+        "LIVRAISON_PREVUE": _date_text(rnd, planning + timedelta(days=rnd.randint(7, 45))),
+        "DATE_LIVRAISON": _date_text(rnd, planning + timedelta(days=rnd.randint(10, 60))) if statut.upper().startswith("LIVR") else "",
+        "DATE_PRODUCTION": _date_text(rnd, planning + timedelta(days=rnd.randint(0, 20))) if statut not in ("EN ATTENTE",) else "",
+        "DATE_STOCK": _date_text(rnd, planning + timedelta(days=rnd.randint(5, 30))) if rnd.random() < 0.4 else "",
+    }
+    # 1 à 3 types de modules par commande, le reste vide (comme en base)
+    mods = dict.fromkeys(MOD_COLUMNS, "")
+    for col in rnd.sample(MOD_COLUMNS, rnd.randint(1, 3)):
+        mods[col] = str(rnd.randint(1, 12))
+    remarques = "" if rnd.random() < 0.7 else "Remarque " + " ".join(rnd.choice(VILLES) for _ in range(rnd.randint(3, 30)))
+    values = {**text, **dates, **mods, "REMARQUES": remarques}
+    return tuple(values[c] for c in ORDER_COLUMNS)
+
+
+def _ddl() -> list[str]:
+    order_cols = ",\n  ".join(
+        f"`{c}` TEXT NULL" if c == "REMARQUES" else f"`{c}` VARCHAR(255) NULL" for c in ORDER_COLUMNS
+    )
+    return [
+        f"""CREATE TABLE IF NOT EXISTS tableau_production_2 (
+  N INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  {order_cols},
+  VERSION_LIGNE INT NOT NULL DEFAULT 0,
+  KEY idx_statut (STATUT),
+  KEY idx_nom_client (NOM_CLIENT)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE IF NOT EXISTS clients (
+  NOM_CLIENT VARCHAR(255) NOT NULL PRIMARY KEY,
+  NUMERO_DE_SERIE VARCHAR(64) NULL,
+  VERSION VARCHAR(32) NULL,
+  MDP VARCHAR(64) NULL,
+  TYPE_DE_CONNEXION VARCHAR(32) NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE IF NOT EXISTS donnees (
+  N INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  NOM_COLONNE VARCHAR(128) NOT NULL,
+  VALEUR VARCHAR(255) NULL,
+  MAIL VARCHAR(255) NULL,
+  EMAIL VARCHAR(255) NULL,
+  KEY idx_nom_colonne (NOM_COLONNE)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE IF NOT EXISTS GDP (
+  ID VARCHAR(64) NOT NULL PRIMARY KEY,
+  STATUT VARCHAR(32) NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        """CREATE TABLE IF NOT EXISTS identifiant (
+  ID VARCHAR(64) NOT NULL PRIMARY KEY,
+  NOM VARCHAR(128) NULL,
+  ROLE VARCHAR(64) NULL,
+  POSTE VARCHAR(128) NULL,
+  SERVICE VARCHAR(128) NULL,
+  MAIL VARCHAR(255) NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    ]
+
+
+def _target_db() -> str:
+    return os.getenv("MYSQL_DB", BENCH_DB)
+
+
+def _connect():
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        database=_target_db(),
+        user=os.getenv("MYSQL_USER", "bench"),
+        password=os.getenv("MYSQL_PWD", os.getenv("MYSQL_PASSWORD", "bench")),
+        autocommit=False,
+        use_pure=True,
+    )
+
+
+def _insert_batches(conn, sql: str, rows_iter, total: int, label: str) -> None:
+    cur = conn.cursor()
+    batch, done, t0 = [], 0, time.perf_counter()
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            cur.executemany(sql, batch)
+            conn.commit()
+            done += len(batch)
+            batch.clear()
+            print(f"\r[gen] {label}: {done}/{total}", end="", flush=True)
+    if batch:
+        cur.executemany(sql, batch)
+        conn.commit()
+        done += len(batch)
+    cur.close()
+    print(f"\r[gen] {label}: {done}/{total} en {time.perf_counter() - t0:.1f}s", flush=True)
+
+
+def generate(n_orders: int, seed: int = 42, drop: bool = False, i_know: bool = False) -> None:
+    db = _target_db()
+    if db != BENCH_DB and not i_know:
+        # DROP TABLE / REPLACE INTO GDP, identifiant : uniquement sur une base de banc identifiée
+        raise RuntimeError(f"base cible « {db} » ≠ « {BENCH_DB} » : refus (--i-know pour forcer)")
+    rnd = random.Random(seed)
+    today = date.today()
+    n_clients = max(50, n_orders // 5)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        if drop:
+            for t in ("tableau_production_2", "clients", "donnees", "GDP", "identifiant"):
+                cur.execute(f"DROP TABLE IF EXISTS `{t}`")
+        for stmt in _ddl():
+            cur.execute(stmt)
+        cur.execute("REPLACE INTO GDP (ID, STATUT) VALUES ('GDP_MAINTENANCE', '0')")
+        cur.execute(
+            "REPLACE INTO identifiant (ID, NOM, ROLE, POSTE, SERVICE, MAIL) VALUES "
+            "('BENCH-PC', 'Banc d''essai', 'ADMIN', 'bench', 'bench', 'bench@example.test')"
+        )
+        conn.commit()
+        cur.close()
+
+        _insert_batches(
+            conn,
+            "INSERT IGNORE INTO clients (NOM_CLIENT, NUMERO_DE_SERIE, VERSION, MDP, TYPE_DE_CONNEXION) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            ((f"CLIENT {i:06d}", f"SN{rnd.randint(10**7, 10**8 - 1)}", f"V{rnd.randint(1, 4)}.{rnd.randint(0, 9)}",
+              f"{rnd.randint(0, 999999):06d}", rnd.choice(CONNEXIONS)) for i in range(1, n_clients + 1)),
+            n_clients, "clients",
+        )
+
+        # listes déroulantes du formulaire : quelques valeurs par colonne
+        donnees = [(col, f"{col} {k}", "", "") for col in TEXT_COLUMNS[:20] for k in range(1, 9)]
+        donnees += [("NOM_COMMERCIAL", c, f"{c.lower()}@example.test", f"{c.lower()}@example.test") for c in COMMERCIAUX]
+        _insert_batches(
+            conn, "INSERT INTO donnees (NOM_COLONNE, VALEUR, MAIL, EMAIL) VALUES (%s, %s, %s, %s)",
+            iter(donnees), len(donnees), "donnees",
+        )
+
+        cols = ", ".join(f"`{c}`" for c in ORDER_COLUMNS)
+        marks = ", ".join(["%s"] * len(ORDER_COLUMNS))
+        _insert_batches(
+            conn, f"INSERT INTO tableau_production_2 ({cols}) VALUES ({marks})",
+            (_order_row(rnd, n_clients, today) for _ in range(n_orders)),
+            n_orders, "tableau_production_2",
+        )
+    finally:
+        conn.close()
+
+
+def _parse_size(v: str) -> int:
+    if v in SIZES:
+        return SIZES[v]
+    try:
+        return max(1, int(v))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"taille invalide: {v} ({'|'.join(SIZES)} ou entier)")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Génère le jeu de données du banc d'essai")
+    ap.add_argument("--size", type=_parse_size, default=SIZES["1k"], help="1k | 100k | 1M | entier (commandes)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--drop", action="store_true", help="supprime et recrée les tables")
+    ap.add_argument("--i-know", action="store_true",
+                    help=f"autorise une base cible autre que « {BENCH_DB} » (MYSQL_DB)")
+    args = ap.parse_args(argv)
+    try:
+        generate(args.size, seed=args.seed, drop=args.drop, i_know=args.i_know)
+    except RuntimeError as e:
+        print(f"[gen] {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur de charge : rejoue le trafic réel des postes clients
+- autoRefreshTick (5 s) selon la page active de chaque poste :
+    dashboard → POST /batch (/orders/stats + /orders/modules-evolution)
+    orders    → GET /orders?limit=500 (suspendu tant qu'un formulaire est ouvert, comme index.js)
+    clients   → GET /clients?limit=500
+  en-tête X-Request-Class: poll, comme apiGet pendant un rafraîchissement auto
+- checkStatus (15 s, main.js) : GET /health puis GET /gdp/maintenance
+- formulaires : ouverture GET /orders/<n>, temps de saisie, puis PUT /orders/<n> (If-Match)
+Rapport : nb, erreurs, p50/p95/p99/max (ms) et RPS par endpoint ; --json pour comparer deux runs.
+
+Usage :
+  python -m bench.loadgen --base http://127.0.0.1:5000 --users 20 --duration 120
+  python -m bench.loadgen --users 50 --speed 5 --json run.json   # intervalles ÷ 5
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from collections import defaultdict
+
+PAGES = (("dashboard", 0.4), ("orders", 0.4), ("clients", 0.2))
+AUTO_REFRESH_S = 5.0
+CHECK_STATUS_S = 15.0
+
+
+class Stats:
+    """Latences (ms) et codes HTTP par endpoint, partagés entre les postes simulés."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lat: dict[str, list[float]] = defaultdict(list)
+        self.codes: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, label: str, ms: float, status: int) -> None:
+        with self._lock:
+            self.lat[label].append(ms)
+            self.codes[label][status] += 1
+
+    def report(self, elapsed: float) -> list[dict]:
+        out = []
+        with self._lock:
+            for label in sorted(self.lat):
+                xs = sorted(self.lat[label])
+                codes = dict(self.codes[label])
+                errors = sum(c for s, c in codes.items() if s == 0 or s >= 400)
+                out.append({
+                    "endpoint": label,
+                    "count": len(xs),
+                    "errors": errors,
+                    "p50_ms": _pct(xs, 50), "p95_ms": _pct(xs, 95), "p99_ms": _pct(xs, 99),
+                    "max_ms": round(xs[-1], 1),
+                    "rps": round(len(xs) / elapsed, 2) if elapsed > 0 else 0.0,
+                    "codes": {str(k): v for k, v in sorted(codes.items())},
+                })
+        return out
+
+
+def _pct(sorted_xs: list[float], p: float) -> float:
+    """Percentile au rang le plus proche (liste déjà triée)."""
+    if not sorted_xs:
+        return 0.0
+    k = max(0, min(len(sorted_xs) - 1, int(round(p / 100.0 * len(sorted_xs) + 0.5)) - 1))
+    return round(sorted_xs[k], 1)
+
+
+class Client:
+    """Une connexion HTTP keep-alive par poste (comme le navigateur de l'app Electron)."""
+
+    def __init__(self, base: str, token: str, pc: str, stats: Stats, timeout: float):
+        u = urlsplit(base)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 80
+        self.token, self.pc, self.stats, self.timeout = token, pc, stats, timeout
+        self._conn: http.client.HTTPConnection | None = None
+
+    def request(self, method: str, path: str, label: str, body=None, headers=None):
+        h = {"X-App-Token": self.token, "X-Client-PC": self.pc, "Cache-Control": "no-store"}
+        if headers:
+            h.update(headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            h["Content-Type"] = "application/json"
+        t0 = time.perf_counter()
+        status, resp_headers, payload = 0, {}, None
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._conn.request(method, path, body=data, headers=h)
+            r = self._conn.getresponse()
+            raw = r.read()
+            status, resp_headers = r.status, {k.lower(): v for k, v in r.getheaders()}
+            if r.getheader("Connection", "").lower() == "close":
+                self.close()
+            try:
+                payload = json.loads(raw) if raw else None
+            except ValueError:
+                payload = None
+        except Exception:
+            self.close()
+        self.stats.add(label, (time.perf_counter() - t0) * 1000.0, status)
+        return status, resp_headers, payload
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class Station(threading.Thread):
+    """
+    Un poste : page active fixe, timers autoRefreshTick / checkStatus,
+    ouvertures de formulaire à intervalles exponentiels (moyenne --form-every).
+    """
+
+    def __init__(self, idx: int, args, token: str, stats: Stats, ns: list[int], stop_at: float):
+        super().__init__(daemon=True, name=f"station-{idx}")
+        self.rnd = random.Random(args.seed + idx)
+        self.page = self.rnd.choices([p for p, _ in PAGES], weights=[w for _, w in PAGES])[0]
+        self.client = Client(args.base, token, f"BENCH-PC-{idx:03d}", stats, args.timeout)
+        self.args, self.ns, self.stop_at = args, ns, stop_at
+        self.form_n: int | None = None
+        self.form_version: str | None = None
+
+    def _scaled(self, seconds: float) -> float:
+        return seconds / self.args.speed
+
+    def run(self) -> None:
+        now = time.monotonic()
+        # départs étalés : les postes ne démarrent pas tous à la même milliseconde
+        events = [
+            (now + self.rnd.uniform(0, self._scaled(AUTO_REFRESH_S)), 0, "tick"),
+            (now + self.rnd.uniform(0, self._scaled(CHECK_STATUS_S)), 1, "status"),
+        ]
+        if self.ns and self.args.form_every > 0:
+            events.append((now + self.rnd.expovariate(1.0 / self._scaled(self.args.form_every)), 2, "open"))
+        heapq.heapify(events)
+        seq = 3
+        while events:
+            due, _, kind = heapq.heappop(events)
+            if due >= self.stop_at:
+                continue
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            nxt = getattr(self, f"_on_{kind}")()
+            if nxt is not None:
+                heapq.heappush(events, (max(time.monotonic(), due + nxt[0]), seq, nxt[1]))
+                seq += 1
+        self.client.close()
+
+    def _on_tick(self):
+        poll = {"X-Request-Class": "poll"}
+        if self.page == "dashboard":
+            self.client.request(
+                "POST", "/batch", "POST /batch (dashboard)",
+                body={"requests": [{"path": "/orders/stats"}, {"path": "/orders/modules-evolution"}]},
+                headers=poll,
+            )
+        elif self.page == "orders":
+            if self.form_n is None:
+                self.client.request("GET", "/orders?limit=500&offset=0", "GET /orders", headers=poll)
+        else:
+            self.client.request("GET", "/clients?limit=500&offset=0", "GET /clients", headers=poll)
+        return self._scaled(AUTO_REFRESH_S), "tick"
+
+    def _on_status(self):
+        self.client.request("GET", "/health", "GET /health")
+        self.client.request("GET", "/gdp/maintenance", "GET /gdp/maintenance")
+        return self._scaled(CHECK_STATUS_S), "status"
+
+    def _on_open(self):
+        n = self.rnd.choice(self.ns)
+        status, headers, payload = self.client.request("GET", f"/orders/{n}", "GET /orders/<n>")
+        if status == 200 and payload:
+            self.form_n = n
+            self.form_version = payload.get("version") or headers.get("etag", "").strip('"') or None
+            return self._scaled(self.rnd.uniform(*self.args.think)), "save"
+        return self.rnd.expovariate(1.0 / self._scaled(self.args.form_every)), "open"
+
+    def _on_save(self):
+        n, self.form_n = self.form_n, None
+        if n is not None and self.rnd.random() < self.args.save_ratio:
+            headers = {"If-Match": f'"{self.form_version}"'} if self.form_version else None
+            body = {"REMARQUES": f"bench {self.name} {time.time():.3f}"}
+            self.client.request("PUT", f"/orders/{n}", "PUT /orders/<n>", body=body, headers=headers)
+        return self.rnd.expovariate(1.0 / self._scaled(self.args.form_every)), "open"
+
+
+def _bootstrap(args) -> tuple[str, list[int]]:
+    """Token de l'app + échantillon de N existants pour les ouvertures de formulaire."""
+    stats = Stats()
+    c = Client(args.base, "", "BENCH-BOOT", stats, args.timeout)
+    status, _, payload = c.request("GET", "/token", "boot")
+    if status != 200 or not payload or not payload.get("token"):
+        raise SystemExit(f"[loadgen] /token inaccessible sur {args.base} (HTTP {status})")
+    c.token = payload["token"]
+    status, _, payload = c.request("GET", "/orders?limit=500&offset=0", "boot")
+    c.close()
+    ns = [int(r["N"]) for r in (payload or {}).get("rows", []) if r.get("N") is not None]
+    if not ns:
+        print("[loadgen] aucune commande trouvée : pas d'ouverture de formulaire", file=sys.stderr)
+    return c.token, ns
+
+
+def _print_report(rows: list[dict], elapsed: float, baseline: dict | None = None) -> None:
+    base = {r["endpoint"]: r for r in (baseline or {}).get("endpoints", [])}
+    head = f"{'endpoint':<28}{'n':>8}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'rps':>8}"
+    if base:
+        head += f"{'Δp95':>9}{'Δrps':>8}"
+    print(f"\n[loadgen] {elapsed:.1f}s")
+    print(head)
+    print("-" * len(head))
+    for r in rows:
+        line = (f"{r['endpoint']:<28}{r['count']:>8}{r['errors']:>6}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+                f"{r['p99_ms']:>9}{r['max_ms']:>9}{r['rps']:>8}")
+        b = base.get(r["endpoint"])
+        if b:
+            line += f"{r['p95_ms'] - b['p95_ms']:>+9.1f}{r['rps'] - b['rps']:>+8.2f}"
+        print(line)
+    total = sum(r["count"] for r in rows)
+    print(f"{'TOTAL':<28}{total:>8}{sum(r['errors'] for r in rows):>6}"
+          f"{'':>36}{(total / elapsed if elapsed else 0):>8.2f}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Rejoue le trafic des postes clients contre le backend")
+    ap.add_argument("--base", default="http://127.0.0.1:5000")
+    ap.add_argument("--users", type=int, default=10, help="postes simulés")
+    ap.add_argument("--duration", type=float, default=60.0, help="secondes")
+    ap.add_argument("--speed", type=float, default=1.0, help="accélère tous les intervalles (÷)")
+    ap.add_argument("--form-every", type=float, default=60.0, help="secondes moyennes entre deux ouvertures (0 = jamais)")
+    ap.add_argument("--think", type=float, nargs=2, default=(5.0, 30.0), metavar=("MIN", "MAX"),
+                    help="temps de saisie avant enregistrement (s)")
+    ap.add_argument("--save-ratio", type=float, default=0.5, help="part des formulaires enregistrés")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", metavar="FICHIER", help="écrit le rapport en JSON")
+    ap.add_argument("--baseline", metavar="FICHIER", help="rapport JSON d'un run précédent : affiche les écarts")
+    args = ap.parse_args(argv)
+    args.speed = max(args.speed, 0.01)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    token, ns = _bootstrap(args)
+    stats = Stats()
+    t0 = time.monotonic()
+    stop_at = t0 + args.duration
+    stations = [Station(i, args, token, stats, ns, stop_at) for i in range(args.users)]
+    for s in stations:
+        s.start()
+    for s in stations:
+        s.join()
+    elapsed = time.monotonic() - t0
+
+    rows = stats.report(elapsed)
+    _print_report(rows, elapsed, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "base": args.base, "users": args.users, "duration_s": round(elapsed, 2),
+                "speed": args.speed, "endpoints": rows,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Démarrage à froid du backend : spawn → imports → HTTP en écoute → tunnel → première requête
+- cible source (python main.py) ou frozen (build PyInstaller BackendGDP)
+- jalons lus sur stdout ([BOOT] imports / tunnel_up / first_query, émis par main.py)
+  et sondés de l'extérieur (connexion TCP acceptée, premier /health ok=true — ce qu'attend waitForApi)
+- --importtime : coût par module façon "-X importtime" (build frozen : BACKEND_PROFILE_IMPORTS=1)
+- --deferred : DEFERRED_IMPORTS=1 (chemin à froid réduit à ce que /health exige)
+
+Usage (depuis backend/) :
+  python -m bench.startup --runs 5
+  python -m bench.startup --runs 5 --deferred --importtime
+  python -m bench.startup --target frozen --exe dist/BackendGDP.exe --runs 5
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import statistics
+import subprocess
+import threading
+import http.client
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MILESTONES = ("imports", "http_bound", "tunnel_up", "first_query", "health_ok")
+_BOOT_RE = re.compile(r"^\[BOOT\] (\w+) \+")
+_IMPORT_RE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def _command(args) -> list[str]:
+    if args.target == "frozen":
+        exe = Path(args.exe or (BACKEND_DIR / "dist" / ("BackendGDP.exe" if os.name == "nt" else "BackendGDP")))
+        if not exe.exists():
+            raise SystemExit(f"[startup] build introuvable : {exe}")
+        cmd = [str(exe)]
+    else:
+        cmd = [sys.executable] + (["-X", "importtime"] if args.importtime else []) + [str(BACKEND_DIR / "main.py")]
+    return cmd + ["--server", args.server, "--port", str(args.port)]
+
+
+def _tcp_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+            return True
+    except OSError:
+        return False
+
+
+def _health_ok(port: int) -> bool:
+    try:
+        c = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        c.request("GET", "/health")
+        r = c.getresponse()
+        body = json.loads(r.read() or b"{}")
+        c.close()
+        return r.status == 200 and bool(body.get("ok"))
+    except Exception:
+        return False
+
+
+def _stop(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            proc.terminate()
+        else:
+            proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=10)
+    except Exception:
+        proc.kill()
+        proc.wait()
+
+
+def run_once(args) -> tuple[dict[str, float], list[str]]:
+    """Un démarrage : jalons en ms depuis le spawn (horloge du banc), + lignes stderr (importtime)."""
+    env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONUTF8="1")
+    env["DEFERRED_IMPORTS"] = "1" if args.deferred else "0"
+    marks: dict[str, float] = {}
+    stderr_lines: list[str] = []
+    lock = threading.Lock()
+
+    def mark(name: str) -> None:
+        with lock:
+            marks.setdefault(name, round((time.perf_counter() - t0) * 1000.0, 1))
+
+    def read_stdout(stream):
+        for line in iter(stream.readline, ""):
+            m = _BOOT_RE.match(line)
+            if m:
+                mark(m.group(1))
+            if args.verbose:
+                sys.stdout.write(f"  | {line}")
+
+    def read_stderr(stream):
+        for line in iter(stream.readline, ""):
+            stderr_lines.append(line.rstrip("\n"))
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        _command(args), cwd=str(BACKEND_DIR), env=env, text=True, encoding="utf-8", errors="replace",
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    readers = [threading.Thread(target=read_stdout, args=(proc.stdout,), daemon=True),
+               threading.Thread(target=read_stderr, args=(proc.stderr,), daemon=True)]
+    for t in readers:
+        t.start()
+
+    deadline = t0 + args.timeout
+    try:
+        # même sonde que waitForApi (main.js) : TCP puis /health jusqu'à ok=true
+        while time.perf_counter() < deadline and proc.poll() is None:
+            if "http_bound" not in marks and _tcp_open(args.port):
+                mark("http_bound")
+            if "http_bound" in marks and _health_ok(args.port):
+                mark("health_ok")
+                break
+            time.sleep(0.01)
+    finally:
+        _stop(proc)
+        for t in readers:
+            t.join(timeout=2)
+    if proc.returncode not in (0, None) and "health_ok" not in marks:
+        sys.stderr.write("\n".join(l for l in stderr_lines[-20:] if not l.startswith("import time:")) + "\n")
+    return marks, stderr_lines
+
+
+def parse_importtime(lines: list[str]) -> list[dict]:
+    """Lignes "import time: self | cumulative | name" → [{module, self_ms, cumulative_ms, depth}]."""
+    out = []
+    for line in lines:
+        m = _IMPORT_RE.match(line)
+        if m:
+            out.append({
+                "module": m.group(4),
+                "self_ms": int(m.group(1)) / 1000.0,
+                "cumulative_ms": int(m.group(2)) / 1000.0,
+                "depth": len(m.group(3)) // 2,
+            })
+    return out
+
+
+def _summary(runs: list[dict[str, float]]) -> dict[str, dict]:
+    out = {}
+    for name in MILESTONES:
+        xs = [r[name] for r in runs if name in r]
+        if xs:
+            out[name] = {"n": len(xs), "median_ms": round(statistics.median(xs), 1),
+                         "min_ms": min(xs), "max_ms": max(xs)}
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Mesure du démarrage à froid du backend")
+    ap.add_argument("--target", choices=("source", "frozen"), default="source")
+    ap.add_argument("--exe", help="chemin du build PyInstaller (défaut : backend/dist/BackendGDP[.exe])")
+    ap.add_argument("--server", choices=("waitress", "asgi", "dev"), default="waitress")
+    ap.add_argument("--port", type=int, default=5077)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--timeout", type=float, default=30.0, help="s par démarrage")
+    ap.add_argument("--deferred", action="store_true", help="DEFERRED_IMPORTS=1")
+    ap.add_argument("--importtime", action="store_true", help="coût d'import par module (dernier run)")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--json", metavar="FICHIER")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    runs, last_stderr = [], []
+    for i in range(args.runs):
+        marks, last_stderr = run_once(args)
+        runs.append(marks)
+        print(f"[startup] run {i + 1}/{args.runs} : " +
+              "  ".join(f"{k}={marks[k]}ms" for k in MILESTONES if k in marks), flush=True)
+
+    summary = _summary(runs)
+    print(f"\n[startup] {args.target} / {args.server} / deferred={'oui' if args.deferred else 'non'}")
+    print(f"{'jalon':<14}{'médiane':>10}{'min':>10}{'max':>10}")
+    for name, s in summary.items():
+        print(f"{name:<14}{s['median_ms']:>10}{s['min_ms']:>10}{s['max_ms']:>10}")
+    missing = [m for m in MILESTONES if m not in summary]
+    if missing:
+        print(f"(jamais atteints : {', '.join(missing)})")
+
+    imports = parse_importtime(last_stderr) if args.importtime else []
+    if args.importtime:
+        if not imports:
+            print("\n(aucune ligne importtime : build frozen sans BACKEND_PROFILE_IMPORTS=1 ?)")
+        else:
+            top = sorted((r for r in imports if r["depth"] == 0), key=lambda r: -r["cumulative_ms"])[: args.top]
+            print(f"\n{'module (niveau 0)':<40}{'cumul ms':>10}{'propre ms':>11}")
+            for r in top:
+                print(f"{r['module']:<40}{r['cumulative_ms']:>10.1f}{r['self_ms']:>11.1f}")
+            print(f"{'TOTAL':<40}{sum(r['cumulative_ms'] for r in imports if r['depth'] == 0):>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"target": args.target, "server": args.server, "deferred": args.deferred,
+                       "runs": runs, "summary": summary, "imports": imports}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 """
 Backend Flask — entête SSH-only
-- Connexion MySQL exclusivement via le serveur SSH fourni
-- AUCUN mode direct/auto, AUCUN db.conf/UNC
+- Connexion MySQL via le serveur SSH fourni (DB_MODE=ssh, défaut)
+- DB_MODE=direct : MySQL local sans tunnel, réservé aux bancs d'essai (backend/bench)
+- AUCUN mode auto, AUCUN db.conf/UNC
 - Pool mysql-connector + watchdog du tunnel
 - Compat SQLAlchemy minimale (text/engine)
 """
@@ -21,10 +22,29 @@ import json
 import threading
 from pathlib import Path
 from datetime import datetime as _dt, date, datetime, timedelta
+from decimal import InvalidOperation
 import traceback as _tb
 from typing import TYPE_CHECKING, Optional, Any
 import secrets
 
+# -----------------------------------------------------------
+# Démarrage : jalons + imports différés
+# -----------------------------------------------------------
+_BOOT_T0 = time.perf_counter()
+_BOOT_MARKS: dict[str, float] = {}
+
+# DEFERRED_IMPORTS=1 : seul ce que /health exige est chargé à froid (Flask, mysql-connector) ;
+# sshtunnel/paramiko partent avec le thread du tunnel, SQLAlchemy n'est jamais chargé
+# (text() reste une chaîne), win32com au premier mail.
+DEFERRED_IMPORTS = (os.getenv("DEFERRED_IMPORTS") or "0").strip().lower() in ("1", "true", "yes", "on")
+
+def _boot_mark(name: str) -> None:
+    """Jalon de démarrage (ms depuis le début du module), une seule fois, sur stdout pour bench/startup.py."""
+    if name in _BOOT_MARKS:
+        return
+    _BOOT_MARKS[name] = round((time.perf_counter() - _BOOT_T0) * 1000.0, 1)
+    print(f"[BOOT] {name} +{_BOOT_MARKS[name]}ms", flush=True)
+
 
 # -----------------------------------------------------------
 # TOKEN
@@ -62,7 +82,7 @@ def _log(msg: str, exc: Exception | None = None) -> None:
 # -----------------------------------------------------------
 # Flask
 # -----------------------------------------------------------
-from flask import Flask, jsonify, request, g
+from flask import Flask, jsonify, request, g, has_app_context, has_request_context
 from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
@@ -100,9 +120,11 @@ def _wait_port(host: str, port: int, timeout_s: float = 10.0) -> bool:
 try:
     import mysql.connector
     from mysql.connector import pooling
+    from mysql.connector.constants import ClientFlag
 except Exception as e:  # pragma: no cover
     mysql = None  # type: ignore
     pooling = None  # type: ignore
+    ClientFlag = None  # type: ignore
     _log("MYSQL_IMPORT_FAIL", e)
 
 if TYPE_CHECKING:
@@ -128,6 +150,11 @@ MYSQL_USER = os.getenv("MYSQL_USER","appuser1")
 MYSQL_PWD  = os.getenv("MYSQL_PWD", os.getenv("MYSQL_PASSWORD", "6o@f8!ln507!EnTK"))
 # plugin d'auth : ok d'avoir une valeur par défaut non sensible
 MYSQL_AUTH_PLUGIN = (os.getenv("MYSQL_AUTH_PLUGIN") or "mysql_native_password").strip()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))   # max 32 (mysql-connector)
+# ssh (production) | direct (banc d'essai : MYSQL_HOST:MYSQL_PORT joint sans tunnel)
+DB_MODE = (os.getenv("DB_MODE") or "ssh").strip().lower()
+if DB_MODE not in ("ssh", "direct"):
+    raise RuntimeError(f"DB_MODE invalide: {DB_MODE} (ssh|direct)")
 
 # Validation stricte (SSH-only)
 _missing = [k for k,v in {
@@ -139,10 +166,12 @@ if _missing:
     raise RuntimeError(f"Variables manquantes: {', '.join(_missing)}")
 
 # sshtunnel import (à la demande)
-try:
-    from sshtunnel import SSHTunnelForwarder  # type: ignore
-except Exception:  # pragma: no cover
-    SSHTunnelForwarder = None  # type: ignore
+SSHTunnelForwarder = None  # type: ignore
+if not DEFERRED_IMPORTS:
+    try:
+        from sshtunnel import SSHTunnelForwarder  # type: ignore
+    except Exception:  # pragma: no cover
+        SSHTunnelForwarder = None  # type: ignore
 
 def _require_sshtunnel() -> None:
     global SSHTunnelForwarder
@@ -165,13 +194,26 @@ _tunnel_lock = threading.Lock()
 _watchdog_started = False
 
 # Support éventuel de clé privée via paramiko (facultatif)
-try:
-    import paramiko  # type: ignore
-except Exception:
-    paramiko = None  # type: ignore
+paramiko = None  # type: ignore
+if not DEFERRED_IMPORTS:
+    try:
+        import paramiko  # type: ignore
+    except Exception:
+        paramiko = None  # type: ignore
+
+def _require_paramiko():
+    """paramiko, importé au premier besoin en mode DEFERRED_IMPORTS (None si absent)."""
+    global paramiko
+    if paramiko is None:
+        try:
+            import paramiko as _pmk  # type: ignore
+            paramiko = _pmk
+        except Exception:
+            return None
+    return paramiko
 
 def _load_pkey(path: str, passphrase: str | None):
-    if not path or not os.path.exists(path) or paramiko is None:
+    if not path or not os.path.exists(path) or _require_paramiko() is None:
         return None
     for KeyCls in (paramiko.RSAKey, getattr(paramiko, "Ed25519Key", None), getattr(paramiko, "ECDSAKey", None)):
         if not KeyCls:
@@ -182,9 +224,27 @@ def _load_pkey(path: str, passphrase: str | None):
             continue
     return None
 
+class _DirectLink:
+    """DB_MODE=direct : se présente comme un tunnel actif pointant droit sur MySQL."""
+    is_active = True
+
+    def __init__(self, host: str, port: int):
+        self.local_bind_host = host
+        self.local_bind_port = port
+
+    def stop(self) -> None:
+        pass
+
 def start_tunnel() -> Optional[_SSHTunnelForwarder]:
-    """(Re)démarre le tunnel SSH → MySQL. Mode SSH *uniquement*."""
+    """(Re)démarre le tunnel SSH → MySQL (en DB_MODE=direct : lien direct, sans SSH)."""
     global _tunnel, _last_tunnel_err
+    if DB_MODE == "direct":
+        with _tunnel_lock:
+            if _tunnel is None:
+                _tunnel = _DirectLink(MYSQL_HOST, MYSQL_PORT)
+                _log(f"DB_MODE=direct : MySQL {MYSQL_HOST}:{MYSQL_PORT} sans tunnel SSH")
+                _boot_mark("tunnel_up")
+            return _tunnel
     _require_sshtunnel()
 
     with _tunnel_lock:
@@ -221,6 +281,7 @@ def start_tunnel() -> Optional[_SSHTunnelForwarder]:
             _tunnel = t
             _last_tunnel_err = None
             _log(f"SSH tunnel OK sur localhost:{t.local_bind_port}")
+            _boot_mark("tunnel_up")
             return _tunnel
 
         except Exception as e:
@@ -245,8 +306,76 @@ def _set_session_locale(raw_conn) -> None:
         except Exception:
             pass
 
+# -----------------------------------------------------------
+# Disjoncteur (circuit breaker) devant le pool / tunnel
+# -----------------------------------------------------------
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "2"))
+
+class CircuitOpenError(RuntimeError):
+    """Base considérée indisponible : échec immédiat, sans attendre les timeouts."""
+
+class _CircuitBreaker:
+    """
+    - closed    : normal ; BREAKER_FAILURE_THRESHOLD échecs de connexion consécutifs → open
+    - open      : tout checkout échoue aussitôt (CircuitOpenError)
+    - half_open : posé par le watchdog quand le tunnel répond de nouveau ;
+                  UNE requête d'essai passe → succès : closed / échec : open
+    """
+    def __init__(self, threshold: int):
+        self.threshold = max(1, threshold)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == "closed"
+
+    def before_checkout(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpenError("DB_CIRCUIT_OPEN: base indisponible (tunnel SSH / MySQL)")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                _log("CIRCUIT closed (base de nouveau joignable)")
+            self.state, self.failures, self._trial, self.opened_at = "closed", 0, False, None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    _log(f"CIRCUIT open après {self.failures} échec(s)")
+                self.state, self._trial, self.opened_at = "open", False, time.time()
+
+    def half_open(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                self.state, self._trial = "half_open", False
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "open_for_s": round(time.time() - self.opened_at, 1) if self.opened_at else None,
+        }
+
+_BREAKER = _CircuitBreaker(BREAKER_FAILURE_THRESHOLD)
+
+def _link_host(t) -> str:
+    """Hôte local du tunnel (ou hôte MySQL en DB_MODE=direct)."""
+    return getattr(t, "local_bind_host", None) if DB_MODE == "direct" else "127.0.0.1"
+
 def _tunnel_watchdog() -> None:
-    """Vérifie/relance le tunnel toutes les 15s."""
+    """Vérifie/relance le tunnel toutes les 15s (5s quand le disjoncteur est ouvert)."""
     global _watchdog_started
     if _watchdog_started:
         return
@@ -257,21 +386,24 @@ def _tunnel_watchdog() -> None:
             try:
                 if not (_tunnel and getattr(_tunnel, "is_active", False)):
                     start_tunnel()
+                # tunnel de nouveau joignable → une requête d'essai pourra passer
+                if (not _BREAKER.is_closed and _tunnel and getattr(_tunnel, "is_active", False)
+                        and _check_tcp(_link_host(_tunnel), _tunnel.local_bind_port, 1.0)):
+                    _BREAKER.half_open()
             except Exception as e:
                 _log("watchdog error", e)
-            time.sleep(15)
+            time.sleep(15 if _BREAKER.is_closed else 5)
 
     threading.Thread(target=_loop, daemon=True, name="ssh-watchdog").start()
 
 _tunnel_watchdog()
 
-def _make_pool_ssh() -> _pooling.MySQLConnectionPool:
-    _require_mysql()
-    t = start_tunnel()
+def _mysql_cfg(t) -> dict:
+    """Paramètres de connexion MySQL à travers le tunnel t."""
     if not t:
         raise RuntimeError(f"SSH_TUNNEL_DOWN: {_last_tunnel_err}")
-    cfg = dict(
-        host="127.0.0.1",
+    return dict(
+        host=_link_host(t),
         port=t.local_bind_port,
         database=MYSQL_DB,
         user=MYSQL_USER,
@@ -279,9 +411,15 @@ def _make_pool_ssh() -> _pooling.MySQLConnectionPool:
         autocommit=False,
         connection_timeout=6,
         use_pure=True,
+        # rowcount d'un UPDATE = lignes *trouvées* (et non modifiées) → 404 fiable sans pré-lecture
+        client_flags=[ClientFlag.FOUND_ROWS],
     )
+
+def _make_pool_ssh() -> _pooling.MySQLConnectionPool:
+    _require_mysql()
+    cfg = _mysql_cfg(start_tunnel())
     return pooling.MySQLConnectionPool(
-        pool_name="lcf_pool", pool_size=8, pool_reset_session=True, **cfg
+        pool_name="lcf_pool", pool_size=DB_POOL_SIZE, pool_reset_session=True, **cfg
     )
 
 def get_pool():
@@ -310,9 +448,29 @@ def get_pool():
         except Exception:
             POOL = None
     POOL = _make_pool_ssh()
-    print(f"BACKEND: OUI | MODE=ssh-only | LOCAL=127.0.0.1:{getattr(_tunnel,'local_bind_port',None)}")
-    _log("BACKEND READY (ssh-only)")
+    print(f"BACKEND: OUI | MODE={DB_MODE} | LOCAL={_link_host(_tunnel)}:{getattr(_tunnel,'local_bind_port',None)}")
+    _log(f"BACKEND READY ({DB_MODE})")
     return POOL
+
+def _checkout_raw(attempts: int = 2, delay: int = 0):
+    """Connexion du pool prête à l'emploi (ping + locale), derrière le disjoncteur."""
+    _BREAKER.before_checkout()
+    raw = None
+    try:
+        raw = get_pool().get_connection()
+        raw.ping(reconnect=True, attempts=attempts, delay=delay)
+        _set_session_locale(raw)  # impose FR
+    except Exception as e:
+        if raw is not None:
+            try: raw.close()
+            except Exception: pass
+        # pool saturé ≠ base injoignable
+        if not (mysql and isinstance(e, mysql.connector.errors.PoolError)):
+            _BREAKER.record_failure()
+        raise
+    _BREAKER.record_success()
+    _boot_mark("first_query")   # ping + SET lc_time_names : premier aller-retour MySQL réussi
+    return raw
     
 # -----------------------------------------------------------
 # Compat curseur/connexion (qmark, text, engine) + Flask g
@@ -349,8 +507,9 @@ class _CompatExecResult:
         return _Maps(rows, cols)
 
 class QMarkCursor:
-    def __init__(self, cur):
+    def __init__(self, cur, raw=None):
         self._cur = cur
+        self._raw = raw
     def execute(self, sql, params=None):
         if isinstance(sql, str):
             q = sql
@@ -361,10 +520,10 @@ class QMarkCursor:
             q = re.sub(r":([A-Za-z_]\w*)", r"%(\1)s", q)
         elif params:  # sequence → '?' devient '%s'
             q = q.replace("?", "%s")
-        self._cur.execute(q, params)
+        _execute_bounded(self._raw, self._cur, q, params)
         return _CompatExecResult(self._cur)
     def executemany(self, sql, seq):
-        return self._cur.executemany(sql.replace("?", "%s"), seq)
+        return _execute_bounded(self._raw, self._cur, sql.replace("?", "%s"), seq, many=True)
     def fetchall(self):
         return self._cur.fetchall()
     def fetchone(self):
@@ -374,31 +533,441 @@ class QMarkCursor:
         return self._cur.description
 
 class ConnWrapper:
-    def __init__(self, raw):
+    def __init__(self, raw, shared: bool = False):
         self._raw = raw
+        self._shared = shared
     def cursor(self, *a, **kw):
-        return QMarkCursor(self._raw.cursor(*a, **kw))
+        if self._shared:
+            kw.setdefault("buffered", True)
+        return QMarkCursor(self._raw.cursor(*a, **kw), self._raw)
     def commit(self):
         return self._raw.commit()
     def close(self):
+        # connexion partagée : rendue au pool par teardown_appcontext
+        if self._shared:
+            return None
         return self._raw.close()
 
+# -----------------------------------------------------------
+# Contrôle d'admission : créneaux de connexion par classe, écritures prioritaires
+# -----------------------------------------------------------
+ADMISSION_SLOTS = max(1, DB_POOL_SIZE - 1)   # 1 connexion laissée aux tâches de fond (miroir, audit, schéma)
+ADMISSION_RETRY_AFTER_S = 2
+# classe → (priorité, 0 = servie d'abord ; créneaux max simultanés ; attente max en s)
+ADMISSION_CLASSES = {
+    "write":  (0, ADMISSION_SLOTS, 15.0),
+    "health": (1, 1, 1.0),
+    "read":   (2, max(1, ADMISSION_SLOTS - 2), 5.0),
+    "poll":   (3, max(1, ADMISSION_SLOTS // 2), 0.5),
+}
+# POST en lecture seule ; chemins interrogés en boucle par les clients
+ADMISSION_READ_POSTS = {"/batch", "/orders/bulk"}
+ADMISSION_POLL_PATHS = {"/orders/stats", "/orders/modules-evolution", "/analytics", "/gdp/maintenance"}
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, cls: str, retry_after: int):
+        super().__init__(f"Serveur occupé ({cls}) : réessayer dans {retry_after} s")
+        self.cls = cls
+        self.retry_after = retry_after
+
+class _AdmissionGate:
+    """
+    Créneaux de connexion MySQL (≤ pool) répartis par classe de requête :
+      - plafond simultané et attente max par classe
+      - un créneau libéré va d'abord à la classe la plus prioritaire en attente (écritures)
+      - attente dépassée → AdmissionRejected (429 + Retry-After) au lieu d'une file sans fin
+    """
+    def __init__(self, slots: int, classes: dict):
+        self.slots = slots
+        self.classes = classes
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._active = {c: 0 for c in classes}
+        self._waiting = {c: 0 for c in classes}
+        self.admitted = {c: 0 for c in classes}
+        self.shed = {c: 0 for c in classes}
+
+    def _can_enter(self, cls: str) -> bool:
+        prio, limit, _ = self.classes[cls]
+        if self._in_use >= self.slots or self._active[cls] >= limit:
+            return False
+        # une classe plus prioritaire attend (et pourrait entrer) → elle passe d'abord
+        return not any(
+            self._waiting[c] and self._active[c] < c_limit
+            for c, (c_prio, c_limit, _) in self.classes.items() if c_prio < prio
+        )
+
+    def acquire(self, cls: str) -> str:
+        deadline = time.monotonic() + self.classes[cls][2]
+        with self._cond:
+            self._waiting[cls] += 1
+            try:
+                while not self._can_enter(cls):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed[cls] += 1
+                        raise AdmissionRejected(cls, ADMISSION_RETRY_AFTER_S)
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[cls] -= 1
+                self._cond.notify_all()
+            self._in_use += 1
+            self._active[cls] += 1
+            self.admitted[cls] += 1
+        return cls
+
+    def release(self, cls: str) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._active[cls] -= 1
+            self._cond.notify_all()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {"slots": self.slots, "in_use": self._in_use, "active": dict(self._active),
+                    "waiting": dict(self._waiting), "admitted": dict(self.admitted), "shed": dict(self.shed)}
+
+_ADMISSION = _AdmissionGate(ADMISSION_SLOTS, ADMISSION_CLASSES)
+
+def _request_class() -> str:
+    """Classe d'admission de la requête courante (X-Request-Class: poll envoyé par l'auto-refresh)."""
+    if request.path == "/health":
+        return "health"
+    if request.method not in ("GET", "HEAD") and request.path not in ADMISSION_READ_POSTS:
+        return "write"
+    if request.path in ADMISSION_POLL_PATHS or request.headers.get("X-Request-Class", "").lower() == "poll":
+        return "poll"
+    return "read"
+
+# -----------------------------------------------------------
+# Budgets de temps par route : hint serveur + KILL QUERY depuis une connexion annexe
+# -----------------------------------------------------------
+import heapq
+import itertools
+
+QUERY_BUDGET_READ_MS = int(os.getenv("QUERY_BUDGET_READ_MS", "10000"))
+QUERY_BUDGET_WRITE_MS = int(os.getenv("QUERY_BUDGET_WRITE_MS", "20000"))
+# endpoint Flask → budget par requête SQL (ms) ; sinon lecture/écriture ci-dessus
+QUERY_BUDGETS_MS = {
+    "health": 2000,
+    "get_identifiant": 3000,
+    "check_client_exists": 3000,
+    "get_orders": 5000,
+    "get_clients": 5000,
+    "get_orders_stats": 8000,
+    "get_orders_modules_evolution": 8000,
+    "get_analytics": 8000,
+    "get_order_history": 3000,
+    "get_audit": 5000,
+}
+QUERY_KILL_GRACE_S = 1.0   # le hint serveur coupe d'abord les SELECT ; KILL QUERY rattrape le reste
+
+# ER_QUERY_TIMEOUT (MySQL), ER_STATEMENT_TIMEOUT (MariaDB), ER_QUERY_INTERRUPTED (KILL QUERY)
+_TIMEOUT_ERRNOS = {3024, 1969, 1317}
+_ER_NO_SUCH_TABLE = 1146
+
+class QueryTimeout(RuntimeError):
+    def __init__(self, budget_ms: int):
+        super().__init__(f"Requête trop longue (budget {budget_ms} ms dépassé)")
+        self.budget_ms = budget_ms
+
+def _query_budget_ms() -> Optional[int]:
+    """Budget de la route courante ; None hors requête (tâches de fond : pas de limite)."""
+    if not has_request_context():
+        return None
+    ms = QUERY_BUDGETS_MS.get(request.endpoint)
+    if ms is None:
+        is_read = request.method in ("GET", "HEAD") or request.path in ADMISSION_READ_POSTS
+        ms = QUERY_BUDGET_READ_MS if is_read else QUERY_BUDGET_WRITE_MS
+    return ms
+
+def _with_time_hint(raw, q: str, budget_ms: int, server: Optional[str] = None) -> str:
+    """Limite côté serveur pour les SELECT : hint MySQL, ou SET STATEMENT pour MariaDB."""
+    if not re.match(r"\s*SELECT\b", q, re.I):
+        return q
+    if server is None:
+        server = str(getattr(raw, "get_server_info", lambda: "")() or "")
+    if "mariadb" in server.lower():
+        return f"SET STATEMENT max_statement_time={budget_ms / 1000:g} FOR {q}"
+    return re.sub(r"^\s*SELECT\b", f"SELECT /*+ MAX_EXECUTION_TIME({budget_ms}) */", q, count=1, flags=re.I)
+
+class _QueryWatchdog:
+    """
+    Un seul thread pour toutes les requêtes surveillées : à l'échéance (budget + marge),
+    KILL QUERY sur l'id de connexion, via une connexion annexe hors pool (pool saturé ≠ kill impossible).
+    """
+    def __init__(self, grace_s: float):
+        self.grace_s = grace_s
+        self._cond = threading.Condition()
+        self._kill_lock = threading.Lock()   # un kill en cours bloque done() : pas de kill sur la requête suivante
+        self._heap: list[tuple[float, int, int]] = []
+        self._live: dict[int, int] = {}
+        self._killed: set[int] = set()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._side = None
+        self.timeouts: dict[str, int] = {}
+        self.kills = 0
+
+    def watch(self, conn_id: int, budget_ms: int) -> int:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="query-watchdog")
+                self._thread.start()
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (time.monotonic() + budget_ms / 1000 + self.grace_s, seq, conn_id))
+            self._live[seq] = conn_id
+            self._cond.notify()
+        return seq
+
+    def done(self, seq: int) -> bool:
+        """Fin de la requête surveillée ; True si elle a été tuée."""
+        with self._kill_lock, self._cond:
+            self._live.pop(seq, None)
+            if seq in self._killed:
+                self._killed.discard(seq)
+                return True
+            return False
+
+    def count_timeout(self, endpoint: Optional[str]) -> None:
+        with self._cond:
+            key = endpoint or "?"
+            self.timeouts[key] = self.timeouts.get(key, 0) + 1
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, seq, conn_id = self._heap[0]
+                if seq not in self._live:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+            with self._kill_lock:
+                with self._cond:
+                    if self._live.pop(seq, None) is None:
+                        continue
+                    self._killed.add(seq)
+                self._kill(conn_id)
+
+    def _kill(self, conn_id: int) -> None:
+        for _ in range(2):
+            try:
+                if self._side is None:
+                    self._side = mysql.connector.connect(**_mysql_cfg(start_tunnel()))
+                cur = self._side.cursor()
+                try:
+                    cur.execute(f"KILL QUERY {int(conn_id)}")
+                finally:
+                    cur.close()
+                self.kills += 1
+                _log(f"[timeout] KILL QUERY {conn_id}")
+                return
+            except Exception as e:
+                _log("[timeout] KILL QUERY impossible", e)
+                try:
+                    if self._side is not None:
+                        self._side.close()
+                except Exception:
+                    pass
+                self._side = None
+
+    def status(self) -> dict:
+        with self._cond:
+            return {"total": sum(self.timeouts.values()), "by_endpoint": dict(self.timeouts),
+                    "kills": self.kills, "watched": len(self._live)}
+
+_QUERY_WATCHDOG = _QueryWatchdog(QUERY_KILL_GRACE_S)
+
+def _execute_bounded(raw, cur, q: str, params=None, many: bool = False):
+    """cur.execute(many) sous le budget de la route ; dépassement → QueryTimeout (504)."""
+    budget_ms = _query_budget_ms()
+    conn_id = getattr(raw, "connection_id", None) if raw is not None else None
+    if budget_ms is None or conn_id is None:
+        return cur.executemany(q, params) if many else cur.execute(q, params)
+    if not many:
+        q = _with_time_hint(raw, q, budget_ms)
+    seq = _QUERY_WATCHDOG.watch(conn_id, budget_ms)
+    try:
+        return cur.executemany(q, params) if many else cur.execute(q, params)
+    except Exception as e:
+        killed = _QUERY_WATCHDOG.done(seq)
+        if killed or getattr(e, "errno", None) in _TIMEOUT_ERRNOS:
+            _QUERY_WATCHDOG.count_timeout(request.endpoint)
+            timeout = QueryTimeout(budget_ms)
+            g.query_timeout = timeout
+            raise timeout from e
+        raise
+    finally:
+        _QUERY_WATCHDOG.done(seq)
+
+@app.after_request
+def _overload_response(resp):
+    """
+    Échec dû à la charge (et sans copie périmée servie) :
+      - refus d'admission → 429 + Retry-After
+      - budget de requête dépassé → 504
+    """
+    rejected = g.pop("admission_rejected", None)
+    timeout = g.pop("query_timeout", None)
+    if resp.status_code < 500:
+        return resp
+    if rejected is not None:
+        resp = jsonify({"ok": False, "error": str(rejected), "shed": True})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(rejected.retry_after)
+    elif timeout is not None:
+        resp = jsonify({"ok": False, "error": str(timeout), "timeout": True})
+        resp.status_code = 504
+    return resp
+
+# -----------------------------------------------------------
+# Unit of work : UNE connexion par requête
+# -----------------------------------------------------------
+class _UnitOfWork:
+    """
+    Connexion unique par requête Flask :
+    - acquise à la demande (1er engine.connect()/begin() ou connect_to_access())
+    - réutilisée par tous les blocs `with engine...` de la requête
+    - blocs imbriqués → SAVEPOINT / RELEASE / ROLLBACK TO
+    - rendue au pool dans teardown_appcontext
+    """
+    def __init__(self):
+        self._raw = None
+        self._slot: Optional[str] = None
+        self.depth = 0
+        self._sp_seq = 0
+
+    @property
+    def acquired(self) -> bool:
+        return self._raw is not None
+
+    def raw(self):
+        if self._raw is None:
+            if self._slot is None:
+                try:
+                    self._slot = _ADMISSION.acquire(_request_class())
+                except AdmissionRejected as e:
+                    g.admission_rejected = e
+                    raise
+            try:
+                self._raw = _checkout_raw(attempts=3, delay=1)
+            except Exception:
+                self._release_slot()
+                raise
+        return self._raw
+
+    def _release_slot(self) -> None:
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            _ADMISSION.release(slot)
+
+    def next_savepoint(self) -> str:
+        self._sp_seq += 1
+        return f"uow_sp_{self._sp_seq}"
+
+    def release(self) -> None:
+        raw, self._raw = self._raw, None
+        self.depth = 0
+        if raw is None:
+            self._release_slot()
+            return
+        try:
+            raw.rollback()  # rien d'orphelin ne part en COMMIT implicite
+        except Exception:
+            pass
+        try:
+            raw.close()
+        except Exception:
+            pass
+        self._release_slot()
+
+def _request_uow() -> Optional[_UnitOfWork]:
+    """Unit of work de la requête courante (None hors contexte Flask : threads de fond)."""
+    if not has_app_context():
+        return None
+    uow = g.get("uow")
+    if uow is None:
+        uow = g.uow = _UnitOfWork()
+    return uow
+
 def connect_to_access() -> ConnWrapper:
     if "conn" not in g:
-        raw = get_pool().get_connection()
-        raw.ping(reconnect=True, attempts=3, delay=1)
-        _set_session_locale(raw)  # ✅ impose FR ici aussi
-        g.conn = ConnWrapper(raw)
+        uow = _request_uow()
+        g.conn = ConnWrapper(uow.raw(), shared=True)
     return g.conn
 
 @app.teardown_appcontext
 def _close_conn(_exc):
-    conn = getattr(g, "conn", None)
-    if conn is not None:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    g.pop("conn", None)
+    uow = g.pop("uow", None)
+    if uow is not None:
+        uow.release()
+
+def _release_request_conn() -> None:
+    """
+    Rend la connexion et le créneau d'admission de la requête AVANT un travail lent sans base
+    (mail Outlook) ; à appeler hors de tout bloc `with engine...` (transactions déjà validées).
+    Un accès ultérieur dans la même requête reprend une connexion.
+    """
+    if has_app_context():
+        _close_conn(None)
+
+# -----------------------------------------------------------
+# Mode dégradé : dernière réponse valide servie si la base est injoignable
+# -----------------------------------------------------------
+import functools
+from collections import OrderedDict
+
+STALE_CACHE_MAX = 256
+_LAST_GOOD: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict()
+_last_good_lock = threading.Lock()
+
+def _remember_last_good(key: tuple, body) -> None:
+    if isinstance(body, dict) and body.get("ok") is not False:
+        with _last_good_lock:
+            _LAST_GOOD[key] = (time.time(), body)
+            _LAST_GOOD.move_to_end(key)
+            while len(_LAST_GOOD) > STALE_CACHE_MAX:
+                _LAST_GOOD.popitem(last=False)
+
+def serve_stale_on_failure(view):
+    """
+    Routes de lecture : mémorise le dernier JSON valide par (chemin, paramètres).
+    En cas d'échec (5xx), le renvoie avec "stale": true au lieu de l'erreur ;
+    sans copie et disjoncteur ouvert → 503 + Retry-After.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET":
+            return view(*args, **kwargs)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        resp = app.make_response(view(*args, **kwargs))
+        if resp.status_code == 200:
+            _remember_last_good(key, resp.get_json(silent=True))
+            return resp
+        if resp.status_code < 500:
+            return resp
+
+        with _last_good_lock:
+            cached = _LAST_GOOD.get(key)
+        if cached is not None:
+            ts, body = cached
+            stale = jsonify({**body, "stale": True, "stale_age_s": int(time.time() - ts)})
+            stale.headers["X-Stale"] = "1"
+            return stale, 200
+        if not _BREAKER.is_closed:
+            body = resp.get_json(silent=True) or {"ok": False}
+            unavailable = jsonify({**body, "ok": False, "degraded": True})
+            unavailable.headers["Retry-After"] = "5"
+            return unavailable, 503
+        return resp
+    return wrapper
 
 # -----------------------------------------------------------
 # Endpoints santé (minimaux, SSH-only)
@@ -407,7 +976,7 @@ def _close_conn(_exc):
 def health():
     ssh_active = bool(_tunnel and getattr(_tunnel, "is_active", False))
     ssh_lp = getattr(_tunnel, "local_bind_port", None) if ssh_active else None
-    ssh_tcp = _check_tcp("127.0.0.1", ssh_lp, 1.0) if ssh_lp else False
+    ssh_tcp = _check_tcp(_link_host(_tunnel), ssh_lp, 1.0) if ssh_lp else False
 
     db_ok = False
     try:
@@ -421,8 +990,21 @@ def health():
 
     return jsonify({
         "ok": db_ok,
-        "mode": "ssh-only",
+        "mode": "ssh-only" if DB_MODE == "ssh" else "direct",
         "ssh": {"active": ssh_active, "local_port": ssh_lp, "last_error": _last_tunnel_err, "tcp": ssh_tcp},
+        "mirror": _MIRROR.status() if _MIRROR is not None else {"enabled": False},
+        "breaker": _BREAKER.status(),
+        "query_cache": _QUERY_CACHE.status(),
+        "row_cache": _ROW_CACHE.status(),
+        "schema": _SCHEMA.status(),
+        "admission": _ADMISSION.status(),
+        "query_timeouts": _QUERY_WATCHDOG.status(),
+        "rollup": _ROLLUP.status(),
+        "analytics_cache": _ANALYTICS_CACHE.status(),
+        "archive": _ARCHIVE.status(),
+        "audit_store": _AUDIT_STORE.status(),
+        "geocode": _GEOCODE_BACKFILL.status(),
+        "boot": {"deferred_imports": DEFERRED_IMPORTS, "marks_ms": dict(_BOOT_MARKS)},
         "ts": int(time.time()),
     }), 200
 
@@ -439,28 +1021,119 @@ def check_auth_token():
     if token != APP_SECRET_TOKEN:
         return jsonify({"ok": False, "error": "Invalid or missing token"}), 401
 
+# -----------------------------------------------------------
+# POST /batch : plusieurs GET internes en UN aller-retour HTTP
+# -----------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 3
+_BATCH_FORWARD_HEADERS = ("X-App-Token", "X-Client-PC", "X-Client-Host", "X-Request-Class")
+
+def _dispatch_sub_get(path: str, params, headers: dict) -> tuple[int, Any]:
+    """
+    Exécute un GET interne dans le contexte applicatif courant :
+    même `g` → même unit of work (connexion DB) que la requête parente.
+    """
+    kw = {"method": "GET", "headers": headers}
+    if params:
+        kw["query_string"] = params
+    with app.test_request_context(path, **kw):
+        resp = app.full_dispatch_request()
+    return resp.status_code, resp.get_json(silent=True)
+
+def _run_sub_gets(jobs: list[tuple[int, str, Any]], headers: dict) -> list[tuple[int, int, Any]]:
+    return [(idx, *_dispatch_sub_get(path, params, headers)) for idx, path, params in jobs]
+
+def _run_sub_gets_in_app_ctx(jobs, headers):
+    # thread du pool : son propre contexte applicatif → sa propre connexion, rendue au pop
+    with app.app_context():
+        return _run_sub_gets(jobs, headers)
+
+@app.post("/batch")
+def batch_requests():
+    """
+    Regroupe des GET internes :
+        POST /batch  {"requests": [{"id": "stats", "path": "/orders/stats"},
+                                   {"path": "/orders", "params": {"status": "stock"}}],
+                      "parallel": false}
+
+    - séquentiel (défaut) : toutes les sous-requêtes partagent la connexion DB de /batch
+    - parallel=true : réparties sur BATCH_MAX_WORKERS threads (une connexion par thread)
+    Réponse : {"ok": true, "responses": [{"id", "path", "status", "body"}, ...]} (ordre conservé)
+    """
+    data = request.get_json(silent=True)
+    subs = data.get("requests") if isinstance(data, dict) else data
+    parallel = bool(data.get("parallel")) if isinstance(data, dict) else False
+    if not isinstance(subs, list) or not subs:
+        return jsonify({"ok": False, "error": "Liste de requêtes attendue"}), 400
+    if len(subs) > BATCH_MAX_REQUESTS:
+        return jsonify({"ok": False, "error": f"Maximum {BATCH_MAX_REQUESTS} requêtes par lot"}), 400
+
+    jobs, meta = [], []
+    for idx, sub in enumerate(subs):
+        if isinstance(sub, str):
+            sub = {"path": sub}
+        path = str((sub or {}).get("path") or "")
+        method = str(sub.get("method") or "GET").upper()
+        meta.append({"id": sub.get("id", idx), "path": path})
+        if not path.startswith("/") or path.split("?", 1)[0].rstrip("/") == "/batch" or method != "GET":
+            meta[-1].update(status=400, body={"ok": False, "error": "Seuls les GET internes sont acceptés"})
+            continue
+        jobs.append((idx, path, sub.get("params")))
+
+    headers = {h: request.headers[h] for h in _BATCH_FORWARD_HEADERS if h in request.headers}
+    if parallel and len(jobs) > 1:
+        workers = min(BATCH_MAX_WORKERS, len(jobs))
+        shares = [jobs[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as ex:
+            results = [r for part in ex.map(lambda sh: _run_sub_gets_in_app_ctx(sh, headers), shares) for r in part]
+    else:
+        results = _run_sub_gets(jobs, headers)
+
+    for idx, status, body in results:
+        meta[idx].update(status=status, body=body)
+    return jsonify({"ok": True, "responses": meta}), 200
+
 # -----------------------------------------------------------
 # Compat SQLAlchemy: text()/engine
 # -----------------------------------------------------------
-try:
-    from sqlalchemy import text as _sa_text  # si dispo
-except Exception:
-    def _sa_text(q: str) -> str:
-        return q
+def _sa_text(q: str) -> str:
+    return q
+
+if not DEFERRED_IMPORTS:
+    try:
+        from sqlalchemy import text as _sa_text  # si dispo
+    except Exception:
+        pass
 
 def text(q: str):
     return _sa_text(q)
 
 class _CompatConnCtx:
+    def __init__(self, uow: Optional[_UnitOfWork] = None):
+        self._uow = uow
+        self._savepoint: Optional[str] = None
+
     def __enter__(self):
-        raw = get_pool().get_connection()
-        raw.ping(reconnect=True, attempts=2, delay=0)
-        _set_session_locale(raw)  # impose FR
+        if self._uow is not None:
+            # connexion de la requête : transaction imbriquée → SAVEPOINT
+            raw = self._uow.raw()
+            self._raw = raw
+            self._cur = raw.cursor(buffered=True)
+            if self._uow.depth > 0:
+                self._savepoint = self._uow.next_savepoint()
+                self._cur.execute(f"SAVEPOINT {self._savepoint}")
+            self._uow.depth += 1
+            return self
+        raw = _checkout_raw(attempts=2, delay=0)
         self._raw = raw
         self._cur = raw.cursor()
         return self
 
     def __exit__(self, exc_type, exc, tb):
+        if self._uow is not None:
+            return self._exit_uow(exc_type)
         try:
             # ✅ si aucune exception → COMMIT ; sinon → ROLLBACK
             if exc_type is None:
@@ -483,6 +1156,27 @@ class _CompatConnCtx:
             except Exception:
                 pass
 
+    def _exit_uow(self, exc_type):
+        self._uow.depth -= 1
+        try:
+            if self._savepoint:
+                if exc_type is None:
+                    self._cur.execute(f"RELEASE SAVEPOINT {self._savepoint}")
+                else:
+                    self._cur.execute(f"ROLLBACK TO SAVEPOINT {self._savepoint}")
+            elif exc_type is None:
+                self._raw.commit()
+            else:
+                self._raw.rollback()
+        except Exception:
+            # connexion douteuse : on la rend au pool, la prochaine sera neuve
+            self._uow.release()
+        finally:
+            try:
+                self._cur.close()
+            except Exception:
+                pass
+
     def execute(self, sql, params=None):
         # supporte :named et ? comme avant
         q = sql if isinstance(sql, str) else str(sql)
@@ -490,20 +1184,587 @@ class _CompatConnCtx:
             q = re.sub(r":([A-Za-z_]\w*)", r"%(\1)s", q)
         elif params:
             q = q.replace("?", "%s")
-        self._cur.execute(q, params)
+        _execute_bounded(self._raw, self._cur, q, params)
+        return _CompatExecResult(self._cur)
+
+    def executemany(self, sql, seq_params):
+        # :named uniquement (liste de dicts), comme execute()
+        q = sql if isinstance(sql, str) else str(sql)
+        q = re.sub(r":([A-Za-z_]\w*)", r"%(\1)s", q)
+        _execute_bounded(self._raw, self._cur, q, list(seq_params), many=True)
         return _CompatExecResult(self._cur)
 
 class _CompatEngine:
+    """connect()/begin() : connexion de la requête si contexte Flask, sinon checkout dédié."""
     def connect(self):
-        return _CompatConnCtx()
+        return _CompatConnCtx(_request_uow())
     def begin(self):
-        return _CompatConnCtx()
+        return _CompatConnCtx(_request_uow())
 
 engine = _CompatEngine()
 
 # Alias pour compat si ancien code référence `tunnel`
 tunnel = _tunnel
 
+# -----------------------------------------------------------
+# Notifications d'écriture (invalidation des caches / miroir)
+# -----------------------------------------------------------
+_WRITE_LISTENERS: list = []
+
+def on_write(fn):
+    """Enregistre fn(table, ns) ; appelé après COMMIT par les routes d'écriture."""
+    _WRITE_LISTENERS.append(fn)
+    return fn
+
+def _notify_write(table: str, ns=None) -> None:
+    """table modifiée ; ns = liste des N touchés (None = inconnu / table entière)."""
+    for fn in list(_WRITE_LISTENERS):
+        try:
+            fn(table, ns)
+        except Exception as e:
+            _log(f"write listener {getattr(fn, '__name__', fn)} error", e)
+
+# -----------------------------------------------------------
+# Miroir local SQLite (lecture seule) de tableau_production_2 / clients / donnees
+# -----------------------------------------------------------
+import sqlite3
+from decimal import Decimal
+
+LOCAL_MIRROR = os.getenv("LOCAL_MIRROR", "0").strip().lower() in ("1", "true", "oui", "yes")
+MIRROR_DB_PATH = os.getenv("MIRROR_DB_PATH") or str(_LOG_DIR / "mirror.sqlite3")
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "10"))
+MIRROR_MAX_STALENESS = float(os.getenv("MIRROR_MAX_STALENESS", "30"))
+# Colonne de version par ligne (MAJ_LE TIMESTAMP ... ON UPDATE CURRENT_TIMESTAMP, indexée) : utilisée
+# d'office si la table la porte → seules les lignes récentes + l'index de la clé sont relus.
+# Absente (ou MIRROR_VERSION_COLUMN="") → empreinte complète par tranche (lecture de toute la table).
+MIRROR_VERSION_COLUMN = os.getenv("MIRROR_VERSION_COLUMN", "MAJ_LE").strip()
+MIRROR_CHUNK = 5000
+# Synchro par tranches de clé (N DIV MIRROR_RANGE) : empreinte par tranche côté MySQL,
+# seules les tranches modifiées (mises à jour, insertions, suppressions) sont relues
+MIRROR_RANGE = int(os.getenv("MIRROR_RANGE", "1000"))
+
+# table MySQL → clé primaire (None : pas de clé, toujours rechargée en entier)
+MIRROR_TABLES = {
+    "tableau_production_2": "N",
+    "clients": None,
+    "donnees": "N",
+}
+
+_MYSQL_FMT_TO_PY = {"%d": "%d", "%m": "%m", "%Y": "%Y", "%y": "%y",
+                    "%H": "%H", "%i": "%M", "%s": "%S", "%M": "%B"}
+
+def _mysql_fmt(fmt: str) -> str:
+    return re.sub(r"%[a-zA-Z]", lambda m: _MYSQL_FMT_TO_PY.get(m.group(0), m.group(0)), fmt or "")
+
+def _sqlite_str_to_date(value, fmt):
+    try:
+        return datetime.strptime(str(value).strip(), _mysql_fmt(fmt)).date().isoformat()
+    except Exception:
+        return None
+
+def _sqlite_date_format(value, fmt):
+    try:
+        return date.fromisoformat(str(value)[:10]).strftime(_mysql_fmt(fmt))
+    except Exception:
+        return None
+
+def _sqlite_last_day(value):
+    try:
+        d = date.fromisoformat(str(value)[:10])
+        nxt = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return (nxt - timedelta(days=1)).isoformat()
+    except Exception:
+        return None
+
+def _sqlite_datediff(a, b):
+    try:
+        return (date.fromisoformat(str(a)[:10]) - date.fromisoformat(str(b)[:10])).days
+    except Exception:
+        return None
+
+def _sqlite_value(v):
+    """Types MySQL → types stockables SQLite."""
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v)
+    return v
+
+class _LocalMirror:
+    """
+    Miroir SQLite des tables de lecture :
+      - thread `mirror-sync` : synchro incrémentale toutes les MIRROR_SYNC_INTERVAL s
+          · tables à clé : empreinte (nb, somme des clés, CRC des lignes) par tranche de
+            MIRROR_RANGE clés ; seules les tranches qui ont changé sont rechargées
+          · colonne de version configurée : lignes modifiées depuis la dernière version, puis
+            comparaison nb / somme des clés par tranche (suppressions faites par d'autres postes)
+          · table sans clé (clients) : CHECKSUM TABLE + rechargement complet
+      - écritures MySQL de ce backend → lignes re-synchronisées aussitôt ; la table
+        repasse par MySQL tant que ce n'est pas fait (lecture de ses propres écritures)
+      - lecture servie localement seulement si le retard ≤ MIRROR_MAX_STALENESS
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+        self._columns: dict[str, list[str]] = {}
+        self._checksums: dict[str, Any] = {}
+        self._ranges: dict[str, dict[int, tuple]] = {}   # table → empreinte MySQL par tranche (dernière synchro)
+        self._dirty: dict[str, Optional[set]] = {}   # table → N à recharger (None = tout)
+        self._last_sync: dict[str, float] = {}
+        self._modes: dict[str, str] = {}   # table → version | ranges | checksum (dernière synchro)
+        self.last_error: Optional[str] = None
+
+    # ---- connexions SQLite (une par thread, WAL → lecteurs concurrents) ----
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.row_factory = sqlite3.Row
+            db.create_function("STR_TO_DATE", 2, _sqlite_str_to_date)
+            db.create_function("DATE_FORMAT", 2, _sqlite_date_format)
+            db.create_function("LAST_DAY", 1, _sqlite_last_day)
+            db.create_function("CURDATE", 0, lambda: date.today().isoformat())
+            db.create_function("DATEDIFF", 2, _sqlite_datediff)
+            self._local.db = db
+        return db
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._loop, daemon=True, name="mirror-sync").start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.sync_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = repr(e)
+                _log("mirror sync error", e)
+            self._wake.wait(MIRROR_SYNC_INTERVAL)
+            self._wake.clear()
+
+    # ---- état ----
+    def lag(self, table: str) -> Optional[float]:
+        ts = self._last_sync.get(table)
+        return None if ts is None else max(0.0, time.time() - ts)
+
+    def can_serve(self, tables) -> bool:
+        with self._lock:
+            if any(t in self._dirty for t in tables):
+                return False
+        for t in tables:
+            lag = self.lag(t)
+            if lag is None or lag > MIRROR_MAX_STALENESS:
+                return False
+        return True
+
+    def status(self) -> dict:
+        return {
+            "enabled": True,
+            "mode": dict(self._modes),
+            "lag_s": {t: (round(l, 1) if (l := self.lag(t)) is not None else None) for t in MIRROR_TABLES},
+            "max_staleness_s": MIRROR_MAX_STALENESS,
+            "dirty": sorted(self._dirty),
+            "last_error": self.last_error,
+        }
+
+    # ---- invalidation par les routes d'écriture ----
+    def mark_dirty(self, table: str, ns=None) -> None:
+        if table not in MIRROR_TABLES:
+            return
+        with self._lock:
+            if ns is None or MIRROR_TABLES[table] is None:
+                self._dirty[table] = None
+            elif table not in self._dirty:
+                self._dirty[table] = set(ns)
+            elif self._dirty[table] is not None:
+                self._dirty[table].update(ns)
+        self._wake.set()
+
+    # ---- lecture ----
+    def query(self, sql, params=None) -> list[dict]:
+        cur = self._db().execute(str(sql), params or {})
+        return [dict(r) for r in cur.fetchall()]
+
+    # ---- synchronisation ----
+    def _ensure_table(self, table: str, cols: list[str]) -> bool:
+        """(Re)crée la table locale si les colonnes ont changé. True si recréée."""
+        if self._columns.get(table) == cols:
+            return False
+        db = self._db()
+        key = MIRROR_TABLES[table]
+        # NOCASE : égalités / IN insensibles à la casse, comme la collation *_ci de MySQL
+        col_defs = ", ".join(f'"{c}" COLLATE NOCASE' + (" PRIMARY KEY" if c == key else "") for c in cols)
+        db.execute(f'DROP TABLE IF EXISTS "{table}"')
+        db.execute(f'CREATE TABLE "{table}" ({col_defs})')
+        self._columns[table] = cols
+        return True
+
+    def _insert(self, table: str, rows, cols: list[str]) -> None:
+        placeholders = ", ".join("?" for _ in cols)
+        col_list = ", ".join(f'"{c}"' for c in cols)
+        self._db().executemany(
+            f'INSERT OR REPLACE INTO "{table}" ({col_list}) VALUES ({placeholders})',
+            [tuple(_sqlite_value(r[c]) for c in cols) for r in rows],
+        )
+
+    def _store(self, table: str, rows, cols: list[str], delete_ns=None) -> None:
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            if delete_ns:
+                key = MIRROR_TABLES[table]
+                db.executemany(f'DELETE FROM "{table}" WHERE "{key}" = ?', [(n,) for n in delete_ns])
+            self._insert(table, rows, cols)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _full_reload(self, conn, table: str, cols: list[str]) -> None:
+        """Rechargement complet dans UNE transaction SQLite (les lecteurs voient l'ancien état jusqu'au COMMIT)."""
+        key = MIRROR_TABLES[table]
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.execute(f'DELETE FROM "{table}"')
+            if key is None:
+                self._insert(table, conn.execute(text(f"SELECT * FROM {table}")).mappings().all(), cols)
+            else:
+                # par tranches ordonnées sur la clé : mémoire bornée
+                after = None
+                while True:
+                    where = f"WHERE {key} > :after " if after is not None else ""
+                    chunk = conn.execute(
+                        text(f"SELECT * FROM {table} {where}ORDER BY {key} LIMIT {MIRROR_CHUNK}"),
+                        {"after": after} if after is not None else None,
+                    ).mappings().all()
+                    self._insert(table, chunk, cols)
+                    if len(chunk) < MIRROR_CHUNK:
+                        break
+                    after = chunk[-1][key]
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _remote_ranges(self, conn, table: str, cols: list[str], content: bool) -> dict[int, tuple]:
+        """
+        Empreinte MySQL par tranche de clé : {tranche: (nb, somme des clés[, somme et XOR des CRC32 des lignes])}.
+        content=False : index de la clé seulement (suppressions / insertions).
+        NULL → '\\0' dans l'empreinte (CONCAT_WS saute les NULL : ('a', NULL) et (NULL, 'a') se confondraient).
+        """
+        key = MIRROR_TABLES[table]
+        agg = f"COUNT(*), SUM({key})"
+        if content:
+            row_sql = "CONCAT_WS('|', " + ", ".join(f"COALESCE(`{c}`, '\\0')" for c in cols) + ")"
+            agg += f", SUM(CRC32({row_sql})), BIT_XOR(CRC32({row_sql}))"
+        rows = conn.execute(text(
+            f"SELECT {key} DIV {MIRROR_RANGE} AS b, {agg} FROM {table} GROUP BY b"
+        )).fetchall()
+        return {int(r[0]): tuple(int(v or 0) for v in r[1:]) for r in rows}
+
+    def _local_ranges(self, table: str) -> dict[int, tuple]:
+        key = MIRROR_TABLES[table]
+        rows = self._db().execute(
+            f'SELECT CAST("{key}" / {MIRROR_RANGE} AS INTEGER) AS b, COUNT(*), SUM("{key}") '
+            f'FROM "{table}" GROUP BY b'
+        ).fetchall()
+        return {int(r[0]): (int(r[1]), int(r[2] or 0)) for r in rows}
+
+    def _reload_ranges(self, conn, table: str, cols: list[str], ranges) -> None:
+        """Remplace les tranches données par leur contenu MySQL (une transaction SQLite par tranche)."""
+        key = MIRROR_TABLES[table]
+        db = self._db()
+        for b in sorted(ranges):
+            lo, hi = b * MIRROR_RANGE, (b + 1) * MIRROR_RANGE
+            rows = conn.execute(
+                text(f"SELECT * FROM {table} WHERE {key} >= :lo AND {key} < :hi"), {"lo": lo, "hi": hi}
+            ).mappings().all()
+            db.execute("BEGIN")
+            try:
+                db.execute(f'DELETE FROM "{table}" WHERE "{key}" >= ? AND "{key}" < ?', (lo, hi))
+                self._insert(table, rows, cols)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def _sync_table(self, conn, table: str) -> None:
+        key = MIRROR_TABLES[table]
+        cols = _SCHEMA.column_names(table)
+        with self._lock:
+            dirty = self._dirty.pop(table, False)
+        version_mode = bool(MIRROR_VERSION_COLUMN and MIRROR_VERSION_COLUMN in cols and key is not None)
+        self._modes[table] = "version" if version_mode else ("ranges" if key is not None else "checksum")
+        # empreinte lue AVANT tout rechargement : un changement ultérieur sera vu à la synchro suivante
+        remote = self._remote_ranges(conn, table, cols, content=True) if key is not None and not version_mode else None
+
+        if self._ensure_table(table, cols) or dirty is None:
+            self._full_reload(conn, table, cols)
+        else:
+            if dirty:
+                # nos propres écritures : relecture ciblée
+                in_sql, in_params = _in_clause(sorted(dirty))
+                rows = conn.execute(
+                    text(f"SELECT * FROM {table} WHERE {key} IN ({in_sql})"), in_params
+                ).mappings().all()
+                found = {r[key] for r in rows}
+                self._store(table, rows, cols, delete_ns=[n for n in dirty if n not in found])
+
+            if version_mode:
+                vcol = MIRROR_VERSION_COLUMN
+                last = self._db().execute(f'SELECT MAX("{vcol}") FROM "{table}"').fetchone()[0]
+                rows = conn.execute(
+                    text(f"SELECT * FROM {table} WHERE {vcol} >= :v ORDER BY {vcol}"), {"v": last or ""}
+                ).mappings().all()
+                if rows:
+                    self._store(table, rows, cols)
+                # suppressions (autres postes, archivage) : invisibles par la colonne de version
+                keys = self._remote_ranges(conn, table, cols, content=False)
+                local = self._local_ranges(table)
+                changed = [b for b in keys.keys() | local.keys() if keys.get(b) != local.get(b)]
+                if changed:
+                    self._reload_ranges(conn, table, cols, changed)
+            elif key is not None:
+                previous = self._ranges.get(table, {})
+                changed = [b for b in remote.keys() | previous.keys() if remote.get(b) != previous.get(b)]
+                if changed:
+                    self._reload_ranges(conn, table, cols, changed)
+            else:
+                checksum = conn.execute(text(f"CHECKSUM TABLE {table}")).fetchone()[1]
+                if checksum is None or checksum != self._checksums.get(table):
+                    self._full_reload(conn, table, cols)
+                self._checksums[table] = checksum
+        if remote is not None:
+            self._ranges[table] = remote
+        self._last_sync[table] = time.time()
+
+    def sync_once(self) -> None:
+        with engine.connect() as conn:
+            for table in MIRROR_TABLES:
+                self._sync_table(conn, table)
+
+_MIRROR: Optional[_LocalMirror] = _LocalMirror(MIRROR_DB_PATH) if LOCAL_MIRROR else None
+
+@on_write
+def _mirror_on_write(table, ns):
+    if _MIRROR is not None:
+        _MIRROR.mark_dirty(table, ns)
+
+def _mirror_rows(sql, params=None, tables=("tableau_production_2",)) -> Optional[list[dict]]:
+    """Lignes servies par le miroir local, ou None s'il est absent / trop en retard / en échec."""
+    if _MIRROR is None or not _MIRROR.can_serve(tables):
+        return None
+    try:
+        return _MIRROR.query(sql, params)
+    except Exception as e:
+        _log("mirror read error", e)
+        return None
+
+# -----------------------------------------------------------
+# Cache de requêtes court (TTL + LRU) avec coalescence (single-flight)
+# -----------------------------------------------------------
+import copy
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3"))
+QUERY_CACHE_MAX = int(os.getenv("QUERY_CACHE_MAX", "128"))
+QUERY_CACHE_WAIT = 30.0
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+def _shared_error(e: BaseException) -> BaseException:
+    """Copie de l'erreur du leader pour un suiveur (jamais la même instance levée dans plusieurs threads)."""
+    try:
+        return copy.copy(e)
+    except Exception:
+        return RuntimeError(str(e))
+
+class _QueryCache:
+    """
+    - requêtes identiques simultanées → UNE seule exécution, les autres attendent son résultat
+    - résultat gardé QUERY_CACHE_TTL secondes (LRU de QUERY_CACHE_MAX entrées)
+    - invalidate(table) : appelé par les écritures ; un chargement démarré avant
+      l'invalidation n'est pas mis en cache (compteur de génération par table)
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple[float, tuple, Any]]" = OrderedDict()
+        self._inflight: dict[tuple, _InFlight] = {}
+        self._gen: dict[str, int] = {}
+        self.hits = self.misses = self.coalesced = 0
+
+    def get_or_load(self, key: tuple, loader, tables: tuple = ()):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+                gens = tuple(self._gen.get(t, 0) for t in tables)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if flight.done.wait(QUERY_CACHE_WAIT):
+                if isinstance(flight.error, (AdmissionRejected, QueryTimeout)):
+                    # refus / budget propres à la requête du leader : celle-ci a droit à son propre essai
+                    return loader()
+                if flight.error is not None:
+                    raise _shared_error(flight.error) from flight.error
+                return flight.result
+            return loader()  # leader bloqué : on ne l'attend pas indéfiniment
+
+        try:
+            flight.result = loader()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and gens == tuple(self._gen.get(t, 0) for t in tables):
+                    self._entries[key] = (time.time(), tables, flight.result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+
+    def invalidate(self, table: str) -> None:
+        with self._lock:
+            self._gen[table] = self._gen.get(table, 0) + 1
+            for key in [k for k, (_, tables, _) in self._entries.items() if table in tables]:
+                del self._entries[key]
+
+    def status(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits,
+                "misses": self.misses, "coalesced": self.coalesced}
+
+_QUERY_CACHE = _QueryCache(QUERY_CACHE_TTL, QUERY_CACHE_MAX)
+
+@on_write
+def _query_cache_on_write(table, ns):
+    _QUERY_CACHE.invalidate(table)
+
+def _read_rows(sql, params=None, tables=("tableau_production_2",), mirror: bool = True) -> list[dict]:
+    """Miroir local si possible, sinon MySQL ; lignes matérialisées en dicts."""
+    rows = _mirror_rows(sql, params, tables=tables) if mirror else None
+    if rows is not None:
+        return rows
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(sql, params).mappings().all()]
+
+def _cached_rows(sql, params=None, tables=("tableau_production_2",)) -> list[dict]:
+    """_read_rows derrière le cache court + coalescence (clé = SQL normalisé + paramètres)."""
+    key = (" ".join(str(sql).split()), tuple(sorted((params or {}).items())))
+    return _QUERY_CACHE.get_or_load(key, lambda: _read_rows(sql, params, tables), tables)
+
+# -----------------------------------------------------------
+# Cache de lignes complètes de commandes (GET /orders/<n>, état AVANT des MAJ)
+# -----------------------------------------------------------
+ROW_CACHE_TTL = float(os.getenv("ROW_CACHE_TTL", "30"))
+ROW_CACHE_MAX_BYTES = int(os.getenv("ROW_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+def _row_size(row: dict) -> int:
+    return 64 + sum(len(str(k)) + len(str(v)) for k, v in row.items())
+
+class _RowCache:
+    """
+    LRU borné en mémoire (taille estimée des lignes) : N → (lu_à, ligne complète).
+    - rempli par les lectures (SELECT *)
+    - mis à jour sur place par les écritures (write_through)
+    - frais = lu il y a moins de ROW_CACHE_TTL s ; sert alors aussi d'état AVANT pour le diff d'audit
+    """
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._rows: "OrderedDict[int, tuple[float, dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = self.misses = 0
+
+    def get(self, n: int) -> Optional[dict]:
+        """Copie de la ligne si fraîche, sinon None."""
+        with self._lock:
+            entry = self._rows.get(n)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(n)
+            self.hits += 1
+            return dict(entry[1])
+
+    def snapshot(self, n: int) -> Optional[tuple[float, dict]]:
+        with self._lock:
+            entry = self._rows.get(n)
+            return (entry[0], dict(entry[1])) if entry is not None else None
+
+    def put(self, n: int, row: dict, fetched_at: Optional[float] = None) -> None:
+        size = _row_size(row)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._rows.pop(n, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._rows[n] = (fetched_at or time.time(), dict(row), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._rows:
+                _, (_, _, s) = self._rows.popitem(last=False)
+                self._bytes -= s
+
+    def write_through(self, n: int, values: dict, snapshot: Optional[tuple[float, dict]],
+                      version: Optional[str] = None) -> None:
+        """
+        Après COMMIT : ré-insère la ligne (prise avant l'écriture) avec les nouvelles valeurs.
+        Version inconnue (None) → la prochaine lecture GET /orders/<n> repassera par la base.
+        """
+        if snapshot is not None:
+            fetched_at, row = snapshot
+            self.put(n, {**row, **values, "_version": version}, fetched_at=fetched_at)
+
+    def evict(self, ns=None) -> None:
+        with self._lock:
+            if ns is None:
+                self._rows.clear()
+                self._bytes = 0
+                return
+            for n in ns:
+                old = self._rows.pop(n, None)
+                if old is not None:
+                    self._bytes -= old[2]
+
+    def status(self) -> dict:
+        return {"rows": len(self._rows), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+_ROW_CACHE = _RowCache(ROW_CACHE_TTL, ROW_CACHE_MAX_BYTES)
+
+@on_write
+def _row_cache_on_write(table, ns):
+    if table == "tableau_production_2":
+        _ROW_CACHE.evict(ns)
+
 # -----------------------------------------------------------
 # (Tes routes métier peuvent continuer ici…)
 # -----------------------------------------------------------
@@ -553,7 +1814,7 @@ def slugify_filename(name: str, max_len: int = 80) -> str:
 
 def _open_sftp():
     """Ouvre une session SFTP vers le même hôte SSH (clé privée si fournie)."""
-    if paramiko is None:
+    if _require_paramiko() is None:
         raise RuntimeError("paramiko manquant — pip install paramiko")
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -585,7 +1846,11 @@ def _sh_quote(p: str) -> str:
 
 def _ssh_exec_append(remote_path: str, payload_utf8: str):
     """Append de texte via SSH (fallback si SFTP indisponible)."""
-    if paramiko is None:
+    return _ssh_exec_append_many({remote_path: payload_utf8})[remote_path]
+
+def _ssh_exec_append_many(payloads: dict[str, str]) -> dict[str, bool]:
+    """Append de plusieurs fichiers via UNE connexion SSH. Retourne {chemin: existait}."""
+    if _require_paramiko() is None:
         raise RuntimeError("paramiko manquant — pip install paramiko")
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -601,44 +1866,30 @@ def _ssh_exec_append(remote_path: str, payload_utf8: str):
         look_for_keys=False,
     )
     try:
-        dirname = posixpath.dirname(remote_path)
-        # mkdir -p
-        stdin, stdout, stderr = client.exec_command(f"mkdir -p {_sh_quote(dirname)}")
-        if stdout.channel.recv_exit_status() != 0:
-            raise RuntimeError(f"mkdir a échoué: {stderr.read().decode('utf-8','ignore')}")
-        # fichier existant ?
-        stdin, stdout, stderr = client.exec_command(
-            f"if [ -f {_sh_quote(remote_path)} ]; then echo EXISTS; else echo NEW; fi"
-        )
-        existed = (stdout.read().decode('utf-8','ignore').strip() == "EXISTS")
-        # append base64
-        b64 = _b64.b64encode(payload_utf8.encode("utf-8")).decode("ascii")
-        cmd_append = f"base64 -d >> {_sh_quote(remote_path)} << 'EOF'\n{b64}\nEOF\n"
-        stdin, stdout, stderr = client.exec_command(cmd_append)
-        if stdout.channel.recv_exit_status() != 0:
-            raise RuntimeError(f"append a échoué: {stderr.read().decode('utf-8','ignore')}")
-        return existed
+        existed_by_path: dict[str, bool] = {}
+        for dirname in sorted({posixpath.dirname(p) for p in payloads}):
+            # mkdir -p
+            stdin, stdout, stderr = client.exec_command(f"mkdir -p {_sh_quote(dirname)}")
+            if stdout.channel.recv_exit_status() != 0:
+                raise RuntimeError(f"mkdir a échoué: {stderr.read().decode('utf-8','ignore')}")
+        for remote_path, payload_utf8 in payloads.items():
+            # fichier existant ?
+            stdin, stdout, stderr = client.exec_command(
+                f"if [ -f {_sh_quote(remote_path)} ]; then echo EXISTS; else echo NEW; fi"
+            )
+            existed_by_path[remote_path] = (stdout.read().decode('utf-8','ignore').strip() == "EXISTS")
+            # append base64
+            b64 = _b64.b64encode(payload_utf8.encode("utf-8")).decode("ascii")
+            cmd_append = f"base64 -d >> {_sh_quote(remote_path)} << 'EOF'\n{b64}\nEOF\n"
+            stdin, stdout, stderr = client.exec_command(cmd_append)
+            if stdout.channel.recv_exit_status() != 0:
+                raise RuntimeError(f"append a échoué: {stderr.read().decode('utf-8','ignore')}")
+        return existed_by_path
     finally:
         try: client.close()
         except Exception: pass
 
-def write_audit_log_remote(n, nom_client, changes: dict, pc_name: str) -> dict:
-    """
-    Ecrit un log d'audit *sur le NAS via le même serveur SSH*.
-    - 1er essai SFTP; fallback en SSH exec base64 si besoin.
-    """
-    if not changes:
-        msg = "[AUDIT] Aucun changement => pas de log."
-        print(msg, flush=True)
-        return {"ok": False, "reason": "no_changes", "message": msg}
-
-    ts = datetime.now()
-    slug = slugify_filename(nom_client)
-    filename = f"{ts:%Y-%m-%d}__{slug}.txt"
-    remote_dir = AUDIT_REMOTE_DIR
-    remote_path = posixpath.join(remote_dir, filename)
-    print(f"[AUDIT] Cible du log: {remote_path}", flush=True)
-
+def _audit_lines(n, nom_client, changes: dict, pc_name: str, ts: datetime) -> list[str]:
     lines = []
     for col, (old, new) in changes.items():
         old_s = "" if old is None else str(old)
@@ -647,26 +1898,36 @@ def write_audit_log_remote(n, nom_client, changes: dict, pc_name: str) -> dict:
             f"[{ts.strftime('%Y-%m-%d %H:%M:%S')}] "
             f"PC={pc_name} N={n} NOM_CLIENT={nom_client} | {col}: '{old_s}' -> '{new_s}'"
         )
-    payload = "\n".join(lines) + "\n"
+    return lines
 
+def _audit_remote_path(nom_client, ts: datetime) -> str:
+    filename = f"{ts:%Y-%m-%d}__{slugify_filename(nom_client)}.txt"
+    return posixpath.join(AUDIT_REMOTE_DIR, filename)
+
+def _write_audit_payloads(payloads: dict[str, str]) -> dict:
+    """
+    Ecrit plusieurs fichiers d'audit en UNE session (SFTP, fallback SSH exec).
+    payloads : {chemin distant: texte à ajouter}
+    """
     client = None
     sftp = None
     try:
         print(f"[AUDIT] Tentative SFTP vers {SSH_HOST}:{SSH_PORT}…", flush=True)
         client, sftp = _open_sftp()
-        _sftp_mkdirs(sftp, remote_dir)
-        try:
-            sftp.stat(remote_path)
-            existed = True
-        except IOError:
-            existed = False
-        with sftp.open(remote_path, "a", -1) as f:
-            f.write(payload)
-            f.flush()
-        print(f"[AUDIT] ✅ SFTP OK → écrit dans {remote_path} ({'existant' if existed else 'nouveau'})", flush=True)
-        for L in lines:
-            print("   ↳", L, flush=True)
-        return {"ok": True, "method": "sftp", "file": remote_path, "existed": existed}
+        _sftp_mkdirs(sftp, AUDIT_REMOTE_DIR)
+        existed_by_path = {}
+        for remote_path, payload in payloads.items():
+            try:
+                sftp.stat(remote_path)
+                existed_by_path[remote_path] = True
+            except IOError:
+                existed_by_path[remote_path] = False
+            with sftp.open(remote_path, "a", -1) as f:
+                f.write(payload)
+                f.flush()
+            print(f"[AUDIT] ✅ SFTP OK → écrit dans {remote_path} "
+                  f"({'existant' if existed_by_path[remote_path] else 'nouveau'})", flush=True)
+        return {"ok": True, "method": "sftp", "existed": existed_by_path}
     except Exception as e:
         print("[AUDIT] ⚠️ SFTP indisponible :", repr(e), flush=True)
     finally:
@@ -681,21 +1942,370 @@ def write_audit_log_remote(n, nom_client, changes: dict, pc_name: str) -> dict:
 
     try:
         print("[AUDIT] Fallback SSH exec → append base64…", flush=True)
-        existed = _ssh_exec_append(remote_path, payload)
-        print(f"[AUDIT] ✅ Fallback SSH OK → écrit dans {remote_path} ({'existant' if existed else 'nouveau'})", flush=True)
-        for L in lines:
-            print("   ↳", L, flush=True)
-        return {"ok": True, "method": "ssh", "file": remote_path, "existed": existed}
+        existed_by_path = _ssh_exec_append_many(payloads)
+        for remote_path, existed in existed_by_path.items():
+            print(f"[AUDIT] ✅ Fallback SSH OK → écrit dans {remote_path} "
+                  f"({'existant' if existed else 'nouveau'})", flush=True)
+        return {"ok": True, "method": "ssh", "existed": existed_by_path}
     except Exception as e2:
         print("[AUDIT] ❌ Fallback SSH KO :", repr(e2), flush=True)
-        return {"ok": False, "method": "ssh", "file": remote_path, "error": str(e2)}
+        return {"ok": False, "method": "ssh", "error": str(e2)}
 
-def _norm(s: str) -> str:
-    s = (s or "").strip()
-    try:
-        s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode()
-    except Exception:
-        pass
+def write_audit_log_remote(n, nom_client, changes: dict, pc_name: str) -> dict:
+    """
+    Ecrit un log d'audit *sur le NAS via le même serveur SSH*.
+    - 1er essai SFTP; fallback en SSH exec base64 si besoin.
+    """
+    if not changes:
+        msg = "[AUDIT] Aucun changement => pas de log."
+        print(msg, flush=True)
+        return {"ok": False, "reason": "no_changes", "message": msg}
+
+    ts = datetime.now()
+    remote_path = _audit_remote_path(nom_client, ts)
+    print(f"[AUDIT] Cible du log: {remote_path}", flush=True)
+
+    _AUDIT_STORE.record([(n, nom_client, changes)], pc_name, ts)
+    lines = _audit_lines(n, nom_client, changes, pc_name, ts)
+    res = _write_audit_payloads({remote_path: "\n".join(lines) + "\n"})
+    if res.get("ok"):
+        for L in lines:
+            print("   ↳", L, flush=True)
+        return {"ok": True, "method": res["method"], "file": remote_path,
+                "existed": res["existed"][remote_path]}
+    return {"ok": False, "method": res.get("method"), "file": remote_path, "error": res.get("error")}
+
+def write_audit_log_remote_batch(entries: list[tuple[Any, Any, dict]], pc_name: str, record: bool = True) -> dict:
+    """
+    Variante groupée : entries = [(n, nom_client, changes), ...].
+    Les lignes sont regroupées par fichier (date + client) puis écrites en UNE session SSH.
+    record=False : entrées déjà versées à l'historique structuré (file asynchrone).
+    """
+    ts = datetime.now()
+    if record:
+        _AUDIT_STORE.record(entries, pc_name, ts)
+    payload_lines: dict[str, list[str]] = {}
+    for n, nom_client, changes in entries:
+        if not changes:
+            continue
+        remote_path = _audit_remote_path(nom_client, ts)
+        payload_lines.setdefault(remote_path, []).extend(
+            _audit_lines(n, nom_client, changes, pc_name, ts)
+        )
+    if not payload_lines:
+        print("[AUDIT] Aucun changement => pas de log.", flush=True)
+        return {"ok": False, "reason": "no_changes"}
+
+    res = _write_audit_payloads({p: "\n".join(L) + "\n" for p, L in payload_lines.items()})
+    res["files"] = sorted(payload_lines)
+    res["lines"] = sum(len(L) for L in payload_lines.values())
+    return res
+
+# -----------------------------------------------------------
+# Audit asynchrone : file + thread d'écriture (1 session SSH par vidage)
+# -----------------------------------------------------------
+import queue as _queue
+
+_AUDIT_QUEUE: "_queue.Queue[tuple[Any, Any, dict, str]]" = _queue.Queue()
+_audit_writer_started = False
+_audit_writer_lock = threading.Lock()
+
+def _audit_writer_loop() -> None:
+    while True:
+        first = _AUDIT_QUEUE.get()
+        pending = [first]
+        # regroupe ce qui arrive dans la foulée → une seule session SSH
+        time.sleep(0.5)
+        while True:
+            try:
+                pending.append(_AUDIT_QUEUE.get_nowait())
+            except _queue.Empty:
+                break
+        by_pc: dict[str, list[tuple[Any, Any, dict]]] = {}
+        for n, nom_client, changes, pc_name in pending:
+            by_pc.setdefault(pc_name, []).append((n, nom_client, changes))
+        for pc_name, entries in by_pc.items():
+            try:
+                write_audit_log_remote_batch(entries, pc_name, record=False)
+            except Exception as e:
+                _log("audit writer error", e)
+        for _ in pending:
+            _AUDIT_QUEUE.task_done()
+
+# PUT /orders/<n> : audit en file plutôt que SFTP dans la requête (forcé en mode asgi)
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "0").strip().lower() in ("1", "true", "oui", "yes")
+
+def audit_log_async(n, nom_client, changes: dict, pc_name: str) -> None:
+    """Met une entrée d'audit en file ; écrite sur le NAS par le thread `audit-writer`."""
+    global _audit_writer_started
+    if not changes:
+        return
+    with _audit_writer_lock:
+        if not _audit_writer_started:
+            threading.Thread(target=_audit_writer_loop, daemon=True, name="audit-writer").start()
+            _audit_writer_started = True
+    _AUDIT_STORE.record([(n, nom_client, changes)], pc_name)
+    _AUDIT_QUEUE.put((n, nom_client, changes, pc_name))
+
+# -----------------------------------------------------------
+# Historique d'audit structuré (table MySQL indexée, écrite par lots)
+# -----------------------------------------------------------
+# Les fichiers texte du NAS restent écrits (et /audit?format=txt les reproduit) ;
+# AUDIT_TABLE répond à "qui a changé quoi et quand" sans balayer les fichiers.
+AUDIT_TABLE = "audit_commandes"
+AUDIT_STORE = os.getenv("AUDIT_STORE", "1").strip().lower() in ("1", "true", "oui", "yes")
+AUDIT_STORE_BATCH = 500            # lignes par executemany
+AUDIT_STORE_MAX_PENDING = 20000    # base injoignable : au-delà, les plus anciennes sont abandonnées (fichiers NAS intacts)
+AUDIT_STORE_RETRY_S = 5.0
+AUDIT_VALUE_MAX = 4000             # caractères gardés par valeur AVANT / APRÈS
+_AUDIT_LINE_RE = re.compile(
+    r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] PC=(.*?) N=(\d+) NOM_CLIENT=(.*?) \| (\w+): '(.*)' -> '(.*)'$"
+)
+
+class _AuditStore:
+    """
+    Événements d'audit (une ligne par colonne modifiée) → AUDIT_TABLE :
+    - record() met en file (aucun aller-retour SQL dans la requête) ; le thread "audit-store"
+      vide la file par executemany de AUDIT_STORE_BATCH lignes
+    - index (N, TS), (TS), (PC, TS), (COLONNE, TS) : /orders/<n>/history et /audit en quelques ms
+    - échec d'écriture : lot remis en tête, nouvel essai après AUDIT_STORE_RETRY_S
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: list[dict] = []
+        self._wake = threading.Event()
+        self._started = False
+        self._ready = False
+        self.written = self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    def ensure(self, conn=None) -> None:
+        if self._ready:
+            return
+        ddl = text(f"""
+            CREATE TABLE IF NOT EXISTS {AUDIT_TABLE} (
+              ID BIGINT NOT NULL AUTO_INCREMENT,
+              TS DATETIME NOT NULL,
+              N INT NOT NULL,
+              NOM_CLIENT VARCHAR(255) NOT NULL DEFAULT '',
+              PC VARCHAR(128) NOT NULL DEFAULT '',
+              COLONNE VARCHAR(64) NOT NULL,
+              AVANT TEXT NULL,
+              APRES TEXT NULL,
+              PRIMARY KEY (ID),
+              KEY idx_audit_n_ts (N, TS),
+              KEY idx_audit_ts (TS),
+              KEY idx_audit_pc_ts (PC, TS),
+              KEY idx_audit_col_ts (COLONNE, TS)
+            ) ENGINE=InnoDB
+        """)
+        if conn is not None:
+            conn.execute(ddl)
+        else:
+            with engine.begin() as c:
+                c.execute(ddl)
+        self._ready = True
+
+    @staticmethod
+    def _value(v) -> Optional[str]:
+        return None if v is None else str(v)[:AUDIT_VALUE_MAX]
+
+    def record(self, entries: list[tuple[Any, Any, dict]], pc_name: str, ts: Optional[datetime] = None) -> None:
+        """entries = [(n, nom_client, {colonne: (avant, après)}), ...] ; ts par défaut : maintenant."""
+        if not AUDIT_STORE:
+            return
+        ts = (ts or datetime.now()).replace(microsecond=0)
+        rows = [{"ts": ts, "n": int(n), "nom": str(nom_client or "")[:255], "pc": str(pc_name or "")[:128],
+                 "col": str(col)[:64], "avant": self._value(old), "apres": self._value(new)}
+                for n, nom_client, changes in entries if n is not None
+                for col, (old, new) in (changes or {}).items()]
+        if not rows:
+            return
+        with self._lock:
+            self._pending.extend(rows)
+            overflow = len(self._pending) - AUDIT_STORE_MAX_PENDING
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+            if not self._started:
+                threading.Thread(target=self._loop, daemon=True, name="audit-store").start()
+                self._started = True
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(0.5)   # regroupe les écritures en rafale
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.last_error = repr(e)
+                _log("audit store error", e)
+                time.sleep(AUDIT_STORE_RETRY_S)
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Écrit tout ce qui est en file ; renvoie le nombre de lignes écrites."""
+        done = 0
+        while True:
+            with self._lock:
+                batch = self._pending[:AUDIT_STORE_BATCH]
+                del self._pending[:AUDIT_STORE_BATCH]
+            if not batch:
+                return done
+            try:
+                with engine.begin() as conn:
+                    self.ensure(conn)
+                    conn.executemany(text(
+                        f"INSERT INTO {AUDIT_TABLE} (TS, N, NOM_CLIENT, PC, COLONNE, AVANT, APRES) "
+                        f"VALUES (:ts, :n, :nom, :pc, :col, :avant, :apres)"), batch)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch   # remis en tête, ordre conservé
+                raise
+            done += len(batch)
+            self.written += len(batch)
+            self.last_error = None
+            _QUERY_CACHE.invalidate(AUDIT_TABLE)
+
+    def backfill(self) -> dict:
+        """
+        Reprise des fichiers texte du NAS (SFTP) : seuls les événements antérieurs au plus ancien
+        déjà en table sont importés → relançable sans doublon.
+        """
+        self.ensure()
+        with engine.connect() as conn:
+            oldest = conn.execute(text(f"SELECT MIN(TS) FROM {AUDIT_TABLE}")).scalar()
+        client, sftp = _open_sftp()
+        files = imported = 0
+        try:
+            for name in sorted(sftp.listdir(AUDIT_REMOTE_DIR)):
+                if not name.endswith(".txt"):
+                    continue
+                files += 1
+                with sftp.open(posixpath.join(AUDIT_REMOTE_DIR, name), "r") as f:
+                    raw = f.read().decode("utf-8", "replace")
+                rows = []
+                for line in raw.splitlines():
+                    m = _AUDIT_LINE_RE.match(line.strip())
+                    if not m:
+                        continue
+                    ts = datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S")
+                    if oldest is not None and ts >= oldest:
+                        continue
+                    rows.append({"ts": ts, "n": int(m.group(3)), "nom": m.group(4)[:255], "pc": m.group(2)[:128],
+                                 "col": m.group(5)[:64], "avant": m.group(6)[:AUDIT_VALUE_MAX],
+                                 "apres": m.group(7)[:AUDIT_VALUE_MAX]})
+                for i in range(0, len(rows), AUDIT_STORE_BATCH):
+                    with engine.begin() as conn:
+                        conn.executemany(text(
+                            f"INSERT INTO {AUDIT_TABLE} (TS, N, NOM_CLIENT, PC, COLONNE, AVANT, APRES) "
+                            f"VALUES (:ts, :n, :nom, :pc, :col, :avant, :apres)"), rows[i:i + AUDIT_STORE_BATCH])
+                imported += len(rows)
+        finally:
+            try:
+                sftp.close()
+                client.close()
+            except Exception:
+                pass
+        _QUERY_CACHE.invalidate(AUDIT_TABLE)
+        return {"files": files, "events": imported, "before": oldest.isoformat(" ") if oldest else None}
+
+    def status(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"enabled": AUDIT_STORE, "pending": pending, "written": self.written,
+                "dropped": self.dropped, "last_error": self.last_error}
+
+_AUDIT_STORE = _AuditStore()
+
+def _audit_page_args() -> tuple[int, int]:
+    try:
+        limit = max(1, min(int(request.args.get("limit", "100")), 1000))
+    except ValueError:
+        limit = 100
+    try:
+        offset = max(int(request.args.get("offset", "0")), 0)
+    except ValueError:
+        offset = 0
+    return limit, offset
+
+def _audit_query(where: list[str], params: dict, limit: int, offset: int) -> tuple[list[dict], int]:
+    """Page d'événements (plus récents d'abord) + total ; COUNT évité si la page n'est pas pleine."""
+    _AUDIT_STORE.ensure()
+    where_sql = (" WHERE " + " AND ".join(where)) if where else ""
+    rows = _cached_rows(text(
+        f"SELECT ID, TS, N, NOM_CLIENT, PC, COLONNE, AVANT, APRES FROM {AUDIT_TABLE}{where_sql} "
+        f"ORDER BY TS DESC, ID DESC LIMIT :limit OFFSET :offset"
+    ), {**params, "limit": limit, "offset": offset}, tables=(AUDIT_TABLE,))
+    rows = [{**r, "TS": r["TS"].isoformat(" ") if isinstance(r["TS"], datetime) else r["TS"]} for r in rows]
+    if len(rows) < limit and (rows or offset == 0):
+        return rows, offset + len(rows)
+    count = _cached_rows(text(f"SELECT COUNT(*) AS total FROM {AUDIT_TABLE}{where_sql}"), params,
+                         tables=(AUDIT_TABLE,))
+    return rows, int((count or [{}])[0].get("total") or 0)
+
+@app.get("/orders/<int:n>/history")
+def get_order_history(n):
+    """Modifications de la commande n (plus récentes d'abord) : ?column=STATUT&limit=100&offset=0."""
+    limit, offset = _audit_page_args()
+    where, params = ["N = :n"], {"n": n}
+    column = (request.args.get("column") or "").strip().upper()
+    if column:
+        where.append("COLONNE = :col")
+        params["col"] = column
+    try:
+        rows, total = _audit_query(where, params, limit, offset)
+        return jsonify({"ok": True, "N": n, "rows": rows, "total": total, "limit": limit, "offset": offset}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+@app.get("/audit")
+def get_audit():
+    """
+    Journal d'audit filtré : ?from=2025-01-01&to=2025-01-31&pc=PC-ATELIER&n=123&column=STATUT
+    - from / to : jours inclus (AAAA-MM-JJ, JJ/MM/AAAA ou AAAA-MM) ; pc / column répétables
+    - format=txt : mêmes lignes que les fichiers du NAS (page courante)
+    """
+    limit, offset = _audit_page_args()
+    where, params = [], {}
+    try:
+        if request.args.get("from"):
+            where.append("TS >= :ts_from")
+            params["ts_from"] = _parse_filter_date(request.args["from"], "from")
+        if request.args.get("to"):
+            d_to = date.fromisoformat(_parse_filter_date(request.args["to"], "to", end=True))
+            where.append("TS < :ts_to")
+            params["ts_to"] = (d_to + timedelta(days=1)).isoformat()
+        if request.args.get("n"):
+            where.append("N = :n")
+            params["n"] = int(request.args["n"])
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    for name, col in (("pc", "PC"), ("column", "COLONNE")):
+        values = _multi_arg(name)
+        if values:
+            in_sql, in_params = _in_clause(values if name == "pc" else [v.upper() for v in values], prefix=name)
+            where.append(f"{col} IN ({in_sql})")
+            params.update(in_params)
+
+    try:
+        rows, total = _audit_query(where, params, limit, offset)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    if (request.args.get("format") or "").lower() == "txt":
+        lines = [_audit_lines(r["N"], r["NOM_CLIENT"], {r["COLONNE"]: (r["AVANT"], r["APRES"])}, r["PC"],
+                              datetime.fromisoformat(r["TS"]))[0] for r in reversed(rows)]
+        return Response("\n".join(lines) + ("\n" if lines else ""), mimetype="text/plain; charset=utf-8")
+    return jsonify({"ok": True, "rows": rows, "total": total, "limit": limit, "offset": offset}), 200
+
+def _norm(s: str) -> str:
+    s = (s or "").strip()
+    try:
+        s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode()
+    except Exception:
+        pass
     return s.lower()
 
     target = _norm(nom)
@@ -708,10 +2318,12 @@ def _norm(s: str) -> str:
                 WHERE LOWER(TRIM(NOM_CLIENT)) = :n
             """), {"n": nom.lower()}).scalar() or 0
 
-            c2 = conn.execute(text("""
-                SELECT COUNT(*) FROM tableau_production_2
+            # commandes : table chaude + archive (un nom archivé reste pris)
+            order_tables = _order_tables()
+            c2 = sum(conn.execute(text(f"""
+                SELECT COUNT(*) FROM {t}
                 WHERE LOWER(TRIM(NOM_CLIENT)) = :n
-            """), {"n": nom.lower()}).scalar() or 0
+            """), {"n": nom.lower()}).scalar() or 0 for t in order_tables)
 
             if c1 == 0:
                 rows = conn.execute(text("""
@@ -721,11 +2333,12 @@ def _norm(s: str) -> str:
                 c1 = sum(1 for (x,) in rows if _norm(x) == target)
 
             if c2 == 0:
-                rows = conn.execute(text("""
-                    SELECT NOM_CLIENT FROM tableau_production_2
-                    WHERE NOM_CLIENT LIKE :like LIMIT 20
-                """), {"like": f"%{nom}%"}).fetchall()
-                c2 = sum(1 for (x,) in rows if _norm(x) == target)
+                for t in order_tables:
+                    rows = conn.execute(text(f"""
+                        SELECT NOM_CLIENT FROM {t}
+                        WHERE NOM_CLIENT LIKE :like LIMIT 20
+                    """), {"like": f"%{nom}%"}).fetchall()
+                    c2 += sum(1 for (x,) in rows if _norm(x) == target)
 
         return jsonify({
             "ok": True,
@@ -738,6 +2351,7 @@ def _norm(s: str) -> str:
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.get("/get-identifiant")
+@serve_stale_on_failure
 def get_identifiant():
     id_param = (request.args.get("id") or "").strip()
     # Limite de sécurité pour éviter de vider la DB si table très grosse
@@ -768,6 +2382,7 @@ def get_identifiant():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.get("/orders/stats")
+@serve_stale_on_failure
 def get_orders_stats():
     """
     Statistiques dashboard :
@@ -840,8 +2455,12 @@ def get_orders_stats():
             FROM tableau_production_2
         """)
 
-        with engine.connect() as conn:
-            row = conn.execute(sql).mappings().first()
+        rows = _mirror_rows(sql)
+        if rows is not None:
+            row = rows[0] if rows else None
+        else:
+            with engine.connect() as conn:
+                row = conn.execute(sql).mappings().first()
 
         stats = dict(row or {})
 
@@ -851,6 +2470,8 @@ def get_orders_stats():
                 stats[key] = int(stats.get(key, 0) or 0)
             except Exception:
                 stats[key] = 0
+        # livrées archivées : hors de tableau_production_2 mais toujours livrées
+        stats["commandes_livrees"] += _archived_delivered_count()
 
         # Normaliser ca_mois en float simple
         ca_val = stats.get("ca_mois", 0)
@@ -869,101 +2490,707 @@ def get_orders_stats():
         app.logger.exception("Error in get_orders_stats")
         return jsonify({"ok": False, "error": str(e)}), 500
 
-@app.get("/orders/modules-evolution")
-def get_orders_modules_evolution():
+# -----------------------------------------------------------
+# Cumul mensuel des modules (graphique "Évolution des commandes")
+# -----------------------------------------------------------
+# ROLLUP_TABLE  : (YM, MODULE) → commandes, modules, montant HT ; MODULE "*" = toutes colonnes MOD
+# ROLLUP_LEDGER : (N, MODULE) → contribution de chaque commande, pour appliquer des deltas exacts
+# Ligne sentinelle (YM "0000-00", MODULE "*") : cumul complet construit (backfill terminé).
+ROLLUP_TABLE = "rollup_modules_mois"
+ROLLUP_LEDGER = "rollup_modules_commandes"
+ROLLUP_TOTAL = "*"
+ROLLUP_BUILT_YM = "0000-00"
+ROLLUP_MODULES = (
+    "MOD10S", "MOD14S", "MOD14SDV", "MOD15S", "MOD21S", "MOD21SDV", "MOD21SPT", "MOD24S", "MOD28S",
+    "MOD10R", "MOD14R", "MOD14RDV", "MOD15R", "MOD21R", "MOD21RDV", "MOD21RPT", "MOD24R", "MOD28R",
+    "MOD21C", "MOD21CDV",
+)
+ROLLUP_MAX_MONTHS = 120
+ROLLUP_CHUNK = 5000
+ROLLUP_RECHECK_S = 30.0   # cumul absent : on revérifie la sentinelle (backfill lancé à part)
+
+_CENT = Decimal("0.01")
+
+def _planning_month(value) -> Optional[str]:
+    """DATE_PLANNING texte (JJ/MM/AAAA, JJ-MM-AAAA, AAAA-MM-JJ, "JJ/MM /AAAA") → "AAAA-MM"."""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m")
+    s = re.sub(r"\s+", "", str(value or ""))
+    for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y-%m")
+        except ValueError:
+            continue
+    return None
+
+def _module_qty(value) -> int:
+    """Quantité MODxx (texte) → entier, comme COALESCE(NULLIF(col,''),0) côté MySQL."""
+    m = re.match(r"\s*(-?\d+(?:[.,]\d+)?)", str(value if value is not None else ""))
+    return int(float(m.group(1).replace(",", "."))) if m else 0
+
+def _amount_value(value) -> Decimal:
+    """MONTANT_HT texte ("1 234,50 €", "1234.5", "") → Decimal (0 si illisible)."""
+    s = re.sub(r"[ €\u202f\u00a0]", "", str(value or "")).replace(",", ".")
+    if s.count(".") > 1:
+        head, _, tail = s.rpartition(".")
+        s = head.replace(".", "") + "." + tail
+    try:
+        return Decimal(s).quantize(_CENT) if s else Decimal(0)
+    except InvalidOperation:
+        return Decimal(0)
+
+def _order_contribution(row: dict) -> dict[tuple[str, str], tuple[int, int, Decimal]]:
     """
-    Données pour le graphique "Évolution des commandes" :
-    - Sur les 6 derniers mois (mois courant inclus)
-    - Pour chaque mois : somme du nombre de modules vendus
-      (toutes les colonnes dont le nom commence par "MOD").
-    """
-    try:
-        # Expression MySQL pour convertir DATE_PLANNING (texte) en date
-        date_expr = "DATE(STR_TO_DATE(REPLACE(TRIM(DATE_PLANNING), '-', '/'), '%d/%m/%Y'))"
-
-        # Somme de toutes les colonnes qui commencent par MODxx...
-        modules_expr = " + ".join([
-            "COALESCE(NULLIF(MOD10S,''),0)",
-            "COALESCE(NULLIF(MOD14S,''),0)",
-            "COALESCE(NULLIF(MOD14SDV,''),0)",
-            "COALESCE(NULLIF(MOD15S,''),0)",
-            "COALESCE(NULLIF(MOD21S,''),0)",
-            "COALESCE(NULLIF(MOD21SDV,''),0)",
-            "COALESCE(NULLIF(MOD21SPT,''),0)",
-            "COALESCE(NULLIF(MOD24S,''),0)",
-            "COALESCE(NULLIF(MOD28S,''),0)",
-            "COALESCE(NULLIF(MOD10R,''),0)",
-            "COALESCE(NULLIF(MOD14R,''),0)",
-            "COALESCE(NULLIF(MOD14RDV,''),0)",
-            "COALESCE(NULLIF(MOD15R,''),0)",
-            "COALESCE(NULLIF(MOD21R,''),0)",
-            "COALESCE(NULLIF(MOD21RDV,''),0)",
-            "COALESCE(NULLIF(MOD21RPT,''),0)",
-            "COALESCE(NULLIF(MOD24R,''),0)",
-            "COALESCE(NULLIF(MOD28R,''),0)",
-            "COALESCE(NULLIF(MOD21C,''),0)",
-            "COALESCE(NULLIF(MOD21CDV,''),0)",
-        ])
+    Contribution d'une commande au cumul : {(YM, MODULE): (commandes, modules, montant)}.
+    Le montant est réparti entre modules au prorata des quantités (somme exacte = ligne "*").
+    """
+    ym = _planning_month(row.get("DATE_PLANNING"))
+    if ym is None:
+        return {}
+    qtys = [(m, _module_qty(row.get(m))) for m in ROLLUP_MODULES]
+    qtys = [(m, q) for m, q in qtys if q]
+    total_q = sum(q for _, q in qtys)
+    amount = _amount_value(row.get("MONTANT_HT"))
+    out = {(ym, ROLLUP_TOTAL): (1, total_q, amount)}
+    left = amount
+    for i, (m, q) in enumerate(qtys):
+        share = left if i == len(qtys) - 1 else (amount * q / total_q).quantize(_CENT)
+        left -= share
+        out[(ym, m)] = (1, q, share)
+    return out
+
+class _ModulesRollup:
+    """
+    - mark(ns) : appelé après COMMIT (on_write) ; le thread `rollup` relit les commandes touchées,
+      compare à leur contribution enregistrée et applique le delta (INSERT ... ON DUPLICATE KEY UPDATE)
+    - ns inconnus (None) → reconstruction complète en tâche de fond
+    - rebuild() : backfill (`python main.py --rollup-backfill`, ou POST /rollup/rebuild → thread `rollup`)
+    - series(a, b) : lignes du cumul pour les mois [a, b], ou None s'il n'est pas construit
+    """
+    _SOURCE_COLS = ("N", "DATE_PLANNING", "MONTANT_HT") + ROLLUP_MODULES
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._work_lock = threading.Lock()
+        self._pending: set[int] = set()
+        self._full = False
+        self._force = False
+        self._wake = threading.Event()
+        self._started = False
+        self._built: Optional[bool] = None
+        self._built_checked_at = 0.0
+        self.applied = self.rebuilds = 0
+        self.last_rebuild_s: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # --- tables ---
+    def _ensure_tables(self, conn) -> None:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+              YM CHAR(7) NOT NULL,
+              MODULE VARCHAR(16) NOT NULL,
+              COMMANDES INT NOT NULL DEFAULT 0,
+              MODULES INT NOT NULL DEFAULT 0,
+              MONTANT_HT DECIMAL(14,2) NOT NULL DEFAULT 0,
+              PRIMARY KEY (YM, MODULE)
+            ) ENGINE=InnoDB
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_LEDGER} (
+              N INT NOT NULL,
+              MODULE VARCHAR(16) NOT NULL,
+              YM CHAR(7) NOT NULL,
+              COMMANDES INT NOT NULL DEFAULT 0,
+              MODULES INT NOT NULL DEFAULT 0,
+              MONTANT_HT DECIMAL(14,2) NOT NULL DEFAULT 0,
+              PRIMARY KEY (N, MODULE)
+            ) ENGINE=InnoDB
+        """))
+
+    def is_built(self) -> bool:
+        if self._built or time.time() - self._built_checked_at < ROLLUP_RECHECK_S:
+            return bool(self._built)
+        self._built_checked_at = time.time()
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    text(f"SELECT 1 FROM {ROLLUP_TABLE} WHERE YM = :ym AND MODULE = :m"),
+                    {"ym": ROLLUP_BUILT_YM, "m": ROLLUP_TOTAL},
+                ).fetchone()
+            self._built = row is not None
+        except Exception as e:
+            if getattr(e, "errno", None) != _ER_NO_SUCH_TABLE:
+                raise
+            self._built = False   # table absente : jamais construit
+        return self._built
+
+    # --- incrémental ---
+    def mark(self, ns, force: bool = False) -> None:
+        with self._lock:
+            if ns is None:
+                self._full = True
+                self._force = self._force or force
+            else:
+                self._pending.update(int(n) for n in ns)
+            if not self._started:
+                threading.Thread(target=self._loop, daemon=True, name="rollup").start()
+                self._started = True
+        self._wake.set()
 
-        sql = text(f"""
-            SELECT
-              DATE_FORMAT({date_expr}, '%Y-%m') AS ym,
-              SUM({modules_expr}) AS modules
-            FROM tableau_production_2
-            WHERE {date_expr} IS NOT NULL
-              AND {date_expr} >= DATE_SUB(DATE_FORMAT(CURDATE(), '%Y-%m-01'), INTERVAL 5 MONTH)
-            GROUP BY ym
-            ORDER BY ym
-        """)
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(0.5)   # regroupe les écritures en rafale
+            self._wake.clear()
+            with self._lock:
+                ns, full, force = sorted(self._pending), self._full, self._force
+                self._pending.clear()
+                self._full = self._force = False
+            try:
+                if not force and not self.is_built():
+                    continue   # rien à maintenir avant le premier backfill
+                if full:
+                    self.rebuild()
+                elif ns:
+                    self.apply(ns)
+            except Exception as e:
+                self.last_error = repr(e)
+                _log("rollup error", e)
+                with self._lock:   # remis en file : réessayé au prochain réveil, rien n'est perdu
+                    self._pending.update(ns)
+                    self._full = self._full or full
+                    self._force = self._force or force
+                time.sleep(ROLLUP_RECHECK_S)
+                self._wake.set()
+
+    def _source_rows(self, conn, where: str, params: dict, table: str = "tableau_production_2") -> list[dict]:
+        cols = ", ".join(self._SOURCE_COLS)
+        return [dict(r) for r in conn.execute(
+            text(f"SELECT {cols} FROM {table} WHERE {where}"), params
+        ).mappings().all()]
+
+    def apply(self, ns: list[int]) -> None:
+        with self._work_lock:
+            for i in range(0, len(ns), 500):
+                chunk = ns[i:i + 500]
+                in_sql, in_params = _in_clause(chunk)
+                with engine.begin() as conn:
+                    old = conn.execute(
+                        text(f"SELECT YM, MODULE, COMMANDES, MODULES, MONTANT_HT FROM {ROLLUP_LEDGER} "
+                             f"WHERE N IN ({in_sql}) FOR UPDATE"), in_params,
+                    ).mappings().all()
+                    delta: dict[tuple[str, str], list] = {}
+                    for r in old:
+                        d = delta.setdefault((r["YM"], r["MODULE"]), [0, 0, Decimal(0)])
+                        d[0] -= int(r["COMMANDES"]); d[1] -= int(r["MODULES"]); d[2] -= Decimal(r["MONTANT_HT"])
+                    ledger = []
+                    # commande archivée : même contribution (l'historique du graphique ne bouge pas)
+                    source = [row for table in _order_tables()
+                              for row in self._source_rows(conn, f"N IN ({in_sql})", in_params, table)]
+                    for row in source:
+                        for (ym, m), (c, q, a) in _order_contribution(row).items():
+                            ledger.append({"n": row["N"], "m": m, "ym": ym, "c": c, "q": q, "a": a})
+                            d = delta.setdefault((ym, m), [0, 0, Decimal(0)])
+                            d[0] += c; d[1] += q; d[2] += a
+                    conn.execute(text(f"DELETE FROM {ROLLUP_LEDGER} WHERE N IN ({in_sql})"), in_params)
+                    if ledger:
+                        conn.executemany(text(
+                            f"INSERT INTO {ROLLUP_LEDGER} (N, MODULE, YM, COMMANDES, MODULES, MONTANT_HT) "
+                            f"VALUES (:n, :m, :ym, :c, :q, :a)"), ledger)
+                    self._add(conn, delta)
+                self.applied += len(chunk)
+        _QUERY_CACHE.invalidate(ROLLUP_TABLE)
+
+    @staticmethod
+    def _add(conn, delta: dict) -> None:
+        rows = [{"ym": ym, "m": m, "c": c, "q": q, "a": a}
+                for (ym, m), (c, q, a) in delta.items() if c or q or a]
+        if rows:
+            conn.executemany(text(f"""
+                INSERT INTO {ROLLUP_TABLE} (YM, MODULE, COMMANDES, MODULES, MONTANT_HT)
+                VALUES (:ym, :m, :c, :q, :a)
+                ON DUPLICATE KEY UPDATE
+                  COMMANDES = COMMANDES + VALUES(COMMANDES),
+                  MODULES = MODULES + VALUES(MODULES),
+                  MONTANT_HT = MONTANT_HT + VALUES(MONTANT_HT)
+            """), rows)
+
+    # --- backfill ---
+    def rebuild(self) -> dict:
+        """Reconstruction complète par tranches de N ; la sentinelle n'est posée qu'à la fin."""
+        with self._work_lock:
+            t0 = time.time()
+            self._built = False
+            with engine.begin() as conn:
+                self._ensure_tables(conn)
+                conn.execute(text(f"DELETE FROM {ROLLUP_TABLE}"))
+                conn.execute(text(f"DELETE FROM {ROLLUP_LEDGER}"))
+            totals: dict[tuple[str, str], list] = {}
+            scanned = 0
+            for table in _order_tables():   # table chaude puis archive
+                last_n = -1
+                while True:
+                    with engine.begin() as conn:
+                        rows = self._source_rows(conn, "N > :last ORDER BY N LIMIT :lim",
+                                                 {"last": last_n, "lim": ROLLUP_CHUNK}, table)
+                        if not rows:
+                            break
+                        ledger = []
+                        for row in rows:
+                            for (ym, m), (c, q, a) in _order_contribution(row).items():
+                                ledger.append({"n": row["N"], "m": m, "ym": ym, "c": c, "q": q, "a": a})
+                                t = totals.setdefault((ym, m), [0, 0, Decimal(0)])
+                                t[0] += c; t[1] += q; t[2] += a
+                        if ledger:
+                            conn.executemany(text(
+                                f"INSERT INTO {ROLLUP_LEDGER} (N, MODULE, YM, COMMANDES, MODULES, MONTANT_HT) "
+                                f"VALUES (:n, :m, :ym, :c, :q, :a)"), ledger)
+                    last_n = rows[-1]["N"]
+                    scanned += len(rows)
+            with engine.begin() as conn:
+                self._add(conn, totals)
+                conn.execute(
+                    text(f"INSERT INTO {ROLLUP_TABLE} (YM, MODULE, COMMANDES) VALUES (:ym, :m, :c)"),
+                    {"ym": ROLLUP_BUILT_YM, "m": ROLLUP_TOTAL, "c": scanned},
+                )
+            self._built = True
+            self.rebuilds += 1
+            self.last_rebuild_s = round(time.time() - t0, 2)
+            self.last_error = None
+        _QUERY_CACHE.invalidate(ROLLUP_TABLE)
+        return {"orders": scanned, "cells": len(totals), "seconds": self.last_rebuild_s}
+
+    # --- lecture ---
+    def series(self, ym_from: str, ym_to: str) -> Optional[list[dict]]:
+        if not self.is_built():
+            return None
+        return _cached_rows(
+            text(f"SELECT YM, MODULE, COMMANDES, MODULES, MONTANT_HT FROM {ROLLUP_TABLE} "
+                 f"WHERE YM BETWEEN :a AND :b"),
+            {"a": ym_from, "b": ym_to}, tables=(ROLLUP_TABLE,),
+        )
 
-        with engine.connect() as conn:
-            rows = conn.execute(sql).mappings().all()
+    def status(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"built": bool(self._built), "pending": pending, "rebuilding": self._work_lock.locked(),
+                "applied": self.applied,
+                "rebuilds": self.rebuilds, "last_rebuild_s": self.last_rebuild_s,
+                "last_error": self.last_error}
 
-        # Indexe les résultats par clé "YYYY-MM"
-        modules_by_ym = {row["ym"]: int(row["modules"] or 0) for row in rows}
+_ROLLUP = _ModulesRollup()
 
-        # Construit la liste des 6 derniers mois (du plus ancien au plus récent)
-        MONTH_LABELS = ["Jan", "Fév", "Mar", "Avr", "Mai", "Juin",
-                        "Juil", "Août", "Sept", "Oct", "Nov", "Déc"]
+@on_write
+def _rollup_on_write(table, ns):
+    if table == "tableau_production_2":
+        _ROLLUP.mark(ns)
 
-        from datetime import date
+@app.post("/rollup/rebuild")
+def rebuild_rollup():
+    """Backfill du cumul mensuel en tâche de fond (suivi : /health → "rollup")."""
+    _ROLLUP.mark(None, force=True)
+    return jsonify({"ok": True, "queued": True, "rollup": _ROLLUP.status()}), 202
+
+@app.get("/orders/modules-evolution")
+@serve_stale_on_failure
+def get_orders_modules_evolution():
+    """
+    Données pour le graphique "Évolution des commandes" :
+    - période : ?months=N (défaut 6, mois courant inclus) ou ?from=AAAA-MM&to=AAAA-MM (bornes incluses)
+    - pour chaque mois : nombre de modules vendus (toutes les colonnes MOD), commandes, montant HT
+    - ?modules=MOD10S,MOD21C (ou "all") : détail par type de module dans "by_module"
+    - lu dans le cumul mensuel (taille fixe, quel que soit le volume de la table) ;
+      tant qu'il n'est pas construit : balayage de tableau_production_2 ("source": "scan")
+    """
+    try:
+        months = _evolution_months(request.args)
+        modules = _evolution_modules(request.args.get("modules"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-        today = date.today()
-        base = today.replace(day=1)
-        months = []
-        y, m = base.year, base.month
-        for _ in range(6):
-            months.append(date(y, m, 1))
-            m -= 1
-            if m == 0:
-                y -= 1
-                m = 12
-        months.reverse()
+    try:
+        ym_from, ym_to = months[0].strftime("%Y-%m"), months[-1].strftime("%Y-%m")
+        rows = _ROLLUP.series(ym_from, ym_to)
+        source = "rollup"
+        if rows is None:
+            rows = _modules_scan(ym_from, ym_to)
+            source = "scan"
+        cells = {(r["YM"], r["MODULE"]): r for r in rows}
 
         items = []
         for d in months:
             ym = d.strftime("%Y-%m")
-            label = MONTH_LABELS[d.month - 1]
-            modules = int(modules_by_ym.get(ym, 0))
-            items.append({
-                "month": ym,      # ex: "2025-03"
-                "label": label,   # ex: "Mar"
-                "modules": modules,
-            })
-
-        return jsonify({"ok": True, "items": items}), 200
+            total = cells.get((ym, ROLLUP_TOTAL)) or {}
+            item = {
+                "month": ym,                              # ex: "2025-03"
+                "label": MONTH_LABELS[d.month - 1],       # ex: "Mar"
+                "modules": int(total.get("MODULES") or 0),
+                "commandes": int(total.get("COMMANDES") or 0),
+                "montant_ht": float(total.get("MONTANT_HT") or 0),
+            }
+            if modules:
+                item["by_module"] = {
+                    m: int((cells.get((ym, m)) or {}).get("MODULES") or 0) for m in modules
+                }
+            items.append(item)
+
+        return jsonify({"ok": True, "items": items, "source": source}), 200
 
     except Exception as e:
         app.logger.exception("Error in get_orders_modules_evolution")
         return jsonify({"ok": False, "error": str(e)}), 500
 
+MONTH_LABELS = ["Jan", "Fév", "Mar", "Avr", "Mai", "Juin",
+                "Juil", "Août", "Sept", "Oct", "Nov", "Déc"]
+
+def _add_months(d: date, k: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + k, 12)
+    return date(y, m + 1, 1)
+
+def _evolution_months(args) -> list[date]:
+    """?months=N ou ?from/&to (AAAA-MM) → premiers jours des mois, du plus ancien au plus récent."""
+    def _ym(value: str, name: str) -> date:
+        m = re.fullmatch(r"(\d{4})-(\d{2})", value.strip())
+        if not m or not 1 <= int(m.group(2)) <= 12:
+            raise ValueError(f"{name} attendu au format AAAA-MM")
+        return date(int(m.group(1)), int(m.group(2)), 1)
+
+    try:
+        n = int(args.get("months") or 6)
+    except ValueError:
+        raise ValueError("months doit être un entier") from None
+    n = max(1, min(n, ROLLUP_MAX_MONTHS))
+    end = _ym(args["to"], "to") if args.get("to") else date.today().replace(day=1)
+    start = _ym(args["from"], "from") if args.get("from") else _add_months(end, -(n - 1))
+    if start > end:
+        raise ValueError("from postérieur à to")
+    count = (end.year - start.year) * 12 + end.month - start.month + 1
+    if count > ROLLUP_MAX_MONTHS:
+        raise ValueError(f"période limitée à {ROLLUP_MAX_MONTHS} mois")
+    return [_add_months(start, k) for k in range(count)]
+
+def _evolution_modules(raw) -> list[str]:
+    """?modules=MOD10S,MOD21C | all → colonnes détaillées (liste blanche ROLLUP_MODULES)."""
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    if raw.lower() == "all":
+        return list(ROLLUP_MODULES)
+    wanted = [m.strip().upper() for m in raw.split(",") if m.strip()]
+    unknown = [m for m in wanted if m not in ROLLUP_MODULES]
+    if unknown:
+        raise ValueError(f"module(s) inconnu(s) : {', '.join(unknown)}")
+    return wanted
+
+def _modules_scan(ym_from: str, ym_to: str) -> list[dict]:
+    """Repli sans cumul : mêmes cellules (YM, MODULE) calculées par balayage (archive comprise)."""
+    source, tables = _orders_source(True)
+    ym_expr = f"DATE_FORMAT({_sql_text_date('DATE_PLANNING')}, '%Y-%m')"
+    qty = {m: f"COALESCE(NULLIF({m},''),0)" for m in ROLLUP_MODULES}
+    amount = _sql_text_amount("MONTANT_HT")
+    per_module = ",\n              ".join(f"SUM({expr}) AS {m}" for m, expr in qty.items())
+    sql = text(f"""
+        SELECT
+          {ym_expr} AS ym,
+          COUNT(*) AS commandes,
+          SUM({" + ".join(qty.values())}) AS modules,
+          SUM({amount}) AS montant_ht,
+          {per_module}
+        FROM {source}
+        GROUP BY ym
+        HAVING ym BETWEEN :a AND :b
+    """)
+    cells = []
+    for r in _read_rows(sql, {"a": ym_from, "b": ym_to}, tables):
+        cells.append({"YM": r["ym"], "MODULE": ROLLUP_TOTAL, "COMMANDES": r["commandes"],
+                      "MODULES": r["modules"], "MONTANT_HT": r["montant_ht"]})
+        cells.extend({"YM": r["ym"], "MODULE": m, "MODULES": r[m]} for m in ROLLUP_MODULES if r[m])
+    return cells
+
+# -----------------------------------------------------------
+# GET /analytics : agrégats à la demande (spec en liste blanche → UNE requête groupée)
+# -----------------------------------------------------------
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_CACHE_MAX = 64
+ANALYTICS_MAX_GROUP_BY = 3
+ANALYTICS_MAX_ROWS = 1000
+
+def _sql_text_date(col: str) -> str:
+    """Colonne date stockée en texte (JJ/MM/AAAA, JJ-MM-AAAA, AAAA-MM-JJ, espaces parasites) → DATE SQL."""
+    d = f"REPLACE(TRIM({col}), ' ', '')"
+    return (f"(CASE WHEN {d} LIKE '____-__-__' THEN STR_TO_DATE({d}, '%Y-%m-%d') "
+            f"ELSE STR_TO_DATE(REPLACE({d}, '-', '/'), '%d/%m/%Y') END)")
+
+def _sql_text_amount(col: str) -> str:
+    """Montant stocké en texte ("1 234,50 €") → DECIMAL SQL."""
+    return (f"CAST(REPLACE(REPLACE(REPLACE(COALESCE(TRIM({col}), ''), '€', ''), ' ', ''), ',', '.') "
+            f"AS DECIMAL(12,2))")
+
+_PLANNING = _sql_text_date("DATE_PLANNING")
+_LIVRAISON = _sql_text_date("DATE_LIVRAISON")
+_LEAD_DAYS = f"DATEDIFF({_LIVRAISON}, {_PLANNING})"
+
+# clé d'API → expression SQL (aucune saisie utilisateur n'entre dans le SQL)
+ANALYTICS_DIMENSIONS = {
+    "commercial":     "NULLIF(TRIM(NOM_COMMERCIAL), '')",
+    "marketing":      "NULLIF(TRIM(MARKETING), '')",
+    "mode_paiement":  "NULLIF(TRIM(MODE_PAIEMENT), '')",
+    "statut":         "NULLIF(UPPER(TRIM(STATUT)), '')",
+    "pays":           "NULLIF(TRIM(PAYS), '')",
+    "geographie":     "NULLIF(TRIM(GEOGRAPHIE), '')",
+    "transport":      "NULLIF(TRIM(TRANSPORT), '')",
+    "type_connexion": "NULLIF(TRIM(TYPE_DE_CONNEXION), '')",
+    "mois":           f"DATE_FORMAT({_PLANNING}, '%Y-%m')",
+    "annee":          f"DATE_FORMAT({_PLANNING}, '%Y')",
+}
+ANALYTICS_METRICS = {
+    "commandes":          "COUNT(*)",
+    "ca_ht":              f"SUM({_sql_text_amount('MONTANT_HT')})",
+    "panier_moyen":       f"AVG({_sql_text_amount('MONTANT_HT')})",
+    "modules":            "SUM(" + " + ".join(f"COALESCE(NULLIF({m},''),0)" for m in ROLLUP_MODULES) + ")",
+    "livrees":            "SUM(CASE WHEN UPPER(TRIM(STATUT)) IN ('LIVREE','LIVRÉE','LIVRE') THEN 1 ELSE 0 END)",
+    "delai_moyen_j":      f"AVG({_LEAD_DAYS})",     # DATE_PLANNING → DATE_LIVRAISON (commandes datées des deux côtés)
+    "delai_max_j":        f"MAX({_LEAD_DAYS})",
+    "delai_mesures":      f"COUNT({_LEAD_DAYS})",
+}
+
+def _analytics_spec(args) -> tuple:
+    """Paramètres → spec normalisée (clé de cache) ; ValueError si hors liste blanche."""
+    def _keys(raw, allowed, name):
+        keys = []
+        for k in (raw or "").split(","):
+            k = k.strip().lower()
+            if not k:
+                continue
+            if k not in allowed:
+                raise ValueError(f"{name} inconnu : {k} (possibles : {', '.join(allowed)})")
+            if k not in keys:
+                keys.append(k)
+        return tuple(keys)
+
+    group_by = _keys(",".join(args.getlist("group_by")), ANALYTICS_DIMENSIONS, "group_by")
+    if len(group_by) > ANALYTICS_MAX_GROUP_BY:
+        raise ValueError(f"group_by : {ANALYTICS_MAX_GROUP_BY} dimensions au plus")
+    metrics = _keys(",".join(args.getlist("metrics")), ANALYTICS_METRICS, "metrics") or ("commandes",)
+
+    bounds = []
+    for name in ("from", "to"):
+        raw = (args.get(name) or "").strip()
+        if not raw:
+            bounds.append(None)
+            continue
+        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m"):
+            try:
+                d = datetime.strptime(raw, fmt).date()
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"{name} : date attendue (AAAA-MM-JJ, JJ/MM/AAAA ou AAAA-MM)")
+        if name == "to" and len(raw) == 7:
+            d = _add_months(d, 1) - timedelta(days=1)   # "2025-03" → fin de mois
+        bounds.append(d.isoformat())
+    if bounds[0] and bounds[1] and bounds[0] > bounds[1]:
+        raise ValueError("from postérieur à to")
+    return group_by, metrics, bounds[0], bounds[1], _include_archived(args)
+
+def _analytics_sql(spec: tuple) -> tuple[Any, dict]:
+    group_by, metrics, d_from, d_to, archived = spec
+    select = [f"{ANALYTICS_DIMENSIONS[k]} AS {k}" for k in group_by]
+    select += [f"{ANALYTICS_METRICS[k]} AS {k}" for k in metrics]
+    where, params = [], {}
+    if d_from:
+        where.append(f"{_PLANNING} >= :d_from")
+        params["d_from"] = d_from
+    if d_to:
+        where.append(f"{_PLANNING} <= :d_to")
+        params["d_to"] = d_to
+    sql = "SELECT " + ",\n  ".join(select) + "\nFROM " + _orders_source(archived)[0]
+    if where:
+        sql += "\nWHERE " + " AND ".join(where)
+    if group_by:
+        sql += "\nGROUP BY " + ", ".join(group_by) + "\nORDER BY " + ", ".join(group_by)
+        sql += f"\nLIMIT {ANALYTICS_MAX_ROWS + 1}"
+    return text(sql), params
+
+def _json_number(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+_ANALYTICS_CACHE = _QueryCache(ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_MAX)
+
+@on_write
+def _analytics_on_write(table, ns):
+    _ANALYTICS_CACHE.invalidate(table)
+
+@app.get("/analytics")
+@serve_stale_on_failure
+def get_analytics():
+    """
+    Agrégats sur tableau_production_2 en UN passage :
+        GET /analytics?group_by=commercial,mois&metrics=ca_ht,commandes,delai_moyen_j&from=2025-01&to=2025-06
+    - group_by : ANALYTICS_DIMENSIONS (3 au plus ; aucun = une seule ligne de totaux)
+    - metrics  : ANALYTICS_METRICS (défaut : commandes)
+    - from/to  : bornes sur DATE_PLANNING (incluses)
+    - include_archived=1 : commandes archivées comprises
+    Résultat gardé ANALYTICS_CACHE_TTL s par spec, invalidé par les écritures de commandes.
+    """
+    try:
+        spec = _analytics_spec(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    try:
+        sql, params = _analytics_sql(spec)
+        tables = _orders_source(spec[-1])[1]
+        rows = _ANALYTICS_CACHE.get_or_load(
+            ("analytics",) + spec, lambda: _read_rows(sql, params, tables), tables
+        )
+        out = [{k: _json_number(v) for k, v in r.items()} for r in rows[:ANALYTICS_MAX_ROWS]]
+        group_by, metrics, d_from, d_to, archived = spec
+        return jsonify({
+            "ok": True,
+            "group_by": list(group_by),
+            "metrics": list(metrics),
+            "from": d_from,
+            "to": d_to,
+            "include_archived": archived,
+            "rows": out,
+            "truncated": len(rows) > ANALYTICS_MAX_ROWS,
+        }), 200
+    except Exception as e:
+        app.logger.exception("Error in get_analytics")
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# Filtres de la liste des commandes : alias de statut → valeurs stockées
+_ORDER_STATUS_GROUPS = {
+    "en_cours": ("EN ATTENTE", "EN ATTENTE - PRODUCTION", "EN ATTENTE DE PRODUCTION", "EN PRODUCTION"),
+    "stock": ("EN STOCK",),
+    "livre": ("LIVREE", "LIVRÉE", "LIVRE", "LIVRÉ"),
+}
+_ORDER_STATUS_ALIASES = {
+    "en_cours": "en_cours", "en cours": "en_cours", "progress": "en_cours",
+    "stock": "stock", "en_stock": "stock", "en stock": "stock",
+    "livre": "livre", "livrée": "livre", "livree": "livre", "delivered": "livre",
+}
+# date_field= : colonnes dates (texte) filtrables par from/to
+_ORDER_DATE_FIELDS = {
+    "planning": "DATE_PLANNING",
+    "livraison": "DATE_LIVRAISON",
+    "livraison_prevue": "LIVRAISON_PREVUE",
+    "production": "DATE_PRODUCTION",
+    "stock": "DATE_STOCK",
+}
+
+def _multi_arg(name: str, args=None) -> list[str]:
+    """?x=a&x=b et ?x=a,b → ["a", "b"] (vides et doublons retirés, ordre conservé)."""
+    out: list[str] = []
+    for raw in (request.args if args is None else args).getlist(name):
+        for v in raw.split(","):
+            v = v.strip()
+            if v and v not in out:
+                out.append(v)
+    return out
+
+def _status_values(wanted: list[str]) -> list[str]:
+    """Alias (en_cours, stock, livre…) et statuts exacts → valeurs (majuscules) pour UPPER(TRIM(STATUT)) IN (...)."""
+    values: list[str] = []
+    for v in wanted:
+        group = _ORDER_STATUS_ALIASES.get(v.lower())
+        if group:
+            candidates = _ORDER_STATUS_GROUPS[group]
+        else:
+            plain = unicodedata.normalize("NFKD", v).encode("ascii", "ignore").decode()
+            candidates = (v.upper(), plain.upper())
+        values.extend(c for c in candidates if c not in values)
+    return values
+
+def _parse_filter_date(raw: str, name: str, end: bool = False) -> str:
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m"):
+        try:
+            d = datetime.strptime(raw.strip(), fmt).date()
+        except ValueError:
+            continue
+        if end and fmt == "%Y-%m":
+            d = _add_months(d, 1) - timedelta(days=1)
+        return d.isoformat()
+    raise ValueError(f"{name} : date attendue (AAAA-MM-JJ, JJ/MM/AAAA ou AAAA-MM)")
+
+def _orders_where(args) -> tuple[str, dict]:
+    """
+    Filtres communs de /orders et /export/orders → (" WHERE ...", params).
+    Paramètre invalide (date_field, date) → ValueError (400).
+    """
+    statuses    = _multi_arg("status", args)
+    marketing   = _multi_arg("marketing", args)
+    commercials = _multi_arg("commercial", args)
+    q           = (args.get("q") or "").strip()
+    n_param     = (args.get("n") or "").strip()
+    date_field  = (args.get("date_field") or "planning").strip().lower()
+
+    if date_field not in _ORDER_DATE_FIELDS:
+        raise ValueError(f"date_field inconnu : {date_field} (possibles : {', '.join(_ORDER_DATE_FIELDS)})")
+    d_from = _parse_filter_date(args["from"], "from") if args.get("from") else None
+    d_to = _parse_filter_date(args["to"], "to", end=True) if args.get("to") else None
+
+    where, params = [], {}
+    if n_param:
+        where.append("N = :n")
+        params["n"] = n_param
+
+    # ---- Filtres de statut (plusieurs valeurs → un seul IN) ----
+    # UPPER(TRIM()) : saisies avec espaces / casse mêlée, mêmes lignes côté MySQL et miroir SQLite
+    if statuses:
+        in_sql, in_params = _in_clause(_status_values(statuses), prefix="st")
+        where.append(f"UPPER(TRIM(STATUT)) IN ({in_sql})")
+        params.update(in_params)
+
+    # ---- Filtre Marketing ----
+    if marketing:
+        in_sql, in_params = _in_clause([m.upper() for m in marketing], prefix="mk")
+        where.append(f"MARKETING IN ({in_sql})")
+        params.update(in_params)
+
+    # ---- Commercial ----
+    if commercials:
+        in_sql, in_params = _in_clause(commercials, prefix="cm")
+        where.append(f"NOM_COMMERCIAL IN ({in_sql})")
+        params.update(in_params)
+
+    # ---- Période (dates stockées en texte : convertie, puis bornée) ----
+    if d_from or d_to:
+        d_expr = _sql_text_date(_ORDER_DATE_FIELDS[date_field])
+        if d_from:
+            where.append(f"{d_expr} >= :d_from")
+            params["d_from"] = d_from
+        if d_to:
+            where.append(f"{d_expr} <= :d_to")
+            params["d_to"] = d_to
+
+    # ---- Recherche simple ----
+    if q:
+        where.append("(NOM_CLIENT LIKE :q OR N_CLIENT LIKE :q OR CONTACT_CLIENT LIKE :q OR STATUT LIKE :q)")
+        params["q"] = f"%{q}%"
+
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
 @app.get("/orders")
+@serve_stale_on_failure
 def get_orders():
-    status     = (request.args.get("status") or "").strip()
-    marketing  = (request.args.get("marketing") or "").strip()
-    q          = (request.args.get("q") or "").strip()
-    n_param    = (request.args.get("n") or "").strip()
-
+    """
+    Liste paginée des commandes, filtrée côté serveur :
+    - status     : répétable ou liste "a,b" ; alias en_cours / stock / livre, ou statut exact
+    - marketing  : répétable (OUI, NON…)
+    - commercial : répétable (NOM_COMMERCIAL)
+    - from / to  : bornes incluses sur date_field (planning par défaut, livraison, livraison_prevue…)
+    - q          : recherche (client, n° client, contact, statut)
+    - n          : une commande précise
+    - include_archived=1 : commandes archivées comprises (vue table chaude + archive)
+    Renvoie "rows" (page limit/offset) et "total" (nombre de commandes correspondant aux filtres).
+    STATUT / MARKETING / NOM_COMMERCIAL IN (...) : comparaisons directes sur la colonne (index utilisable),
+    la collation *_ci de MySQL absorbe la casse ; les alias listent aussi les variantes accentuées.
+    """
     # bornes sûres
     try:
         limit = int(request.args.get("limit", "500"))
@@ -976,120 +3203,709 @@ def get_orders():
         offset = 0
 
     try:
+        where_sql, params = _orders_where(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    try:
+        source, tables = _orders_source(_include_archived(request.args))
+        sql = text(f"""
+            SELECT
+                N,
+                STATUT,
+                N_CLIENT,
+                NOM_CLIENT,
+                NOM_COMMERCIAL,
+                CONTACT_CLIENT,
+                MONTANT_HT,
+                REMARQUES,
+                MARKETING
+            FROM {source}
+            {where_sql}
+            ORDER BY N DESC LIMIT :limit OFFSET :offset
+        """)
+        rows = _cached_rows(sql, {**params, "limit": limit, "offset": offset}, tables)
+
+        # total : inutile de compter si la page n'est pas pleine
+        if len(rows) < limit and (rows or offset == 0):
+            total = offset + len(rows)
+        else:
+            count_sql = text(f"SELECT COUNT(*) AS total FROM {source}{where_sql}")
+            total = int((_cached_rows(count_sql, params, tables) or [{}])[0].get("total") or 0)
+
+        return jsonify({"ok": True, "rows": rows, "total": total, "limit": limit, "offset": offset}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# -----------------------------------------------------------
+# Archivage des commandes livrées (table d'archive + vue UNION ALL)
+# -----------------------------------------------------------
+# ARCHIVE_TABLE : même structure que tableau_production_2 (CREATE TABLE ... LIKE), N conservé
+# ARCHIVE_VIEW  : table chaude UNION ALL archive, pour les lectures d'historique (include_archived=1)
+ARCHIVE_TABLE = "tableau_production_2_archive"
+ARCHIVE_VIEW = "tableau_production_2_tout"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))   # livrée depuis plus de N jours
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))             # commandes déplacées par transaction
+ARCHIVE_INTERVAL_H = float(os.getenv("ARCHIVE_INTERVAL_H", "0"))   # passage planifié ; 0 = désactivé
+ARCHIVE_PAUSE_S = 0.2            # entre deux lots : laisse passer les écritures des postes
+ARCHIVE_RECHECK_S = 60.0         # archive absente : revérifiée au plus toutes les 60 s
+ARCHIVE_DRY_RUN_SAMPLE = 20
+
+class _OrderArchive:
+    """
+    Déplace les commandes LIVREE depuis plus de ARCHIVE_AFTER_DAYS jours vers ARCHIVE_TABLE :
+    - run(dry_run=True) : compte et échantillon, aucune écriture
+    - run() : lots de ARCHIVE_BATCH N, chacun dans UNE transaction (INSERT ... SELECT puis DELETE) ;
+      candidats lus sans verrou, condition revérifiée à l'INSERT (commande modifiée entre-temps → laissée)
+    - restore(ns) / restore(None) : chemin inverse, par lots
+    - la commande de N maximal n'est jamais archivée (AUTO_INCREMENT recalculé au redémarrage du serveur
+      sur les anciennes versions : un N archivé ne doit pas pouvoir être réattribué)
+    - thread "archive" si ARCHIVE_INTERVAL_H > 0 (plusieurs backends : sans conflit, un N déplacé n'est
+      plus candidat et l'INSERT doublon annule le lot)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._exists: Optional[bool] = None
+        self._checked_at = 0.0
+        self._started = False
+        self.moved = self.restored = 0
+        self.last_run: Optional[dict] = None
+        self.last_error: Optional[str] = None
+
+    # --- structure ---
+    def exists(self) -> bool:
+        """Archive (et vue) en place ; mis en cache, revérifié toutes les ARCHIVE_RECHECK_S s si absente."""
+        if self._exists or time.time() - self._checked_at < ARCHIVE_RECHECK_S:
+            return bool(self._exists)
+        self._checked_at = time.time()
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(text(
+                    "SELECT COUNT(*) FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (:t, :v)"
+                ), {"t": ARCHIVE_TABLE, "v": ARCHIVE_VIEW}).fetchone()
+            self._exists = bool(row and int(row[0]) == 2)
+        except Exception:
+            self._exists = False
+        return self._exists
+
+    def ensure(self) -> None:
+        """Crée l'archive si besoin, vérifie qu'elle a les colonnes de la table chaude, (re)crée la vue."""
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} LIKE tableau_production_2"))
+            rows = conn.execute(text(
+                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (:h, :a) ORDER BY TABLE_NAME, ORDINAL_POSITION"
+            ), {"h": "tableau_production_2", "a": ARCHIVE_TABLE}).fetchall()
+            hot = [(c, t) for tbl, c, t in rows if tbl == "tableau_production_2"]
+            arc = [(c, t) for tbl, c, t in rows if tbl == ARCHIVE_TABLE]
+            if hot != arc:
+                diff = sorted({c for c, _ in set(hot) ^ set(arc)})
+                raise RuntimeError(f"{ARCHIVE_TABLE} diffère de tableau_production_2 ({', '.join(diff) or 'ordre'}) : "
+                                   f"appliquer le même ALTER TABLE à l'archive")
+            conn.execute(text(f"CREATE OR REPLACE VIEW {ARCHIVE_VIEW} AS "
+                              f"SELECT * FROM tableau_production_2 UNION ALL SELECT * FROM {ARCHIVE_TABLE}"))
+        self._exists = True
+
+    # --- critères ---
+    @staticmethod
+    def _candidates(days: int) -> tuple[str, dict]:
+        in_sql, params = _in_clause(_ORDER_STATUS_GROUPS["livre"], prefix="lv")
+        where = (f"UPPER(TRIM(STATUT)) IN ({in_sql}) "
+                 f"AND {_sql_text_date('DATE_LIVRAISON')} < CURDATE() - INTERVAL :days DAY")
+        return where, {**params, "days": int(days)}
+
+    def preview(self, days: int) -> dict:
+        where, params = self._candidates(days)
         with engine.connect() as conn:
-            base_sql = """
-                SELECT
-                    N,
-                    STATUT,
-                    N_CLIENT,
-                    NOM_CLIENT,
-                    NOM_COMMERCIAL,
-                    CONTACT_CLIENT,
-                    MONTANT_HT,
-                    REMARQUES,
-                    MARKETING
-                FROM tableau_production_2
-            """
-            where, params = [], {}
-
-            if n_param:
-                where.append("N = :n")
-                params["n"] = n_param
-
-            # ---- Filtres de statut ----
-            s = status.lower()
-            if s in {"en_cours", "en cours", "progress"}:
-                # mêmes statuts que pour les stats dashboard
-                where.append("""
-                    UPPER(TRIM(STATUT)) IN (
-                        'EN ATTENTE',
-                        'EN ATTENTE - PRODUCTION',
-                        'EN ATTENTE DE PRODUCTION',
-                        'EN PRODUCTION'
-                    )
-                """)
-            elif s in {"stock", "en_stock", "en stock"}:
-                where.append("UPPER(TRIM(STATUT)) = 'EN STOCK'")
-            elif s in {"livre", "livrée", "livree", "delivered"}:
-                where.append("UPPER(TRIM(STATUT)) IN ('LIVREE','LIVRÉE','LIVRE')")
-            elif status:
-                # fallback: filtre brut si tu passes un statut exact dans l’URL
-                where.append("STATUT = :status")
-                params["status"] = status
-
-
-            # ---- Filtre Marketing ----
-            if marketing:
-                where.append("UPPER(MARKETING) = :marketing")
-                params["marketing"] = marketing.strip().upper()  # ex: OUI / NON
-
-            # ---- Recherche simple ----
-            if q:
-                where.append("(NOM_CLIENT LIKE :q OR N_CLIENT LIKE :q)")
-                params["q"] = f"%{q}%"
-
-            sql = text(
-                base_sql
-                + (" WHERE " + " AND ".join(where) if where else "")
-                + " ORDER BY N DESC LIMIT :limit OFFSET :offset"
+            stats = conn.execute(text(
+                f"SELECT COUNT(*) AS n, MIN(N) AS n_min, MAX(N) AS n_max FROM tableau_production_2 "
+                f"WHERE {where} AND N < (SELECT MAX(N) FROM tableau_production_2)"
+            ), params).mappings().first() or {}
+            sample = conn.execute(text(
+                f"SELECT N, NOM_CLIENT, STATUT, DATE_LIVRAISON FROM tableau_production_2 "
+                f"WHERE {where} ORDER BY N LIMIT {ARCHIVE_DRY_RUN_SAMPLE}"
+            ), params).mappings().all()
+        return {"dry_run": True, "days": days, "candidates": int(stats.get("n") or 0),
+                "n_min": stats.get("n_min"), "n_max": stats.get("n_max"), "sample": [dict(r) for r in sample]}
+
+    # --- déplacement ---
+    def _move(self, src: str, dst: str, ns: list[int], recheck: Optional[tuple[str, dict]] = None) -> list[int]:
+        """ns de src → dst dans UNE transaction ; renvoie les N effectivement déplacés."""
+        in_sql, in_params = _in_clause(ns)
+        cond, cond_params = recheck or ("1 = 1", {})
+        with engine.begin() as conn:
+            conn.execute(text(f"INSERT INTO {dst} SELECT * FROM {src} WHERE N IN ({in_sql}) AND {cond}"),
+                         {**in_params, **cond_params})
+            moved = [int(r[0]) for r in conn.execute(
+                text(f"SELECT N FROM {dst} WHERE N IN ({in_sql})"), in_params).fetchall()]
+            if moved:
+                m_sql, m_params = _in_clause(moved, prefix="m")
+                conn.execute(text(f"DELETE FROM {src} WHERE N IN ({m_sql})"), m_params)
+        if moved:
+            _notify_write("tableau_production_2", moved)
+            _notify_write(ARCHIVE_TABLE, moved)
+        return moved
+
+    def run(self, days: Optional[int] = None, dry_run: bool = False) -> dict:
+        days = ARCHIVE_AFTER_DAYS if days is None else int(days)
+        if dry_run:
+            return self.preview(days)
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("archivage ou restauration déjà en cours")
+        try:
+            t0 = time.time()
+            self.ensure()
+            where, params = self._candidates(days)
+            moved, last_n = 0, -1
+            while True:
+                with engine.connect() as conn:
+                    ns = [int(r[0]) for r in conn.execute(text(
+                        f"SELECT N FROM tableau_production_2 WHERE N > :last AND {where} "
+                        f"AND N < (SELECT MAX(N) FROM tableau_production_2) ORDER BY N LIMIT {ARCHIVE_BATCH}"
+                    ), {**params, "last": last_n}).fetchall()]
+                if not ns:
+                    break
+                moved += len(self._move("tableau_production_2", ARCHIVE_TABLE, ns, (where, params)))
+                last_n = ns[-1]
+                time.sleep(ARCHIVE_PAUSE_S)
+            self.moved += moved
+            self.last_run = {"at": int(t0), "days": days, "moved": moved, "seconds": round(time.time() - t0, 2)}
+            self.last_error = None
+            _log(f"ARCHIVE : {moved} commande(s) archivée(s) (livrées depuis plus de {days} j)")
+            return dict(self.last_run)
+        except Exception as e:
+            self.last_error = repr(e)
+            raise
+        finally:
+            self._run_lock.release()
+
+    def restore(self, ns: Optional[list[int]] = None) -> dict:
+        """Remet en table chaude les N donnés, ou toute l'archive (ns=None)."""
+        if not self.exists():
+            return {"restored": 0, "not_found": sorted({int(n) for n in ns or ()})}
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("archivage ou restauration déjà en cours")
+        try:
+            restored = 0
+            if ns is not None:
+                wanted = sorted({int(n) for n in ns})
+                done_ns: list[int] = []
+                for i in range(0, len(wanted), ARCHIVE_BATCH):
+                    done_ns += self._move(ARCHIVE_TABLE, "tableau_production_2", wanted[i:i + ARCHIVE_BATCH])
+                self.restored += len(done_ns)
+                _log(f"ARCHIVE : {len(done_ns)} commande(s) restaurée(s)")
+                return {"restored": len(done_ns), "not_found": sorted(set(wanted) - set(done_ns))}
+            while True:
+                with engine.connect() as conn:
+                    chunk = [int(r[0]) for r in conn.execute(text(
+                        f"SELECT N FROM {ARCHIVE_TABLE} ORDER BY N LIMIT {ARCHIVE_BATCH}")).fetchall()]
+                if not chunk:
+                    break
+                done = self._move(ARCHIVE_TABLE, "tableau_production_2", chunk)
+                if not done:
+                    break
+                restored += len(done)
+                time.sleep(ARCHIVE_PAUSE_S)
+            self.restored += restored
+            _log(f"ARCHIVE : {restored} commande(s) restaurée(s)")
+            return {"restored": restored}
+        finally:
+            self._run_lock.release()
+
+    # --- planification ---
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, daemon=True, name="archive").start()
+
+    def _loop(self) -> None:
+        time.sleep(60)   # après le démarrage (tunnel, premiers écrans)
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                _log("archive error", e)
+            time.sleep(ARCHIVE_INTERVAL_H * 3600)
+
+    def status(self) -> dict:
+        return {"exists": bool(self._exists), "running": self._run_lock.locked(),
+                "after_days": ARCHIVE_AFTER_DAYS, "interval_h": ARCHIVE_INTERVAL_H,
+                "moved": self.moved, "restored": self.restored,
+                "last_run": self.last_run, "last_error": self.last_error}
+
+_ARCHIVE = _OrderArchive()
+# nombre de commandes archivées (tableau de bord) : gardé ARCHIVE_COUNT_TTL s, recompté après un déplacement local
+ARCHIVE_COUNT_TTL = 300.0
+_ARCHIVE_COUNT = _QueryCache(ARCHIVE_COUNT_TTL, 4)
+
+@on_write
+def _archive_count_on_write(table, ns):
+    _ARCHIVE_COUNT.invalidate(table)
+
+def _archived_delivered_count() -> int:
+    """Commandes livrées sorties de la table chaude (l'archive ne reçoit que des LIVREE)."""
+    if not _ARCHIVE.exists():
+        return 0
+
+    def _load():
+        with engine.connect() as conn:
+            return int(conn.execute(text(f"SELECT COUNT(*) FROM {ARCHIVE_TABLE}")).scalar() or 0)
+    return _ARCHIVE_COUNT.get_or_load(("archived",), _load, tables=(ARCHIVE_TABLE,))
+
+def _include_archived(args) -> bool:
+    return (args.get("include_archived") or "").strip().lower() in ("1", "true", "oui", "yes")
+
+def _orders_source(include_archived: bool) -> tuple[str, tuple]:
+    """(FROM, tables du cache) : table chaude, ou vue avec l'archive si demandé et en place."""
+    if include_archived and _ARCHIVE.exists():
+        return ARCHIVE_VIEW, ("tableau_production_2", ARCHIVE_TABLE)
+    return "tableau_production_2", ("tableau_production_2",)
+
+def _order_tables() -> tuple[str, ...]:
+    """Tables portant des commandes (lectures d'historique : cumul mensuel, balayages)."""
+    return ("tableau_production_2", ARCHIVE_TABLE) if _ARCHIVE.exists() else ("tableau_production_2",)
+
+@app.post("/archive/run")
+def run_archive():
+    """
+    {"days": 365, "dry_run": true} :
+    - dry_run → candidats (nombre, plage de N, échantillon), 200
+    - sinon → archivage en tâche de fond, 202 (suivi : /health → "archive")
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        days = int(data.get("days", ARCHIVE_AFTER_DAYS))
+        if days < 30:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "days : entier ≥ 30 attendu"}), 400
+    if data.get("dry_run"):
+        try:
+            return jsonify({"ok": True, **_ARCHIVE.run(days, dry_run=True)}), 200
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+    if _ARCHIVE.status()["running"]:
+        return jsonify({"ok": False, "error": "archivage ou restauration déjà en cours"}), 409
+
+    def _job():
+        try:
+            _ARCHIVE.run(days)
+        except Exception as e:
+            _log("archive error", e)
+    threading.Thread(target=_job, daemon=True, name="archive-run").start()
+    return jsonify({"ok": True, "queued": True, "days": days}), 202
+
+@app.post("/archive/restore")
+def restore_archive():
+    """{"N": [12, 13]} → restauration immédiate ; {"all": true} → toute l'archive, en tâche de fond (202)."""
+    data = request.get_json(silent=True) or {}
+    if data.get("all") is True:
+        if _ARCHIVE.status()["running"]:
+            return jsonify({"ok": False, "error": "archivage ou restauration déjà en cours"}), 409
+
+        def _job():
+            try:
+                _ARCHIVE.restore(None)
+            except Exception as e:
+                _log("archive restore error", e)
+        threading.Thread(target=_job, daemon=True, name="archive-restore").start()
+        return jsonify({"ok": True, "queued": True}), 202
+    try:
+        ns = [int(n) for n in (data.get("N") or [])]
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "N : liste d'entiers attendue"}), 400
+    if not ns:
+        return jsonify({"ok": False, "error": 'N : [..] ou {"all": true} attendu'}), 400
+    try:
+        return jsonify({"ok": True, **_ARCHIVE.restore(ns)}), 200
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# -----------------------------------------------------------
+# Registre de schéma (information_schema) : colonnes typées, validation & coercition
+# -----------------------------------------------------------
+from typing import NamedTuple
+
+SCHEMA_TABLES = ("tableau_production_2", "clients", "donnees")
+SCHEMA_PROBE_INTERVAL = float(os.getenv("SCHEMA_PROBE_INTERVAL", "60"))
+
+_INT_TYPES = {"tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"}
+_DECIMAL_TYPES = {"decimal", "numeric", "float", "double", "real"}
+_DATE_TYPES = {"date", "datetime", "timestamp"}
+_TEXT_TYPES = {"char", "varchar", "tinytext", "text", "mediumtext", "longtext", "enum", "set"}
+
+class _ColumnInfo(NamedTuple):
+    name: str
+    data_type: str            # "varchar", "int", "decimal", …
+    column_type: str          # "varchar(50)", "enum('OUI','NON')", …
+    nullable: bool
+    max_length: Optional[int]
+    position: int
+
+def _enum_values(column_type: str) -> list[str]:
+    return [v.replace("''", "'") for v in re.findall(r"'((?:[^']|'')*)'", column_type)]
+
+def _coerce_value(col: _ColumnInfo, v):
+    """Valeur JSON → valeur SQL pour la colonne ; ValueError si incompatible."""
+    if isinstance(v, (dict, list)):
+        raise ValueError("valeur scalaire attendue")
+    blank = v is None or (isinstance(v, str) and not v.strip())
+    if col.data_type in _TEXT_TYPES:
+        if v is None:
+            return None if col.nullable else ""
+        s = v if isinstance(v, str) else str(v)
+        if col.data_type == "enum" and s and s not in _enum_values(col.column_type):
+            raise ValueError(f"valeur hors liste ({', '.join(_enum_values(col.column_type))})")
+        if col.max_length is not None and len(s) > col.max_length:
+            raise ValueError(f"{len(s)} caractères (max {col.max_length})")
+        return s
+    if blank:
+        if col.nullable:
+            return None
+        raise ValueError("valeur requise")
+    if col.data_type in _INT_TYPES:
+        s = str(int(v) if isinstance(v, bool) else v).strip()
+        if not re.fullmatch(r"-?\d+", s):
+            raise ValueError("entier attendu")
+        return int(s)
+    if col.data_type in _DECIMAL_TYPES:
+        try:
+            return Decimal(re.sub(r"[ €\u202f\u00a0]", "", str(v)).replace(",", "."))
+        except InvalidOperation:
+            raise ValueError("nombre attendu") from None
+    if col.data_type in _DATE_TYPES:
+        if isinstance(v, (date, datetime)):
+            return v
+        s = str(v).strip()
+        for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M"):
+            try:
+                parsed = datetime.strptime(s, fmt)
+            except ValueError:
+                continue
+            return parsed.date() if col.data_type == "date" else parsed
+        raise ValueError("date attendue (JJ/MM/AAAA)")
+    return v
+
+class _SchemaRegistry:
+    """
+    Métadonnées des colonnes (type, nullabilité, longueur max) chargées UNE fois
+    depuis information_schema.COLUMNS, puis rafraîchies :
+      - sur invalidate() (POST /schema/refresh)
+      - quand l'empreinte des colonnes (sonde légère) change ; sonde au plus toutes les
+        SCHEMA_PROBE_INTERVAL s (une clé inconnue ne déclenche aucun aller-retour : /schema/refresh)
+    """
+    _COLUMNS_SQL = """
+        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE,
+               CHARACTER_MAXIMUM_LENGTH, ORDINAL_POSITION
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({tables})
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """
+    _PROBE_SQL = """
+        SELECT COUNT(*),
+               COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE))), 0)
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({tables})
+    """
+
+    def __init__(self, tables, probe_interval: float):
+        self.tables = tuple(tables)
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._columns: dict[str, dict[str, _ColumnInfo]] = {}
+        self._fingerprint = None
+        self._loaded_at = 0.0
+        self._probed_at = 0.0
+        self.loads = self.probes = 0
+
+    def _sql(self, template: str) -> tuple[Any, dict]:
+        in_sql, in_params = _in_clause(self.tables, prefix="t")
+        return text(template.format(tables=in_sql)), in_params
+
+    def _load(self) -> None:
+        with engine.connect() as conn:
+            sql, params = self._sql(self._COLUMNS_SQL)
+            rows = conn.execute(sql, params).fetchall()
+            sql, params = self._sql(self._PROBE_SQL)
+            fingerprint = tuple(conn.execute(sql, params).fetchone())
+        columns: dict[str, dict[str, _ColumnInfo]] = {t: {} for t in self.tables}
+        for table, name, dtype, ctype, nullable, max_len, pos in rows:
+            columns.setdefault(table, {})[name] = _ColumnInfo(
+                name, str(dtype).lower(), str(ctype), nullable == "YES",
+                int(max_len) if max_len is not None else None, int(pos),
             )
-            params["limit"], params["offset"] = limit, offset
+        now = time.time()
+        with self._lock:
+            self._columns = columns
+            self._fingerprint = fingerprint
+            self._loaded_at = self._probed_at = now
+            self.loads += 1
+
+    def probe(self, max_age: float) -> bool:
+        """Compare l'empreinte du schéma si la dernière sonde a plus de max_age s ; True si rechargé."""
+        with self._load_lock:
+            if time.time() - self._probed_at < max_age:
+                return False
+            self._probed_at = time.time()
+            self.probes += 1
+            with engine.connect() as conn:
+                sql, params = self._sql(self._PROBE_SQL)
+                fingerprint = tuple(conn.execute(sql, params).fetchone())
+            if fingerprint == self._fingerprint:
+                return False
+            _log(f"[schema] empreinte modifiée {self._fingerprint} → {fingerprint} : rechargement")
+            self._load()
+            return True
 
-            rows = conn.execute(sql, params).mappings().all()
+    def columns(self, table: str) -> dict[str, _ColumnInfo]:
+        """Colonnes de la table (ordre de la table)."""
+        if not self._columns:
+            with self._load_lock:
+                if not self._columns:
+                    self._load()
+        else:
+            self.probe(self.probe_interval)
+        return self._columns.get(table, {})
 
-        return jsonify({"ok": True, "rows": [dict(r) for r in rows]}), 200
+    def column_names(self, table: str) -> list[str]:
+        return list(self.columns(table))
+
+    def coerce(self, table: str, data: dict, exclude=()) -> tuple[dict, dict, list]:
+        """
+        Valide & convertit un payload AVANT construction du SQL.
+        Retourne (valeurs, erreurs {colonne: message}, clés inconnues ignorées).
+        """
+        cols = self.columns(table)
+        unknown = [k for k in data if k not in cols]
+        values, errors = {}, {}
+        for k, v in data.items():
+            if k not in cols or k in exclude:
+                continue
+            try:
+                values[k] = _coerce_value(cols[k], v)
+            except ValueError as e:
+                errors[k] = str(e)
+        return values, errors, unknown
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._columns = {}
+
+    def status(self) -> dict:
+        return {
+            "tables": {t: len(c) for t, c in self._columns.items()},
+            "loaded_age_s": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            "loads": self.loads,
+            "probes": self.probes,
+        }
+
+_SCHEMA = _SchemaRegistry(SCHEMA_TABLES, SCHEMA_PROBE_INTERVAL)
+
+@app.post("/schema/refresh")
+def refresh_schema():
+    """Invalidation explicite (après un ALTER TABLE)."""
+    try:
+        _SCHEMA.invalidate()
+        _SCHEMA.columns(SCHEMA_TABLES[0])
+        return jsonify({"ok": True, "schema": _SCHEMA.status()}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
 def get_table_columns(table_name):
-    with engine.connect() as conn:
-        result = conn.execute(text(f"SHOW COLUMNS FROM {table_name}"))
-        rows = result.fetchall()
-        return [r[0] for r in rows]
-
-TABLE_PRODUCTION_COLUMNS = None
-TABLE_PRODUCTION_COLUMNS_TS = 0
-
-def get_table_columns_cached(ttl=300):
-    """Cache avec TTL (300s par défaut)."""
-    import time
-    global TABLE_PRODUCTION_COLUMNS, TABLE_PRODUCTION_COLUMNS_TS
-    now = time.time()
-    if TABLE_PRODUCTION_COLUMNS is None or (now - TABLE_PRODUCTION_COLUMNS_TS) > ttl:
-        TABLE_PRODUCTION_COLUMNS = get_table_columns("tableau_production_2")
-        TABLE_PRODUCTION_COLUMNS_TS = now
-    return TABLE_PRODUCTION_COLUMNS
+    return _SCHEMA.column_names(table_name)
+
+def get_table_columns_cached(ttl=None):
+    """Colonnes de tableau_production_2 (registre de schéma)."""
+    return get_table_columns("tableau_production_2")
+
+def _in_clause(values, prefix: str = "n") -> tuple[str, dict]:
+    """Liste de valeurs → (":n0, :n1, ...", {"n0": v0, ...}) pour un IN (...) paramétré."""
+    params = {f"{prefix}{i}": v for i, v in enumerate(values)}
+    return ", ".join(f":{k}" for k in params), params
+
+def _order_select_columns(raw_fields) -> str:
+    """
+    Sélection de colonnes façon `fields=` : "N,STATUT,NOM_CLIENT" ou liste.
+    Colonnes inconnues ignorées ; N toujours inclus ; vide → "*".
+    """
+    if isinstance(raw_fields, str):
+        wanted = [f.strip() for f in raw_fields.split(",")]
+    else:
+        wanted = [str(f).strip() for f in (raw_fields or [])]
+    wanted = [f for f in wanted if f]
+    if not wanted:
+        return "*"
+    cols = set(get_table_columns_cached())
+    selected = ["N"] + [f for f in dict.fromkeys(wanted) if f in cols and f != "N"]
+    return ", ".join(selected)
+
+def _project_row(row: dict, select_cols: str) -> dict:
+    """Applique la sélection de _order_select_columns à une ligne complète."""
+    if select_cols == "*":
+        return {k: v for k, v in row.items() if k != "_version"}
+    return {c: row.get(c) for c in select_cols.split(", ")}
+
+# --- Version de ligne (concurrence optimiste : ETag sur GET, If-Match sur PUT) ---
+ROW_VERSION_COLUMN = (os.getenv("ROW_VERSION_COLUMN") or "VERSION_LIGNE").strip()
+
+def _row_version_column() -> Optional[str]:
+    return ROW_VERSION_COLUMN if ROW_VERSION_COLUMN in get_table_columns_cached() else None
+
+def _row_version_expr() -> str:
+    """
+    Expression SQL de la version d'une ligne de tableau_production_2 :
+      - compteur ROW_VERSION_COLUMN s'il existe (incrémenté par chaque UPDATE de l'API)
+      - sinon MD5 de toutes les colonnes, calculé par MySQL (aucun changement de schéma)
+    """
+    vcol = _row_version_column()
+    if vcol:
+        return f"CAST(COALESCE({vcol}, 0) AS CHAR)"
+    parts = ", ".join(f"COALESCE({c}, '')" for c in sorted(get_table_columns_cached()))
+    return f"MD5(CONCAT_WS(CHAR(31), {parts}))"
+
+def _row_version_bump() -> str:
+    """Fragment SET à ajouter aux UPDATE (vide en mode hash)."""
+    vcol = _row_version_column()
+    return f", {vcol} = COALESCE({vcol}, 0) + 1" if vcol else ""
+
+def _if_match_version() -> Optional[str]:
+    """Version attendue d'après l'en-tête If-Match (None si absent ou "*")."""
+    raw = (request.headers.get("If-Match") or "").strip()
+    if raw.startswith("W/"):
+        raw = raw[2:]
+    raw = raw.strip('"')
+    return raw if raw and raw != "*" else None
+
+def _remember_order_row(n: int, rows) -> Optional[dict]:
+    row = dict(rows[0]) if rows else None
+    if row:
+        row["_version"] = str(row["_version"])
+        _ROW_CACHE.put(n, row)
+    return row
+
+def _order_row_local(n: int) -> tuple[Optional[dict], Any]:
+    """
+    Partie de GET /orders/<n> servie sans MySQL (cache de lignes, miroir local) :
+    (ligne, None) si trouvée localement, (None, None) si absente, (None, sql) s'il faut lire la base.
+    """
+    row = _ROW_CACHE.get(n)
+    if row is not None and row.get("_version") is not None:
+        return row, None
+    sql = text(f"SELECT *, {_row_version_expr()} AS _version "
+               f"FROM tableau_production_2 WHERE N = :n LIMIT 1")
+    # MD5 n'existe pas côté SQLite : le miroir ne sert que le mode compteur
+    if _row_version_column() is not None:
+        rows = _mirror_rows(sql, {"n": n})
+        if rows is not None:
+            return _remember_order_row(n, rows), None
+    return None, sql
 
 # --- GET /orders/<n> pour lire un enregistrement complet ---
 @app.get("/orders/<int:n>")
+@serve_stale_on_failure
 def get_order(n):
     try:
-        with engine.connect() as conn:
-            row = conn.execute(
-                text(f"SELECT * FROM tableau_production_2 WHERE N = :n LIMIT 1"),
-                {"n": n},
-            ).mappings().first()
+        select_cols = _order_select_columns(request.args.get("fields"))
+        row, sql = _order_row_local(n)
+        if sql is not None:
+            row = _remember_order_row(n, _read_rows(sql, {"n": n}, mirror=False))
+        archived = False
+        if not row and _ARCHIVE.exists():
+            # commande archivée : lecture seule (POST /archive/restore avant toute modification)
+            rows = _read_rows(text(f"SELECT *, {_row_version_expr()} AS _version "
+                                   f"FROM {ARCHIVE_TABLE} WHERE N = :n LIMIT 1"), {"n": n}, mirror=False)
+            row, archived = (rows[0] if rows else None), bool(rows)
         if not row:
             return jsonify({"ok": False, "error": "Commande introuvable"}), 404
-        return jsonify({"ok": True, "row": dict(row)}), 200
+        resp = jsonify({"ok": True, "row": _project_row(row, select_cols), "version": row["_version"],
+                        **({"archived": True} if archived else {})})
+        resp.headers["ETag"] = f'"{row["_version"]}"'
+        return resp, 200
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+ORDERS_BULK_MAX = 500
+
+@app.route("/orders/bulk", methods=["GET", "POST"])
+@serve_stale_on_failure
+def get_orders_bulk():
+    """
+    Lecture de plusieurs commandes en UNE requête SQL :
+        GET  /orders/bulk?n=1,2,3&fields=N,STATUT,NOM_CLIENT
+        POST /orders/bulk  {"n": [1, 2, 3], "fields": ["N", "STATUT"]}   (gros lots)
+
+    Réponse : {"ok": true, "rows": {"1": {...}, "2": {...}}, "missing": [3]}
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        raw_ns, raw_fields = data.get("n") or [], data.get("fields")
+    else:
+        raw_ns, raw_fields = (request.args.get("n") or "").split(","), request.args.get("fields")
+
+    try:
+        ns = sorted({int(str(x).strip()) for x in raw_ns if str(x).strip()})
+    except ValueError:
+        return jsonify({"ok": False, "error": "n doit être une liste d'entiers"}), 400
+    if not ns:
+        return jsonify({"ok": False, "error": "n manquant"}), 400
+    if len(ns) > ORDERS_BULK_MAX:
+        return jsonify({"ok": False, "error": f"Maximum {ORDERS_BULK_MAX} commandes par requête"}), 400
+
+    try:
+        select_cols = _order_select_columns(raw_fields)
+        by_n = {}
+        for n in ns:
+            row = _ROW_CACHE.get(n)
+            if row is not None:
+                by_n[str(n)] = _project_row(row, select_cols)
+        to_fetch = [n for n in ns if str(n) not in by_n]
+        if to_fetch:
+            in_clause, in_params = _in_clause(to_fetch)
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    text(f"SELECT *, {_row_version_expr()} AS _version "
+                         f"FROM tableau_production_2 WHERE N IN ({in_clause})"),
+                    in_params,
+                ).mappings().all()
+            for r in rows:
+                row = dict(r)
+                row["_version"] = str(row["_version"])
+                _ROW_CACHE.put(int(row["N"]), row)
+                by_n[str(row["N"])] = _project_row(row, select_cols)
+
+        missing = [n for n in ns if str(n) not in by_n]
+        return jsonify({"ok": True, "rows": by_n, "missing": missing}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
+def _livraison_prevue(planning: date, ral_bdc=None, ral_module=None) -> date:
+    """10 semaines (BDC et module en RAL 9003 blanc) ou 12 ; +3 si l'on tombe dans les 3 premières sem. d'août."""
+    blanc = "RAL 9003 BLANC"
+    weeks_to_add = 10 if ((ral_bdc or "").strip().upper() == blanc and (ral_module or "").strip().upper() == blanc) else 12
+    livraison_prevue = planning + timedelta(weeks=weeks_to_add)
+    if livraison_prevue.month == 8 and livraison_prevue.day <= 21:
+        livraison_prevue += timedelta(weeks=3)
+    return livraison_prevue
 
 # --- POST /orders pour créer dynamiquement ---
 @app.post("/orders")
 def create_order():
     data = request.get_json(silent=True) or {}
-    # on ne prend que les colonnes de la table (sauf N qui est auto)
-    cols = get_table_columns_cached()
-    # Si on détecte des clés inconnues (ex: MOD ajoutés après démarrage), on rafraîchit
-    if any(k not in cols for k in data.keys()):
-        # force un refresh immédiat
-        from time import time
-        TABLE_PRODUCTION_COLUMNS_TS = 0  # ou TABLE_PRODUCTION_COLUMNS = None
-        cols = get_table_columns_cached()
-        
-    valid_data = {k: v for k, v in data.items() if k in cols and k != "N"}
+    # on ne prend que les colonnes de la table (sauf N qui est auto), typées
+    try:
+        valid_data, field_errors, ignored = _filter_order_payload(data)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    if field_errors:
+        return jsonify({"ok": False, "error": "Valeurs invalides", "errors": field_errors, "ignored": ignored}), 400
 
     # normalise d’éventuelles dates déjà présentes
     for k in ("DATE_PLANNING", "LIVRAISON_PREVUE", "DATE_LIVRAISON"):
@@ -1098,7 +3914,7 @@ def create_order():
 
     # champs obligatoires
     if not valid_data.get("N_CLIENT") or not valid_data.get("NOM_CLIENT"):
-        return jsonify({"ok": False, "error": "N_CLIENT et NOM_CLIENT sont requis"}), 400
+        return jsonify({"ok": False, "error": "N_CLIENT et NOM_CLIENT sont requis", "ignored": ignored}), 400
 
     # ======= Vérification NOM_CLIENT dans clients + tableau_production_2 =======
     nom_client = (valid_data.get("NOM_CLIENT") or "").strip()
@@ -1119,10 +3935,12 @@ def create_order():
                 WHERE LOWER(TRIM(NOM_CLIENT)) = :n
             """), {"n": nom_client.lower()}).scalar() or 0
 
-            c2 = conn.execute(text("""
-                SELECT COUNT(*) FROM tableau_production_2
+            # commandes : table chaude + archive (un nom archivé reste pris)
+            order_tables = _order_tables()
+            c2 = sum(conn.execute(text(f"""
+                SELECT COUNT(*) FROM {t}
                 WHERE LOWER(TRIM(NOM_CLIENT)) = :n
-            """), {"n": nom_client.lower()}).scalar() or 0
+            """), {"n": nom_client.lower()}).scalar() or 0 for t in order_tables)
 
             # Fallback accent-insensible si collation stricte
             if c1 == 0:
@@ -1133,11 +3951,12 @@ def create_order():
                 c1 = sum(1 for (x,) in rows if _norm(x) == target)
 
             if c2 == 0:
-                rows = conn.execute(text("""
-                    SELECT NOM_CLIENT FROM tableau_production_2
-                    WHERE NOM_CLIENT LIKE :like LIMIT 20
-                """), {"like": f"%{nom_client}%"}).fetchall()
-                c2 = sum(1 for (x,) in rows if _norm(x) == target)
+                for t in order_tables:
+                    rows = conn.execute(text(f"""
+                        SELECT NOM_CLIENT FROM {t}
+                        WHERE NOM_CLIENT LIKE :like LIMIT 20
+                    """), {"like": f"%{nom_client}%"}).fetchall()
+                    c2 += sum(1 for (x,) in rows if _norm(x) == target)
 
         if (c1 + c2) > 0:
             return jsonify({"ok": False,
@@ -1152,14 +3971,9 @@ def create_order():
     valid_data["DATE_PLANNING"] = to_ddmmyyyy(today_date)
 
     # 2) Calcul LIVRAISON_PREVUE (10 ou 12 semaines, +3 si dans les 3 premières sem. d'août)
-    ral_bdc    = (valid_data.get("RAL_BDC") or "").strip().upper()
-    ral_module = (valid_data.get("RAL_MODULE") or "").strip().upper()
-    weeks_to_add = 10 if (ral_bdc == "RAL 9003 BLANC" and ral_module == "RAL 9003 BLANC") else 12
-
-    livraison_prevue = today_date + timedelta(weeks=weeks_to_add)
-    if livraison_prevue.month == 8 and livraison_prevue.day <= 21:
-        livraison_prevue += timedelta(weeks=3)
-    valid_data["LIVRAISON_PREVUE"] = to_ddmmyyyy(livraison_prevue)
+    valid_data["LIVRAISON_PREVUE"] = to_ddmmyyyy(
+        _livraison_prevue(today_date, valid_data.get("RAL_BDC"), valid_data.get("RAL_MODULE"))
+    )
 
     # ======= Statut & tampons automatiques =======
     statut_norm = norm_statut(valid_data.get("STATUT"))
@@ -1194,113 +4008,395 @@ def create_order():
                 valid_data
             )
             new_id = getattr(result, "lastrowid", None)
+        _notify_write("tableau_production_2", [new_id] if new_id else None)
+        # ligne complète connue seulement si toutes les colonnes ont été fournies
+        if new_id and set(get_table_columns_cached()) - {"N"} <= set(valid_data):
+            _ROW_CACHE.put(int(new_id), {**valid_data, "N": new_id})
+        _release_request_conn()   # le mail peut attendre MAIL_SEND_TIMEOUT_S : pas avec une connexion du pool
 
         # Envoi d'email (non bloquant) + retour d’info au front
         mail_info = {}
         try:
-            mail_info = send_new_order_email(new_id, valid_data) or {}
+            mail_info = _send_new_order_email_bounded(new_id, valid_data)
         except Exception as e:
             print(f"[mail] erreur non bloquante: {e}")
 
-        return jsonify({"ok": True, "N": new_id, "mail": mail_info}), 201
+        return jsonify({"ok": True, "N": new_id, "mail": mail_info, "ignored": ignored}), 201
 
     except Exception as e:
         print("[ERREUR INSERT]", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+def _filter_order_payload(data: dict) -> tuple[dict, dict, list]:
+    """
+    Colonnes de tableau_production_2 (sauf N et la colonne de version, écrite par l'API seule),
+    converties selon leur type. Les "" sont conservés (effacement).
+    Retourne (valeurs, erreurs {colonne: message}, clés inconnues écartées) ; ces dernières sont
+    renvoyées à l'appelant ("ignored") sans aucun aller-retour SQL.
+    """
+    return _SCHEMA.coerce("tableau_production_2", data, exclude=("N", ROW_VERSION_COLUMN))
+
+def _apply_status_stamps(valid_data: dict, before_statut=None) -> None:
+    """
+    Normalisations & tampons auto lors d'une MAJ (modifie valid_data) :
+      - DATE_LIVRAISON renseignée → STATUT = LIVREE
+      - EN PRODUCTION → DATE_PRODUCTION ; EN STOCK → DATE_STOCK ; LIVREE → DATE_LIVRAISON (si absente)
+    """
+    if "DATE_LIVRAISON" in valid_data:
+        # si on renseigne une date de livraison -> force statut LIVREE
+        dl = to_ddmmyyyy(valid_data["DATE_LIVRAISON"])
+        valid_data["DATE_LIVRAISON"] = dl
+        if dl:
+            valid_data["STATUT"] = "LIVREE"
+
+    statut_eff = norm_statut(valid_data.get("STATUT") or before_statut)
+    today = to_ddmmyyyy(date.today())
+
+    if statut_eff == "EN PRODUCTION":
+        valid_data["DATE_PRODUCTION"] = today
+    elif statut_eff == "EN STOCK":
+        valid_data["DATE_STOCK"] = today
+    elif statut_eff in ("LIVREE", "LIVRE"):
+        # si pas de date fournie, on pose aujourd'hui
+        if not valid_data.get("DATE_LIVRAISON"):
+            valid_data["DATE_LIVRAISON"] = today
+
+def _order_changes(before, valid_data: dict) -> dict[str, tuple[Any, Any]]:
+    changes: dict[str, tuple[Any, Any]] = {}
+    for k, new_val in valid_data.items():
+        old_val = before.get(k)
+        if (old_val or "") != (new_val or ""):
+            changes[k] = (old_val, new_val)
+    return changes
+
+def _client_pc_name() -> str:
+    return (
+        request.headers.get("X-Client-PC")
+        or request.headers.get("X-Client-Host")
+        or request.remote_addr
+        or "unknown"
+    )
+
 @app.put("/orders/<int:n>")
 def update_order(n):
+    """
+    MAJ d'une commande. Avec `If-Match: "<version>"` (ETag de GET /orders/<n>) :
+      - UPDATE conditionnel unique (… WHERE N = :N AND version = :v) → 412 si la ligne a changé entre-temps
+      - si la ligne en cache porte cette version, elle sert d'état AVANT exact : aucune pré-lecture
+    Sans If-Match : comportement historique (le dernier qui écrit gagne).
+    """
     data = request.get_json(silent=True) or {}
 
-    cols = get_table_columns_cached()
-    # ✅ Si on détecte des clés inconnues → refresh immédiat
-    if any(k not in cols for k in data.keys()):
-        from time import time
-        global TABLE_PRODUCTION_COLUMNS_TS, TABLE_PRODUCTION_COLUMNS
-        TABLE_PRODUCTION_COLUMNS_TS = 0
-        TABLE_PRODUCTION_COLUMNS = None
-        cols = get_table_columns_cached()
-
-    # On garde les valeurs vides ("") : elles servent à effacer
-    valid_data = {k: v for k, v in data.items() if k in cols and k != "N"}
+    try:
+        valid_data, field_errors, ignored = _filter_order_payload(data)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    if field_errors:
+        return jsonify({"ok": False, "error": "Valeurs invalides", "errors": field_errors, "ignored": ignored}), 400
 
     if not valid_data:
         print("[AUDIT] ✖ Aucun champ valide transmis → pas de log", flush=True)
-        return jsonify({"ok": False, "error": "Aucune colonne valide transmise"}), 400
+        return jsonify({"ok": False, "error": "Aucune colonne valide transmise", "ignored": ignored}), 400
+
+    if_match = _if_match_version()
+    snapshot = _ROW_CACHE.snapshot(n)
+    cached = _ROW_CACHE.get(n)
+    if if_match is not None and snapshot is not None and snapshot[1].get("_version") == if_match:
+        # même version = même contenu, quel que soit l'âge de l'entrée
+        cached = snapshot[1]
+    try:
+        version_expr = _row_version_expr()
+        with engine.begin() as conn:
+            # état AVANT sur les colonnes modifiées + NOM_CLIENT (pour le log)
+            # → ligne du cache si fraîche (ou à la bonne version), sinon SELECT
+            cols_to_fetch = set(valid_data.keys()) | {"NOM_CLIENT"}
+            if cached is not None:
+                before = {c: cached.get(c) for c in cols_to_fetch}
+            else:
+                select_cols = ", ".join(sorted(cols_to_fetch))
+                before = conn.execute(
+                    text(f"SELECT {select_cols}, {version_expr} AS _version "
+                         f"FROM tableau_production_2 WHERE N = :N"),
+                    {"N": n},
+                ).mappings().first()
+                if before and if_match is not None and str(before["_version"]) != if_match:
+                    return _version_conflict(n, str(before["_version"]))
+            if not before:
+                print("[AUDIT] ✖ Commande introuvable", flush=True)
+                return jsonify({"ok": False, "error": "Commande introuvable"}), 404
+
+            # --- Normalisations & tampons auto lors d'une MAJ ---
+            _apply_status_stamps(valid_data, before.get("STATUT"))
+
+            # UPDATE (conditionné à la version si If-Match)
+            set_clause = ", ".join([f"{k} = :{k}" for k in valid_data.keys()])
+            payload = dict(valid_data)
+            payload["N"] = n
+            where = "N = :N"
+            if if_match is not None:
+                where += f" AND {version_expr} = :_if_match"
+                payload["_if_match"] = if_match
+            res = conn.execute(
+                text(f"UPDATE tableau_production_2 SET {set_clause}{_row_version_bump()} WHERE {where}"),
+                payload,
+            )
+            if res.rowcount == 0:
+                # ligne disparue, ou modifiée depuis la version attendue
+                _ROW_CACHE.evict([n])
+                if if_match is not None:
+                    current = conn.execute(
+                        text(f"SELECT {version_expr} FROM tableau_production_2 WHERE N = :N"),
+                        {"N": n},
+                    ).scalar()
+                    if current is not None:
+                        return _version_conflict(n, str(current))
+                print("[AUDIT] UPDATE : 0 ligne trouvée", flush=True)
+                return jsonify({"ok": False, "error": "Commande introuvable"}), 404
+        # mode compteur + If-Match : nouvelle version connue sans relecture
+        new_version = None
+        if if_match is not None and if_match.isdigit() and _row_version_column():
+            new_version = str(int(if_match) + 1)
+        _notify_write("tableau_production_2", [n])
+        cache_values = dict(valid_data)
+        if new_version is not None:
+            cache_values[_row_version_column()] = int(new_version)
+        _ROW_CACHE.write_through(n, cache_values, snapshot, version=new_version)
+
+        # Diff
+        changes = _order_changes(before, valid_data)
+
+        print(f"[AUDIT] ◀ diff_keys={list(changes.keys())} (len={len(changes)})", flush=True)
+
+        nom_client = valid_data.get("NOM_CLIENT") or before.get("NOM_CLIENT") or ""
+        if AUDIT_ASYNC:
+            audit_log_async(n, nom_client, changes, _client_pc_name())
+        else:
+            write_audit_log_remote(n, nom_client, changes, _client_pc_name())
+
+        resp = jsonify({"ok": True, "version": new_version, "ignored": ignored})
+        if new_version is not None:
+            resp.headers["ETag"] = f'"{new_version}"'
+        return resp, 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+def _version_conflict(n: int, current_version: str):
+    print(f"[AUDIT] ✖ Conflit de version sur N={n}", flush=True)
+    resp = jsonify({"ok": False, "error": "Commande modifiée par un autre utilisateur",
+                    "conflict": True, "version": current_version})
+    resp.headers["ETag"] = f'"{current_version}"'
+    return resp, 412
+
+BATCH_MAX_ORDERS = 500
+
+@app.patch("/orders/batch")
+def update_orders_batch():
+    """
+    Mise à jour groupée :
+        PATCH /orders/batch   [{"N": 12, "changes": {"STATUT": "EN STOCK"}}, ...]
+        (ou {"items": [...]})
+
+    - 1 SELECT ... WHERE N IN (...) pour tous les états AVANT
+    - mêmes tampons auto que PUT /orders/<n> (DATE_PRODUCTION / DATE_STOCK / DATE_LIVRAISON)
+    - UPDATE regroupés par jeu de colonnes (executemany), 1 seule transaction
+    - 1 seule écriture d'audit pour tout le lot
+    """
+    data = request.get_json(silent=True)
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"ok": False, "error": "Liste [{N, changes}] attendue"}), 400
+    if len(items) > BATCH_MAX_ORDERS:
+        return jsonify({"ok": False, "error": f"Maximum {BATCH_MAX_ORDERS} commandes par lot"}), 400
+
+    # Regroupe par N (plusieurs entrées pour le même N → fusion, la dernière gagne)
+    errors = []
+    requested: dict[int, dict] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            errors.append({"N": None, "error": "Élément invalide ({N, changes} attendu)"})
+            continue
+        try:
+            n = int(item.get("N"))
+        except (TypeError, ValueError):
+            errors.append({"N": item.get("N"), "error": "N invalide"})
+            continue
+        changes = item.get("changes")
+        if not isinstance(changes, dict):
+            errors.append({"N": n, "error": "changes manquant"})
+            continue
+        requested.setdefault(n, {}).update(changes)
+
+    valid_by_n: dict[int, dict] = {}
+    ignored_by_n: dict[int, list] = {}
+    try:
+        for n, changes in requested.items():
+            valid_data, field_errors, ignored = _filter_order_payload(changes)
+            if ignored:
+                ignored_by_n[n] = ignored
+            if field_errors:
+                errors.append({"N": n, "error": "Valeurs invalides", "errors": field_errors})
+            elif valid_data:
+                valid_by_n[n] = valid_data
+            else:
+                errors.append({"N": n, "error": "Aucune colonne valide transmise"})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    if not valid_by_n:
+        return jsonify({"ok": False, "error": "Aucune commande valide", "errors": errors,
+                        "ignored": ignored_by_n}), 400
 
     try:
         with engine.begin() as conn:
-            # état AVANT sur les colonnes modifiées + NOM_CLIENT (pour le log)
-            cols_to_fetch = set(valid_data.keys()) | {"NOM_CLIENT"}
-            select_cols = ", ".join(sorted(cols_to_fetch))
-            before = conn.execute(
-                text(f"SELECT {select_cols} FROM tableau_production_2 WHERE N = :N"),
-                {"N": n},
-            ).mappings().first()
-            if not before:
-                print("[AUDIT] ✖ Commande introuvable", flush=True)
-                return jsonify({"ok": False, "error": "Commande introuvable"}), 404
+            # états AVANT en une requête (colonnes modifiées + tampons + NOM_CLIENT)
+            cols_to_fetch = {"N", "NOM_CLIENT", "STATUT", "DATE_PRODUCTION", "DATE_STOCK", "DATE_LIVRAISON"}
+            for valid_data in valid_by_n.values():
+                cols_to_fetch |= set(valid_data.keys())
+            ns = sorted(valid_by_n)
+            snapshots = {n: _ROW_CACHE.snapshot(n) for n in ns}
+            before_by_n = {}
+            for n in ns:
+                cached = _ROW_CACHE.get(n)
+                if cached is not None:
+                    before_by_n[n] = {c: cached.get(c) for c in cols_to_fetch}
+            to_fetch = [n for n in ns if n not in before_by_n]
+            if to_fetch:
+                in_clause, in_params = _in_clause(to_fetch)
+                rows = conn.execute(
+                    text(f"SELECT {', '.join(sorted(cols_to_fetch))} "
+                         f"FROM tableau_production_2 WHERE N IN ({in_clause})"),
+                    in_params,
+                ).mappings().all()
+                before_by_n.update({int(r["N"]): r for r in rows})
+
+            # tampons + regroupement par jeu de colonnes SET
+            groups: dict[tuple[str, ...], list[dict]] = {}
+            for n in ns:
+                before = before_by_n.get(n)
+                if before is None:
+                    errors.append({"N": n, "error": "Commande introuvable"})
+                    continue
+                valid_data = valid_by_n[n]
+                # même règle que PUT /orders/<n> : STATUT d'avant en repli
+                _apply_status_stamps(valid_data, before.get("STATUT"))
+                key = tuple(sorted(valid_data))
+                groups.setdefault(key, []).append({**valid_data, "N": n})
+
+            for set_cols, payloads in groups.items():
+                set_clause = ", ".join(f"{k} = :{k}" for k in set_cols)
+                conn.executemany(
+                    text(f"UPDATE tableau_production_2 SET {set_clause}{_row_version_bump()} WHERE N = :N"),
+                    payloads,
+                )
+        _notify_write("tableau_production_2", [n for n in ns if n in before_by_n])
+        for n in ns:
+            if n in before_by_n:
+                _ROW_CACHE.write_through(n, valid_by_n[n], snapshots[n])
+
+        # Diffs + UNE écriture d'audit pour le lot
+        audit_entries = []
+        updated = []
+        for n in ns:
+            before = before_by_n.get(n)
+            if before is None:
+                continue
+            valid_data = valid_by_n[n]
+            changes = _order_changes(before, valid_data)
+            nom_client = valid_data.get("NOM_CLIENT") or before.get("NOM_CLIENT") or ""
+            audit_entries.append((n, nom_client, changes))
+            updated.append(n)
 
-            # --- Normalisations & tampons auto lors d'une MAJ ---
-            if "DATE_LIVRAISON" in valid_data:
-                # si on renseigne une date de livraison -> force statut LIVREE
-                dl = to_ddmmyyyy(valid_data["DATE_LIVRAISON"])
-                valid_data["DATE_LIVRAISON"] = dl
-                if dl:
-                    valid_data["STATUT"] = "LIVREE"
-
-            statut_eff = norm_statut(valid_data.get("STATUT") or before.get("STATUT"))
-            today = to_ddmmyyyy(date.today())
-
-            if statut_eff == "EN PRODUCTION":
-                valid_data["DATE_PRODUCTION"] = today
-            elif statut_eff == "EN STOCK":
-                valid_data["DATE_STOCK"] = today
-            elif statut_eff in ("LIVREE", "LIVRE"):
-                # si pas de date fournie, on pose aujourd'hui
-                if not valid_data.get("DATE_LIVRAISON"):
-                    valid_data["DATE_LIVRAISON"] = today
-
-            # UPDATE
-            set_clause = ", ".join([f"{k} = :{k}" for k in valid_data.keys()])
-            payload = dict(valid_data)
-            payload["N"] = n
-            res = conn.execute(
-                text(f"UPDATE tableau_production_2 SET {set_clause} WHERE N = :N"),
-                payload,
-            )
-            if res.rowcount == 0:
-                # La ligne existe (on a 'before'), mais aucune valeur n’a changé :
-                # on considère que c'est un succès idempotent.
-                print("[AUDIT] UPDATE : 0 ligne modifiée (valeurs identiques)", flush=True)
+        print(f"[AUDIT] ◀ lot de {len(updated)} commande(s)", flush=True)
+        audit = write_audit_log_remote_batch(audit_entries, _client_pc_name())
 
-        # Diff
-        changes: dict[str, tuple[Any, Any]] = {}
-        for k, new_val in valid_data.items():
-            old_val = before.get(k)
-            if (old_val or "") != (new_val or ""):
-                changes[k] = (old_val, new_val)
+        return jsonify({"ok": True, "updated": updated, "errors": errors, "ignored": ignored_by_n,
+                        "audit": {"ok": bool(audit.get("ok")), "lines": audit.get("lines", 0)}}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
 
-        print(f"[AUDIT] ◀ diff_keys={list(changes.keys())} (len={len(changes)})", flush=True)
+# action → (STATUT posé, colonne tamponnée) ; mêmes règles que update_order
+STATUS_STAMP_ACTIONS = {
+    "production": ("EN PRODUCTION", "DATE_PRODUCTION"),
+    "stock":      ("EN STOCK", "DATE_STOCK"),
+    "livraison":  ("LIVREE", "DATE_LIVRAISON"),
+}
+_STATUT_SQL_ALIASES = {
+    "LIVREE": "('LIVREE','LIVRÉE','LIVRE')",
+}
+
+@app.post("/orders/<int:n>/status-stamp")
+def stamp_order_status(n):
+    """
+    Transition de statut + tampon de date, en UN seul UPDATE conditionnel (pas de pré-lecture) :
+        POST /orders/<n>/status-stamp  {"action": "production"|"stock"|"livraison", "date_livraison": "JJ/MM/AAAA"}
 
-        nom_client = valid_data.get("NOM_CLIENT") or before.get("NOM_CLIENT") or ""
-        pc_name = (
-            request.headers.get("X-Client-PC")
-            or request.headers.get("X-Client-Host")
-            or request.remote_addr
-            or "unknown"
-        )
+    - la date n'est posée qu'à la transition (ou si elle est vide) : re-cliquer ne la décale pas
+    - livraison : la date fournie l'emporte toujours
+    - l'audit (ancien → nouveau) part en tâche de fond
+    """
+    data = request.get_json(silent=True) or {}
+    action = (data.get("action") or "").strip().lower()
+    if action not in STATUS_STAMP_ACTIONS:
+        return jsonify({"ok": False, "error": f"action invalide (attendu: {', '.join(STATUS_STAMP_ACTIONS)})"}), 400
+
+    statut, date_col = STATUS_STAMP_ACTIONS[action]
+    today = to_ddmmyyyy(date.today())
+    forced_date = to_ddmmyyyy(data.get("date_livraison") or "") if action == "livraison" else ""
+    same_statut = f"UPPER(TRIM(STATUT)) IN {_STATUT_SQL_ALIASES.get(statut, '(:statut)')}"
+    snapshot = _ROW_CACHE.snapshot(n)
 
-        write_audit_log_remote(n, nom_client, changes, pc_name)
+    try:
+        with engine.begin() as conn:
+            # Affectations évaluées de gauche à droite : la date voit l'ANCIEN statut.
+            # Les variables @ss_* remontent ancien statut / client / dates pour l'audit.
+            res = conn.execute(text(f"""
+                UPDATE tableau_production_2
+                SET {date_col} = (@ss_date := CASE
+                        WHEN (@ss_prev := COALESCE({date_col}, '')) IS NULL THEN NULL
+                        WHEN :forced <> '' THEN :forced
+                        WHEN {same_statut} AND COALESCE({date_col}, '') <> '' THEN {date_col}
+                        ELSE :today
+                    END),
+                    NOM_CLIENT = (@ss_nom := NOM_CLIENT),
+                    STATUT = IF((@ss_old := COALESCE(STATUT, '')) IS NULL, :statut, :statut)
+                    {_row_version_bump()}
+                WHERE N = :N
+            """), {"forced": forced_date, "today": today, "statut": statut, "N": n})
+            if res.rowcount == 0:
+                return jsonify({"ok": False, "error": "Commande introuvable"}), 404
+            old_statut, nom_client, prev_date, stamped = conn.execute(
+                text("SELECT @ss_old, @ss_nom, @ss_prev, @ss_date")
+            ).fetchone()
+        _notify_write("tableau_production_2", [n])
+        _ROW_CACHE.write_through(n, {"STATUT": statut, date_col: stamped}, snapshot)
+
+        changes = {}
+        if (old_statut or "") != statut:
+            changes["STATUT"] = (old_statut, statut)
+        if (prev_date or "") != (stamped or ""):
+            changes[date_col] = (prev_date, stamped)
+        audit_log_async(n, nom_client or "", changes, _client_pc_name())
 
-        return jsonify({"ok": True}), 200
+        return jsonify({"ok": True, "N": n, "STATUT": statut, date_col: stamped}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+def _clients_where(args) -> tuple[str, dict]:
+    """Filtre commun de /clients et /export/clients → (" WHERE ...", params)."""
+    q = (args.get("q") or "").strip()
+    if not q:
+        return "", {}
+    return """ WHERE (
+                NOM_CLIENT LIKE :q
+                OR NUMERO_DE_SERIE LIKE :q
+                OR VERSION LIKE :q
+                OR TYPE_DE_CONNEXION LIKE :q
+                OR MDP LIKE :q
+            )""", {"q": f"%{q}%"}
+
 @app.get("/clients")
+@serve_stale_on_failure
 def get_clients():
-    q = (request.args.get("q") or "").strip()
-
     # bornes sûres
     try:
         limit = int(request.args.get("limit", "500"))
@@ -1313,40 +4409,551 @@ def get_clients():
         offset = 0
 
     try:
-        with engine.connect() as conn:
-            base_sql = """
-                SELECT
-                    NOM_CLIENT,
-                    NUMERO_DE_SERIE,
-                    VERSION,
-                    MDP,
-                    TYPE_DE_CONNEXION
-                FROM clients
-            """
-            where = []
-            params = {}
-
-            if q:
-                where.append("""(
-                    NOM_CLIENT LIKE :q
-                    OR NUMERO_DE_SERIE LIKE :q
-                    OR VERSION LIKE :q
-                    OR TYPE_DE_CONNEXION LIKE :q
-                    OR MDP LIKE :q
-                )""")
-                params["q"] = f"%{q}%"
-
-            where_sql = (" WHERE " + " AND ".join(where)) if where else ""
-            order_sql = " ORDER BY NOM_CLIENT ASC, NUMERO_DE_SERIE ASC"
-            limit_sql = f" LIMIT {limit} OFFSET {offset}"
-
-            rows = conn.execute(text(base_sql + where_sql + order_sql + limit_sql), params).mappings().all()
+        base_sql = """
+            SELECT
+                NOM_CLIENT,
+                NUMERO_DE_SERIE,
+                VERSION,
+                MDP,
+                TYPE_DE_CONNEXION
+            FROM clients
+        """
+        where_sql, params = _clients_where(request.args)
+        order_sql = " ORDER BY NOM_CLIENT ASC, NUMERO_DE_SERIE ASC"
+        limit_sql = f" LIMIT {limit} OFFSET {offset}"
 
-        return jsonify({"ok": True, "rows": [dict(r) for r in rows]}), 200
+        sql = text(base_sql + where_sql + order_sql + limit_sql)
+        rows = _cached_rows(sql, params, tables=("clients",))
+
+        return jsonify({"ok": True, "rows": rows}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# -----------------------------------------------------------
+# Export en flux (CSV / XLSX) : connexion dédiée + curseur non bufferisé
+# -----------------------------------------------------------
+import csv
+import tempfile
+from flask import Response
+
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_FETCH_ROWS = 1000            # lignes lues par paquet sur le curseur non bufferisé
+EXPORT_NET_WRITE_TIMEOUT_S = 600    # client lent : MySQL attend au lieu de couper le flux (défaut 60 s)
+EXPORT_XLSX_MAX_ROWS = 1048575      # une feuille Excel, en-tête compris : 1 048 576 lignes
+EXPORT_FILE_CHUNK = 64 * 1024
+EXPORT_RETRY_AFTER_S = 5
+EXPORT_FORMATS = ("csv", "xlsx")
+
+_EXPORT_SLOTS = threading.BoundedSemaphore(max(1, EXPORT_MAX_CONCURRENT))
+
+openpyxl = None  # type: ignore
+
+def _require_openpyxl() -> bool:
+    """openpyxl (facultatif, export XLSX), importé au premier export XLSX."""
+    global openpyxl
+    if openpyxl is None:
+        try:
+            import openpyxl as _opx  # type: ignore
+            openpyxl = _opx
+        except Exception:
+            return False
+    return True
+
+class _ExportCursor:
+    """
+    Lecture en flux pour /export/* :
+    - connexion dédiée hors pool : un export long ne garde ni connexion du pool ni créneau d'admission,
+      et survit au teardown de la requête (le corps est envoyé après)
+    - curseur non bufferisé : lignes lues par paquets de EXPORT_FETCH_ROWS → mémoire constante
+    - instantané cohérent (CONSISTENT SNAPSHOT, READ ONLY) le temps du téléchargement
+    - au plus EXPORT_MAX_CONCURRENT exports simultanés (au-delà : AdmissionRejected → 429)
+    - close() idempotent : fin du flux, erreur ou client parti (le serveur WSGI appelle close())
+    """
+    def __init__(self, sql: str, params: dict):
+        self._raw = None
+        self._cur = None
+        self.columns: list[str] = []
+        self.rows = 0
+        if not _EXPORT_SLOTS.acquire(blocking=False):
+            raise AdmissionRejected("export", EXPORT_RETRY_AFTER_S)
+        self._slot = True
+        try:
+            _require_mysql()
+            _BREAKER.before_checkout()
+            try:
+                self._raw = mysql.connector.connect(**_mysql_cfg(start_tunnel()))
+            except Exception:
+                _BREAKER.record_failure()
+                raise
+            _BREAKER.record_success()
+            _set_session_locale(self._raw)
+            cur = self._raw.cursor()
+            try:
+                cur.execute(f"SET SESSION net_write_timeout = {int(EXPORT_NET_WRITE_TIMEOUT_S)}")
+                cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            finally:
+                cur.close()
+            self._cur = self._raw.cursor(buffered=False)
+            self._cur.execute(re.sub(r":([A-Za-z_]\w*)", r"%(\1)s", str(sql)), params)
+            self.columns = [d[0] for d in self._cur.description]
+        except Exception:
+            self.close()
+            raise
+
+    def batches(self):
+        while self._cur is not None:
+            rows = self._cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                return
+            self.rows += len(rows)
+            yield rows
+
+    def close(self) -> None:
+        cur, self._cur = self._cur, None
+        raw, self._raw = self._raw, None
+        for obj in (cur, raw):
+            if obj is not None:
+                try:
+                    obj.close()   # résultat non lu (client parti) : la fermeture du socket l'abandonne
+                except Exception:
+                    pass
+        if self._slot:
+            self._slot = False
+            _EXPORT_SLOTS.release()
+
+class _ClosingStream:
+    """Corps de réponse itérable dont close() (appelé par le serveur WSGI) libère la ressource."""
+    def __init__(self, chunks, on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def close(self) -> None:
+        try:
+            self._chunks.close()
+        finally:
+            self._on_close()
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%d/%m/%Y %H:%M:%S")
+    if isinstance(v, date):
+        return v.strftime("%d/%m/%Y")
+    if isinstance(v, (Decimal, float)):
+        return str(v).replace(".", ",")      # Excel FR
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v).decode("utf-8", "replace")
+    return v
+
+def _csv_chunks(export: _ExportCursor, name: str):
+    """CSV ";" + BOM UTF-8 (ouverture directe dans Excel FR), un morceau par paquet de lignes."""
+    t0 = time.monotonic()
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";", lineterminator="\r\n")
+    w.writerow(export.columns)
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    for rows in export.batches():
+        buf.seek(0)
+        buf.truncate()
+        w.writerows([_csv_value(v) for v in r] for r in rows)
+        yield buf.getvalue().encode("utf-8")
+    _log(f"EXPORT {name} csv : {export.rows} lignes en {time.monotonic() - t0:.1f} s")
+
+def _xlsx_value(v):
+    if isinstance(v, (bytes, bytearray)):
+        v = bytes(v).decode("utf-8", "replace")
+    if isinstance(v, str):
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        return ILLEGAL_CHARACTERS_RE.sub("", v)
+    return v
+
+def _xlsx_file(export: _ExportCursor, name: str) -> tuple[Any, bool]:
+    """
+    Classeur write_only (lignes écrites au fil de l'eau dans un fichier temporaire, mémoire constante).
+    Un .xlsx est une archive zip : il est envoyé une fois complet, contrairement au CSV.
+    """
+    t0 = time.monotonic()
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=name[:31])
+    ws.append(export.columns)
+    written, truncated = 0, False
+    for rows in export.batches():
+        if written + len(rows) > EXPORT_XLSX_MAX_ROWS:
+            rows = rows[: EXPORT_XLSX_MAX_ROWS - written]
+            truncated = True
+        for r in rows:
+            ws.append([_xlsx_value(v) for v in r])
+        written += len(rows)
+        if truncated:
+            break
+    tmp = tempfile.TemporaryFile()
+    try:
+        wb.save(tmp)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    _log(f"EXPORT {name} xlsx : {written} lignes en {time.monotonic() - t0:.1f} s"
+         + (" (tronqué)" if truncated else ""))
+    return tmp, truncated
+
+def _file_chunks(f):
+    while True:
+        chunk = f.read(EXPORT_FILE_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+def _export_format(args) -> str:
+    fmt = (args.get("format") or "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format inconnu : {fmt} (possibles : {', '.join(EXPORT_FORMATS)})")
+    return fmt
+
+def _export_response(sql: str, params: dict, fmt: str, name: str):
+    """Ouvre le curseur d'export puis renvoie le fichier en flux (erreurs d'ouverture → JSON)."""
+    if fmt == "xlsx" and not _require_openpyxl():
+        return jsonify({"ok": False, "error": "export XLSX indisponible : openpyxl manquant — pip install openpyxl"}), 501
+    try:
+        export = _ExportCursor(sql, params)
+    except AdmissionRejected as e:
+        g.admission_rejected = e      # → 429 + Retry-After (_overload_response)
+        return jsonify({"ok": False, "error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    if fmt == "csv":
+        body = _ClosingStream(_csv_chunks(export, name), export.close)
+        mimetype = "text/csv; charset=utf-8"
+    else:
+        try:
+            tmp, truncated = _xlsx_file(export, name)
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        finally:
+            export.close()
+        if truncated:
+            headers["X-Export-Truncated"] = str(EXPORT_XLSX_MAX_ROWS)
+        body = _ClosingStream(_file_chunks(tmp), tmp.close)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return Response(body, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+@app.get("/export/orders")
+def export_orders():
+    """
+    Table de production complète, en flux, avec les filtres de /orders
+    (status, marketing, commercial, from/to/date_field, q, n, include_archived) :
+    - format=csv (défaut) | xlsx
+    - fields=N,STATUT,... (défaut : toutes les colonnes)
+    """
+    try:
+        fmt = _export_format(request.args)
+        where_sql, params = _orders_where(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    try:
+        cols = _order_select_columns(request.args.get("fields"))
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    source, _ = _orders_source(_include_archived(request.args))
+    sql = f"SELECT {cols} FROM {source}{where_sql} ORDER BY N DESC"
+    return _export_response(sql, params, fmt, "commandes")
+
+@app.get("/export/clients")
+def export_clients():
+    """Table clients complète, en flux, avec le filtre q de /clients ; format=csv (défaut) | xlsx."""
+    try:
+        fmt = _export_format(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    where_sql, params = _clients_where(request.args)
+    sql = ("SELECT NOM_CLIENT, NUMERO_DE_SERIE, VERSION, MDP, TYPE_DE_CONNEXION FROM clients"
+           f"{where_sql} ORDER BY NOM_CLIENT ASC, NUMERO_DE_SERIE ASC")
+    return _export_response(sql, params, fmt, "clients")
+
+# -----------------------------------------------------------
+# Import en masse (CSV / JSON) : validation groupée, doublons en une requête, INSERT par paquets
+# -----------------------------------------------------------
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "50000"))
+IMPORT_CHUNK = 500            # lignes par executemany (INSERT multi-lignes) et par transaction
+IMPORT_DUP_CHUNK = 1000       # valeurs par IN (...) du contrôle de doublons
+IMPORT_DUPLICATES = ("reject", "allow")
+
+# kind → (table, colonnes requises, clé de doublon)
+IMPORT_TABLES = {
+    "orders":  ("tableau_production_2", ("N_CLIENT", "NOM_CLIENT"), ("NOM_CLIENT",)),
+    "clients": ("clients", ("NOM_CLIENT",), ("NOM_CLIENT", "NUMERO_DE_SERIE")),
+}
+
+def _import_bool(name: str, default: bool = False) -> bool:
+    raw = (request.args.get(name) or "").strip().lower()
+    return default if not raw else raw in ("1", "true", "oui", "yes", "on")
+
+def _csv_records(raw: bytes) -> list[tuple[int, dict]]:
+    """CSV (UTF-8 avec ou sans BOM, sinon Windows-1252 ; séparateur ; , ou tabulation) → [(ligne, {COLONNE: valeur})]."""
+    try:
+        txt = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        txt = raw.decode("cp1252", "replace")
+    first = txt.split("\n", 1)[0]
+    try:
+        delimiter = csv.Sniffer().sniff(first, delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ";"
+    reader = csv.reader(io.StringIO(txt, newline=""), delimiter=delimiter)
+    header = [h.strip().upper().replace(" ", "_") for h in next(reader, [])]
+    if not any(header):
+        raise ValueError("CSV vide ou sans ligne d'en-tête")
+    out = []
+    for rec in reader:
+        if any(c.strip() for c in rec):
+            out.append((reader.line_num, {h: v for h, v in zip(header, rec) if h}))
+    return out
+
+def _import_records() -> list[tuple[int, dict]]:
+    """
+    Corps de /import/* → [(ligne, {colonne: valeur})] :
+    - fichier multipart "file" (.csv ou .json), corps text/csv, ou JSON [{...}] / {"rows": [...]}
+    - ligne : n° de ligne du CSV (en-tête = 1), rang de l'objet (à partir de 1) en JSON
+    """
+    f = request.files.get("file")
+    if f is not None:
+        raw, is_json = f.read(), (f.filename or "").lower().endswith(".json")
+    else:
+        raw, is_json = request.get_data(), request.is_json
+    if not is_json:
+        return _csv_records(raw)
+    try:
+        data = json.loads(raw.decode("utf-8-sig") or "null")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"JSON illisible : {e}") from None
+    rows = data.get("rows") if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+        raise ValueError('JSON attendu : [{"COLONNE": valeur}, ...] ou {"rows": [...]}')
+    return [(i + 1, {str(k).strip().upper(): v for k, v in r.items()}) for i, r in enumerate(rows)]
+
+def _is_import_date_col(name: str) -> bool:
+    return name.startswith("DATE_") or name == "LIVRAISON_PREVUE"
+
+def _import_normalize(record: dict, cols: dict[str, _ColumnInfo]) -> tuple[dict, dict]:
+    """
+    Une ligne importée → (valeurs typées, erreurs {colonne: message}) :
+    dates texte → JJ/MM/AAAA (to_ddmmyyyy), montants texte → "1234.56" (normalize_amount_to_db),
+    puis mêmes contrôles de type/longueur que les routes unitaires (_coerce_value).
+    """
+    values, errors = {}, {}
+    for k, v in record.items():
+        col = cols.get(k)
+        if col is None or k in ("N", ROW_VERSION_COLUMN):
+            continue
+        blank = v is None or (isinstance(v, str) and not v.strip())
+        if not blank and col.data_type in _TEXT_TYPES:
+            if _is_import_date_col(k):
+                d = to_ddmmyyyy(v if isinstance(v, (date, datetime)) else str(v))
+                if not d:
+                    errors[k] = "date illisible (JJ/MM/AAAA ou AAAA-MM-JJ)"
+                    continue
+                v = d
+            elif k.startswith("MONTANT"):
+                amount = normalize_amount_to_db(v)
+                if amount is None:
+                    errors[k] = "montant illisible"
+                    continue
+                v = amount
+        try:
+            values[k] = _coerce_value(col, v)
+        except ValueError as e:
+            errors[k] = str(e)
+    return values, errors
+
+def _import_order_defaults(values: dict) -> None:
+    """
+    Comme POST /orders, sans écraser ce que fournit le fichier (historique) :
+    DATE_PLANNING = aujourd'hui si absente, LIVRAISON_PREVUE calculée depuis DATE_PLANNING si absente,
+    DATE_LIVRAISON renseignée → LIVREE ; aucun tampon "aujourd'hui" sur les dates de statut.
+    """
+    if not values.get("DATE_PLANNING"):
+        values["DATE_PLANNING"] = to_ddmmyyyy(date.today())
+    if not values.get("LIVRAISON_PREVUE"):
+        planning = datetime.strptime(values["DATE_PLANNING"], "%d/%m/%Y").date()
+        values["LIVRAISON_PREVUE"] = to_ddmmyyyy(
+            _livraison_prevue(planning, values.get("RAL_BDC"), values.get("RAL_MODULE"))
+        )
+    if values.get("DATE_LIVRAISON"):
+        values["STATUT"] = "LIVREE"
+    # VARCHAR NOT NULL : toujours présentes à l'INSERT
+    for col in ("DATE_PRODUCTION", "DATE_STOCK", "DATE_LIVRAISON"):
+        if values.get(col) is None:
+            values[col] = ""
+
+def _import_key(values: dict, key_cols: tuple) -> tuple:
+    return tuple(_norm(str(values.get(c) or "")) for c in key_cols)
+
+def _existing_import_keys(kind: str, keys: set[tuple], raw_names: set[str]) -> set[tuple]:
+    """
+    Clés déjà en base, en une requête par paquet de IMPORT_DUP_CHUNK noms (IN sur NOM_CLIENT, collation *_ci,
+    noms tels que saisis + forme sans accents) ; comparaison finale sans accents ni casse, comme POST /orders.
+    """
+    names = sorted(raw_names | {k[0] for k in keys})
+    found: set[tuple] = set()
+    with engine.connect() as conn:
+        for i in range(0, len(names), IMPORT_DUP_CHUNK):
+            in_sql, in_params = _in_clause(names[i:i + IMPORT_DUP_CHUNK], prefix="nm")
+            if kind == "orders":
+                # même règle que POST /orders : nom déjà connu côté clients OU commandes (archive comprise)
+                sql = f"SELECT NOM_CLIENT FROM clients WHERE NOM_CLIENT IN ({in_sql})" + "".join(
+                    f" UNION SELECT NOM_CLIENT FROM {t} WHERE NOM_CLIENT IN ({in_sql})" for t in _order_tables())
+            else:
+                sql = f"SELECT NOM_CLIENT, NUMERO_DE_SERIE FROM clients WHERE NOM_CLIENT IN ({in_sql})"
+            for r in conn.execute(text(sql), in_params).fetchall():
+                found.add(tuple(_norm(str(v or "")) for v in r))
+    return found & keys
+
+def _insert_chunk(table: str, cols: tuple, payloads: list[dict]) -> list:
+    """Un paquet → un INSERT multi-lignes (executemany) dans sa propre transaction ; renvoie les N créés."""
+    sql = text(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(f':{c}' for c in cols)})")
+    with engine.begin() as conn:
+        res = conn.executemany(sql, payloads)
+        first = res.lastrowid
+    # auto-incrément consécutif pour un INSERT multi-lignes (innodb_autoinc_lock_mode ≤ 1, défaut MariaDB)
+    return list(range(int(first), int(first) + len(payloads))) if first else []
+
+def _run_import(kind: str):
+    table, required, key_cols = IMPORT_TABLES[kind]
+    dry_run = _import_bool("dry_run")
+    notify = _import_bool("notify") and kind == "orders"
+    duplicates = (request.args.get("duplicates") or "reject").strip().lower()
+    if duplicates not in IMPORT_DUPLICATES:
+        return jsonify({"ok": False, "error": f"duplicates : {' | '.join(IMPORT_DUPLICATES)}"}), 400
+    try:
+        records = _import_records()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if not records:
+        return jsonify({"ok": False, "error": "Aucune ligne à importer"}), 400
+    if len(records) > IMPORT_MAX_ROWS:
+        return jsonify({"ok": False, "error": f"Maximum {IMPORT_MAX_ROWS} lignes par import"}), 400
+
+    t0 = time.monotonic()
+    errors: list[dict] = []
+    try:
+        cols = _SCHEMA.columns(table)
+        seen_cols = {k for _, r in records for k in r}
+        ignored = sorted(seen_cols - set(cols) - {"N"})
+
+        # ---- validation + normalisation, ligne à ligne mais sans aller-retour SQL ----
+        valid: list[tuple[int, dict]] = []
+        for ligne, record in records:
+            values, field_errors = _import_normalize(record, cols)
+            missing = [c for c in required if not str(values.get(c) or "").strip()]
+            if missing:
+                field_errors.update({c: "valeur requise" for c in missing})
+            if field_errors:
+                errors.append({"ligne": ligne, "error": "Valeurs invalides", "errors": field_errors})
+                continue
+            if kind == "orders":
+                _import_order_defaults(values)
+            valid.append((ligne, values))
+
+        # ---- doublons : dans le fichier, puis en base (une requête par paquet) ----
+        if duplicates == "reject" and valid:
+            first_line: dict[tuple, int] = {}
+            unique: list[tuple[int, dict]] = []
+            for ligne, values in valid:
+                k = _import_key(values, key_cols)
+                if k in first_line:
+                    errors.append({"ligne": ligne, "error": f"Doublon de la ligne {first_line[k]}"})
+                    continue
+                first_line[k] = ligne
+                unique.append((ligne, values))
+            raw_names = {str(v.get("NOM_CLIENT") or "").strip() for _, v in unique}
+            existing = _existing_import_keys(kind, set(first_line), raw_names)
+            valid = []
+            for ligne, values in unique:
+                if _import_key(values, key_cols) in existing:
+                    label = " / ".join(str(values.get(c) or "") for c in key_cols)
+                    errors.append({"ligne": ligne, "error": f"« {label} » existe déjà"})
+                else:
+                    valid.append((ligne, values))
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+    report = {"received": len(records), "valid": len(valid), "ignored_columns": ignored}
+    if dry_run or not valid:
+        errors.sort(key=lambda x: x["ligne"])
+        status = 200 if (dry_run or not errors) else 400
+        return jsonify({"ok": status == 200, "dry_run": dry_run, **report, "inserted": 0, "errors": errors}), status
+
+    # ---- INSERT : par jeu de colonnes, paquets de IMPORT_CHUNK, une transaction par paquet ----
+    inserted: list[tuple[int, Any, dict]] = []     # (ligne, N, valeurs)
+    groups: dict[tuple, list[tuple[int, dict]]] = {}
+    for ligne, values in valid:
+        groups.setdefault(tuple(values), []).append((ligne, values))
+    for group_cols, items in groups.items():
+        for i in range(0, len(items), IMPORT_CHUNK):
+            chunk = items[i:i + IMPORT_CHUNK]
+            try:
+                ids = _insert_chunk(table, group_cols, [v for _, v in chunk])
+                inserted.extend((ligne, ids[j] if j < len(ids) else None, v) for j, (ligne, v) in enumerate(chunk))
+            except Exception:
+                # paquet refusé : ligne par ligne pour isoler la ou les fautives
+                for ligne, values in chunk:
+                    try:
+                        ids = _insert_chunk(table, group_cols, [values])
+                        inserted.append((ligne, ids[0] if ids else None, values))
+                    except Exception as e:
+                        errors.append({"ligne": ligne, "error": str(e)})
+
+    ids = [n for _, n, _ in inserted if n is not None]
+    if inserted:
+        _notify_write(table, ids if len(ids) == len(inserted) else None)
+    _log(f"IMPORT {kind} : {len(inserted)}/{len(records)} lignes en {time.monotonic() - t0:.1f} s")
+
+    # ---- notifications : désactivées par défaut (un mail Outlook par commande) ----
+    mail = {"sent": 0, "failed": 0} if notify else None
+    if notify:
+        _release_request_conn()   # paquets validés : connexion rendue pendant les envois
+        for _, n, values in inserted:
+            try:
+                info = _send_new_order_email_bounded(n, values) if n else {}
+                mail["sent" if info.get("sent") else "failed"] += 1
+            except Exception as e:
+                mail["failed"] += 1
+                print(f"[mail] import : erreur non bloquante: {e}")
+
+    errors.sort(key=lambda x: x["ligne"])
+    body = {"ok": True, "dry_run": False, **report, "inserted": len(inserted), "errors": errors}
+    if kind == "orders":
+        body["N"] = ids
+        body["mail"] = mail
+    return jsonify(body), 201 if inserted else 400
+
+@app.post("/import/orders")
+def import_orders():
+    """
+    Import en masse de commandes (historique, reprise) :
+        POST /import/orders?dry_run=1        corps CSV (en-tête = noms de colonnes), JSON, ou fichier "file"
+    - contrôles de POST /orders : types/longueurs, N_CLIENT + NOM_CLIENT requis, NOM_CLIENT déjà connu refusé
+      (duplicates=allow pour passer outre), doublons internes au fichier
+    - dates et montants normalisés, LIVRAISON_PREVUE calculée si absente
+    - notify=1 : mail de création par commande (désactivé par défaut)
+    Rapport : received, valid, inserted, N, errors [{ligne, error, errors: {colonne: message}}].
+    """
+    return _run_import("orders")
+
+@app.post("/import/clients")
+def import_clients():
+    """Import en masse de clients (CSV / JSON) ; doublon = même NOM_CLIENT + NUMERO_DE_SERIE. Mêmes options."""
+    return _run_import("clients")
+
 @app.get("/donnees")
+@serve_stale_on_failure
 def get_donnees():
     """
     /donnees?nom_colonne=MODE_PAIEMENT  ->  {"ok":true, "values":["INGENICO SELF", ...]}
@@ -1356,14 +4963,19 @@ def get_donnees():
         return jsonify({"ok": False, "error": "nom_colonne manquant"}), 400
 
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text("""
-                SELECT VALEUR
-                FROM donnees
-                WHERE NOM_COLONNE = :nom
-                  AND COALESCE(VALEUR,'') <> ''
-                ORDER BY N
-            """), {"nom": nom}).fetchall()
+        sql = text("""
+            SELECT VALEUR
+            FROM donnees
+            WHERE NOM_COLONNE = :nom
+              AND COALESCE(VALEUR,'') <> ''
+            ORDER BY N
+        """)
+        rows = _mirror_rows(sql, {"nom": nom}, tables=("donnees",))
+        if rows is not None:
+            rows = [(r["VALEUR"],) for r in rows]
+        else:
+            with engine.connect() as conn:
+                rows = conn.execute(sql, {"nom": nom}).fetchall()
 
         values = [r[0] for r in rows]
         values = list(dict.fromkeys(values))
@@ -1372,6 +4984,7 @@ def get_donnees():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.get("/donnees/all")
+@serve_stale_on_failure
 def get_donnees_all():
     """
     Retourne toutes les valeurs de la table `donnees`, groupées par NOM_COLONNE.
@@ -1387,13 +5000,18 @@ def get_donnees_all():
     }
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text("""
-                SELECT NOM_COLONNE, VALEUR
-                FROM donnees
-                WHERE COALESCE(VALEUR, '') <> ''
-                ORDER BY NOM_COLONNE, N
-            """)).fetchall()
+        sql = text("""
+            SELECT NOM_COLONNE, VALEUR
+            FROM donnees
+            WHERE COALESCE(VALEUR, '') <> ''
+            ORDER BY NOM_COLONNE, N
+        """)
+        rows = _mirror_rows(sql, tables=("donnees",))
+        if rows is not None:
+            rows = [(r["NOM_COLONNE"], r["VALEUR"]) for r in rows]
+        else:
+            with engine.connect() as conn:
+                rows = conn.execute(sql).fetchall()
 
         data = {}
         for nom, val in rows:
@@ -1418,21 +5036,26 @@ def get_donnees_all():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.get("/donnees/cols")
+@serve_stale_on_failure
 def get_donnees_cols():
     """
     Retourne la liste des NOM_COLONNE distincts de la table `donnees`.
     Utilisé pour filtrer les champs à hydrater côté front.
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text("""
-                SELECT DISTINCT NOM_COLONNE
-                FROM donnees
-                WHERE COALESCE(NOM_COLONNE, '') <> ''
-                ORDER BY NOM_COLONNE
-            """)).fetchall()
+        sql = text("""
+            SELECT DISTINCT NOM_COLONNE
+            FROM donnees
+            WHERE COALESCE(NOM_COLONNE, '') <> ''
+            ORDER BY NOM_COLONNE
+        """)
+        rows = _mirror_rows(sql, tables=("donnees",))
+        if rows is not None:
+            cols = [r["NOM_COLONNE"] for r in rows]
+        else:
+            with engine.connect() as conn:
+                cols = [r[0] for r in conn.execute(sql).fetchall()]
 
-        cols = [r[0] for r in rows]
         return jsonify({"ok": True, "cols": cols}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -1457,6 +5080,7 @@ def normalize_amount_to_db(val: object):
     return m.group(0)  # ex: "1234.56"
 
 @app.get("/clients/check")
+@serve_stale_on_failure
 def check_client_exists():
     """
     Vérifie si un client existe déjà dans la table `clients`.
@@ -1489,16 +5113,27 @@ from datetime import date
 from urllib.parse import quote
 import unicodedata
 
-try:
-    import win32com.client as win32
-    import pythoncom
-except Exception:
-    win32 = None
-    pythoncom = None
+win32 = None
+pythoncom = None
+
+def _require_win32() -> bool:
+    """win32com/pythoncom (Windows + pywin32), importés au premier besoin en mode DEFERRED_IMPORTS."""
+    global win32, pythoncom
+    if win32 is None:
+        try:
+            import win32com.client as _w32
+            import pythoncom as _pcom
+            win32, pythoncom = _w32, _pcom
+        except Exception:
+            return False
+    return True
+
+if not DEFERRED_IMPORTS:
+    _require_win32()
 
 def _get_outlook_app():
     """Essaie d’obtenir l’objet COM Outlook."""
-    if not win32:
+    if not _require_win32():
         return None
     try:
         return win32.gencache.EnsureDispatch("Outlook.Application")
@@ -1692,7 +5327,7 @@ def send_new_order_email(order_id: int, row: dict):
         """
 
         # ===== COM Outlook prêt ? sinon fallback mailto =====
-        if pythoncom:
+        if _require_win32():
             try: pythoncom.CoInitialize()
             except Exception: pass
 
@@ -1746,7 +5381,21 @@ def send_new_order_email(order_id: int, row: dict):
             try: pythoncom.CoUninitialize()
             except Exception: pass
 
+from concurrent.futures import TimeoutError as _FutureTimeout
+
+MAIL_SEND_TIMEOUT_S = float(os.getenv("MAIL_SEND_TIMEOUT_S", "40"))
+# Outlook (COM) : un thread dédié → accès sérialisé, et la requête n'attend pas plus que MAIL_SEND_TIMEOUT_S
+_COM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outlook-com")
+
+def _send_new_order_email_bounded(order_id: int, row: dict) -> dict:
+    fut = _COM_EXECUTOR.submit(send_new_order_email, order_id, row)
+    try:
+        return fut.result(timeout=MAIL_SEND_TIMEOUT_S) or {}
+    except _FutureTimeout:
+        return {"attempted": True, "sent": False, "reason": "Outlook lent, envoi poursuivi en arrière-plan"}
+
 @app.get("/gdp/maintenance")
+@serve_stale_on_failure
 def get_maintenance_status():
     try:
         with engine.connect() as conn:
@@ -1760,13 +5409,683 @@ def get_maintenance_status():
     except Exception as e:
         return jsonify({"ok": False, "error": str(e), "STATUT": 0}), 500
 
+# -----------------------------------------------------------
+# Géocodage : cache persistant (adresse normalisée → lat/lon), coalescence, fournisseur enfichable
+# -----------------------------------------------------------
+import hashlib
+import urllib.request
+
+GEOCODE_TABLE = "geocodage_cache"
+# nominatim en production ; offline (gazetteer local) pour le banc d'essai et les essais sans réseau
+GEOCODE_PROVIDER = (os.getenv("GEOCODE_PROVIDER") or "nominatim").strip().lower()   # nominatim | offline
+GEOCODE_GAZETTEER = os.getenv("GEOCODE_GAZETTEER") or str(_LOG_DIR / "gazetteer.csv")
+GEOCODE_COLUMN = (os.getenv("GEOCODE_COLUMN") or "COORDONNEES").strip()   # colonne "lat,lon" des commandes
+GEOCODE_MISS_TTL_DAYS = int(os.getenv("GEOCODE_MISS_TTL_DAYS", "7"))   # introuvable : redemandée après ce délai
+GEOCODE_MEMO_TTL = 600.0            # s, mémoire du processus devant la table
+GEOCODE_MIN_INTERVAL_S = float(os.getenv("GEOCODE_MIN_INTERVAL_S", "1.0"))   # politique Nominatim : 1 req/s
+GEOCODE_TIMEOUT_S = 10.0
+GEOCODE_USER_AGENT = os.getenv("GEOCODE_USER_AGENT", "BackendGDP/1.0")
+GEOCODE_NOMINATIM_URL = os.getenv("GEOCODE_NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODE_BATCH = 200                 # commandes lues par passe de rattrapage
+
+_GEOCODE_PROVIDERS: dict = {}
+_GEOCODE_LOCAL: set[str] = set()    # fournisseurs locaux : échecs jamais enregistrés (relecture gratuite)
+_GEOCODE_MEMO = _QueryCache(GEOCODE_MEMO_TTL, 2048)
+_geocode_table_ready = False
+
+def geocode_provider(name: str, local: bool = False):
+    """Enregistre fn(parts) → (lat, lon) | None ; parts = {"voie", "cp", "ville", "pays", "q"}. Choix : GEOCODE_PROVIDER."""
+    def deco(fn):
+        _GEOCODE_PROVIDERS[name] = fn
+        if local:
+            _GEOCODE_LOCAL.add(name)
+        return fn
+    return deco
+
+def _geocode_query(parts: dict) -> str:
+    """Même libellé que le formulaire : "voie, cp ville, pays" (ou q tel quel)."""
+    if parts.get("q"):
+        return parts["q"].strip()
+    cp_ville = " ".join(p for p in (parts.get("cp"), parts.get("ville")) if p)
+    return ", ".join(p for p in (parts.get("voie"), cp_ville, parts.get("pays")) if p)
+
+def _geocode_norm(s: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", _norm(s)).strip()
+
+class _Gazetteer:
+    """
+    Fournisseur hors ligne : CSV local "cp;ville;lat;lon" (GEOCODE_GAZETTEER), chargé une fois.
+    Recherche CP + ville, puis ville, puis CP (précision commune). Fichier absent → rien n'est trouvé.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_cp_ville: dict[tuple[str, str], tuple[float, float]] = {}
+        self._by_ville: dict[str, tuple[float, float]] = {}
+        self._by_cp: dict[str, tuple[float, float]] = {}
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                _log(f"GEOCODE : gazetteer absent ({self.path})")
+                return
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            for _, row in _csv_records(raw):
+                vals = {_geocode_norm(k): (v or "").strip() for k, v in row.items() if k}
+                try:
+                    coords = (float(vals["lat"].replace(",", ".")), float(vals["lon"].replace(",", ".")))
+                except (KeyError, ValueError):
+                    continue
+                cp, ville = vals.get("cp", ""), _geocode_norm(vals.get("ville", ""))
+                if cp and ville:
+                    self._by_cp_ville.setdefault((cp, ville), coords)
+                if ville:
+                    self._by_ville.setdefault(ville, coords)
+                if cp:
+                    self._by_cp.setdefault(cp, coords)
+
+    def lookup(self, parts: dict) -> Optional[tuple[float, float]]:
+        self._load()
+        cp = (parts.get("cp") or "").strip()
+        ville = _geocode_norm(parts.get("ville") or "")
+        return (self._by_cp_ville.get((cp, ville)) or self._by_ville.get(ville)
+                or self._by_cp.get(cp))
+
+_GAZETTEER = _Gazetteer(GEOCODE_GAZETTEER)
+
+@geocode_provider("offline", local=True)
+def _geocode_offline(parts: dict) -> Optional[tuple[float, float]]:
+    return _GAZETTEER.lookup(parts)
+
+_nominatim_lock = threading.Lock()
+_nominatim_last = 0.0
+
+@geocode_provider("nominatim")
+def _geocode_nominatim(parts: dict) -> Optional[tuple[float, float]]:
+    """Nominatim (OSM), appels sérialisés et espacés de GEOCODE_MIN_INTERVAL_S pour tout le backend."""
+    global _nominatim_last
+    url = f"{GEOCODE_NOMINATIM_URL}?format=json&limit=1&addressdetails=0&q={quote(_geocode_query(parts))}"
+    req = urllib.request.Request(url, headers={"User-Agent": GEOCODE_USER_AGENT, "Accept-Language": "fr"})
+    with _nominatim_lock:
+        wait = _nominatim_last + GEOCODE_MIN_INTERVAL_S - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            with urllib.request.urlopen(req, timeout=GEOCODE_TIMEOUT_S) as resp:
+                data = json.loads(resp.read() or b"[]")
+        finally:
+            _nominatim_last = time.monotonic()
+    if isinstance(data, list) and data:
+        try:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        except (KeyError, TypeError, ValueError):
+            return None
+    return None
+
+def _geocode_ensure_table(conn) -> None:
+    global _geocode_table_ready
+    if _geocode_table_ready:
+        return
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {GEOCODE_TABLE} (
+          CLE CHAR(40) NOT NULL,
+          ADRESSE VARCHAR(500) NOT NULL,
+          LAT DOUBLE NULL,
+          LON DOUBLE NULL,
+          FOURNISSEUR VARCHAR(32) NOT NULL,
+          MAJ_LE DATETIME NOT NULL,
+          PRIMARY KEY (CLE)
+        ) ENGINE=InnoDB
+    """))
+    _geocode_table_ready = True
+
+def _geocode_load(key: str, norm: str, parts: dict) -> dict:
+    """Table de cache d'abord ; sinon fournisseur, résultat (même négatif) enregistré."""
+    provider = _GEOCODE_PROVIDERS.get(GEOCODE_PROVIDER)
+    if provider is None:
+        raise RuntimeError(f"GEOCODE_PROVIDER inconnu : {GEOCODE_PROVIDER} "
+                           f"(possibles : {', '.join(sorted(_GEOCODE_PROVIDERS))})")
+    with engine.begin() as conn:
+        _geocode_ensure_table(conn)
+        row = conn.execute(text(
+            f"SELECT LAT, LON, FOURNISSEUR, MAJ_LE FROM {GEOCODE_TABLE} WHERE CLE = :k"
+        ), {"k": key}).mappings().first()
+    if row is not None:
+        fresh_miss = (row["FOURNISSEUR"] == GEOCODE_PROVIDER
+                      and row["MAJ_LE"] > datetime.now() - timedelta(days=GEOCODE_MISS_TTL_DAYS))
+        if row["LAT"] is not None or fresh_miss:
+            return {"found": row["LAT"] is not None, "lat": row["LAT"], "lon": row["LON"],
+                    "provider": row["FOURNISSEUR"], "cached": True}
+
+    coords = provider(parts)   # exception → rien d'enregistré, redemandé au prochain appel
+    lat, lon = (round(coords[0], 7), round(coords[1], 7)) if coords else (None, None)
+    if coords is None and GEOCODE_PROVIDER in _GEOCODE_LOCAL:
+        return {"found": False, "lat": None, "lon": None, "provider": GEOCODE_PROVIDER, "cached": False}
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {GEOCODE_TABLE} (CLE, ADRESSE, LAT, LON, FOURNISSEUR, MAJ_LE)
+            VALUES (:k, :adr, :lat, :lon, :prov, NOW())
+            ON DUPLICATE KEY UPDATE LAT = VALUES(LAT), LON = VALUES(LON),
+                                    FOURNISSEUR = VALUES(FOURNISSEUR), MAJ_LE = VALUES(MAJ_LE)
+        """), {"k": key, "adr": norm[:500], "lat": lat, "lon": lon, "prov": GEOCODE_PROVIDER})
+    return {"found": coords is not None, "lat": lat, "lon": lon, "provider": GEOCODE_PROVIDER, "cached": False}
+
+def geocode(parts: dict) -> dict:
+    """
+    Adresse → {"found", "lat", "lon", "provider", "cached"}.
+    Adresses identiques simultanées (postes, rattrapage) → un seul appel au fournisseur.
+    """
+    norm = _geocode_norm(_geocode_query(parts))
+    if not norm:
+        return {"found": False, "lat": None, "lon": None, "provider": None, "cached": False}
+    key = hashlib.sha1(norm.encode("utf-8")).hexdigest()
+    loaded = []
+
+    def _load():
+        loaded.append(True)
+        return _geocode_load(key, norm, parts)
+    res = _GEOCODE_MEMO.get_or_load(("geocode", key), _load, tables=(GEOCODE_TABLE,))
+    return res if loaded else {**res, "cached": True}
+
+def _geocode_coords(res: dict) -> str:
+    return f"{res['lat']},{res['lon']}" if res.get("found") else ""
+
+@app.get("/geocode")
+def get_geocode():
+    """?voie=..&cp=..&ville=..&pays=France (ou ?q=adresse libre) → {"found", "lat", "lon", "coords"}."""
+    parts = {k: (request.args.get(k) or "").strip() for k in ("voie", "cp", "ville", "pays", "q")}
+    if not parts["q"] and not (parts["voie"] and (parts["cp"] or parts["ville"])):
+        return jsonify({"ok": False, "error": "voie + (cp ou ville) attendus, ou q"}), 400
+    try:
+        res = geocode(parts)
+        return jsonify({"ok": True, **res, "coords": _geocode_coords(res)}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+class _GeocodeBackfill:
+    """
+    Rattrapage des coordonnées des commandes existantes (GEOCODE_COLUMN vide, adresse renseignée) :
+    - parcours par N croissant, GEOCODE_BATCH commandes par passe
+    - passe par geocode() → cache partagé, fournisseur limité à 1 appel / GEOCODE_MIN_INTERVAL_S
+    - UPDATE conditionnel (colonne toujours vide) : une saisie faite entre-temps n'est pas écrasée
+    """
+    _WHERE = (f"(NULLIF(TRIM({GEOCODE_COLUMN}), '') IS NULL) AND NULLIF(TRIM(VOIE_INSTALLATION), '') IS NOT NULL"
+              " AND (NULLIF(TRIM(CP_INSTALLATION), '') IS NOT NULL OR NULLIF(TRIM(VILLE_INSTALLATION), '') IS NOT NULL)")
+
+    def __init__(self):
+        self._run_lock = threading.Lock()
+        self.updated = self.missed = self.failed = 0
+        self.last_run: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def _batch(self, after_n: int) -> list[dict]:
+        with engine.connect() as conn:
+            return [dict(r) for r in conn.execute(text(
+                f"SELECT N, VOIE_INSTALLATION, CP_INSTALLATION, VILLE_INSTALLATION, PAYS "
+                f"FROM tableau_production_2 WHERE N > :after AND {self._WHERE} ORDER BY N LIMIT {GEOCODE_BATCH}"
+            ), {"after": after_n}).mappings().all()]
+
+    def preview(self) -> dict:
+        with engine.connect() as conn:
+            total = conn.execute(text(f"SELECT COUNT(*) FROM tableau_production_2 WHERE {self._WHERE}")).scalar()
+        return {"candidates": int(total or 0), "sample": [r["N"] for r in self._batch(0)[:20]],
+                "provider": GEOCODE_PROVIDER}
+
+    def run(self, limit: Optional[int] = None, dry_run: bool = False) -> dict:
+        if dry_run:
+            return {"dry_run": True, **self.preview()}
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("rattrapage du géocodage déjà en cours")
+        updated = missed = failed = 0
+        try:
+            after = 0
+            while limit is None or updated + missed + failed < limit:
+                rows = self._batch(after)
+                if not rows:
+                    break
+                done: list[int] = []
+                for r in rows:
+                    if limit is not None and updated + missed + failed >= limit:
+                        break
+                    after = int(r["N"])
+                    parts = {"voie": (r["VOIE_INSTALLATION"] or "").strip(), "cp": (r["CP_INSTALLATION"] or "").strip(),
+                             "ville": (r["VILLE_INSTALLATION"] or "").strip(),
+                             "pays": (r["PAYS"] or "France").strip()}
+                    try:
+                        res = geocode(parts)
+                    except Exception as e:
+                        failed += 1
+                        self.last_error = repr(e)
+                        continue
+                    if not res["found"]:
+                        missed += 1
+                        continue
+                    with engine.begin() as conn:
+                        rc = conn.execute(text(
+                            f"UPDATE tableau_production_2 SET {GEOCODE_COLUMN} = :c "
+                            f"WHERE N = :n AND NULLIF(TRIM({GEOCODE_COLUMN}), '') IS NULL"
+                        ), {"c": _geocode_coords(res), "n": after}).rowcount
+                    if rc:
+                        done.append(after)
+                updated += len(done)
+                if done:
+                    _notify_write("tableau_production_2", done)
+            self.last_run = datetime.now().isoformat(timespec="seconds")
+            _log(f"GEOCODE : {updated} commande(s) géocodée(s), {missed} introuvable(s), {failed} en échec")
+            return {"updated": updated, "missed": missed, "failed": failed}
+        finally:
+            self.updated += updated
+            self.missed += missed
+            self.failed += failed
+            self._run_lock.release()
+
+    def status(self) -> dict:
+        return {"provider": GEOCODE_PROVIDER, "running": self._run_lock.locked(),
+                "updated": self.updated, "missed": self.missed, "failed": self.failed,
+                "last_run": self.last_run, "last_error": self.last_error, "memo": _GEOCODE_MEMO.status()}
+
+_GEOCODE_BACKFILL = _GeocodeBackfill()
+
+@app.post("/geocode/backfill")
+def run_geocode_backfill():
+    """
+    {"dry_run": true} → commandes à géocoder (nombre, échantillon), 200
+    {"limit": 500} → rattrapage en tâche de fond, 202 (suivi : /health → "geocode")
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get("dry_run"):
+        try:
+            return jsonify({"ok": True, **_GEOCODE_BACKFILL.run(dry_run=True)}), 200
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+    try:
+        limit = int(data["limit"]) if data.get("limit") is not None else None
+        if limit is not None and limit < 1:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "limit : entier ≥ 1 attendu"}), 400
+    if _GEOCODE_BACKFILL.status()["running"]:
+        return jsonify({"ok": False, "error": "rattrapage du géocodage déjà en cours"}), 409
+
+    def _job():
+        try:
+            _GEOCODE_BACKFILL.run(limit)
+        except Exception as e:
+            _log("geocode backfill error", e)
+    threading.Thread(target=_job, daemon=True, name="geocode-backfill").start()
+    return jsonify({"ok": True, "queued": True, "limit": limit}), 202
+
+# -----------------------------------------------------------
+# Mode asyncio (ASGI) : lectures chaudes + flux SSE natifs, autres routes Flask sur un pool de threads
+# -----------------------------------------------------------
+import asyncio
+from urllib.parse import parse_qsl
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+SSE_HEARTBEAT_S = 15.0
+SSE_QUEUE_MAX = 100
+
+class _AsyncDB:
+    """Pool MySQL asyncio (mysql.connector.aio) sur le même tunnel SSH ; les appelants attendent si plein."""
+    def __init__(self, size: int):
+        self.size = size
+        self._pool = None
+        self._port = None
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(size)
+
+    async def _get_pool(self):
+        async with self._lock:
+            t = _tunnel if (_tunnel and getattr(_tunnel, "is_active", False)) else None
+            if t is None:
+                # connexion SSH bloquante → hors boucle
+                t = await asyncio.get_running_loop().run_in_executor(None, start_tunnel)
+                if not t:
+                    raise RuntimeError(f"SSH_TUNNEL_DOWN: {_last_tunnel_err}")
+            if self._pool is None or self._port != t.local_bind_port:
+                await self.close()
+                from mysql.connector import aio as _mysql_aio
+                pool = _mysql_aio.MySQLConnectionPool(
+                    pool_name="lcf_aio", pool_size=self.size, pool_reset_session=True,
+                    host=_link_host(t), port=t.local_bind_port, database=MYSQL_DB,
+                    user=MYSQL_USER, password=MYSQL_PWD, autocommit=True,
+                    connection_timeout=6, client_flags=[ClientFlag.FOUND_ROWS],
+                )
+                await pool.initialize_pool()
+                self._pool, self._port = pool, t.local_bind_port
+            return self._pool
+
+    async def fetch_all(self, sql, params=None, budget_ms: int = QUERY_BUDGET_READ_MS,
+                        endpoint: Optional[str] = None) -> list[dict]:
+        """
+        SELECT borné comme la voie synchrone : hint MAX_EXECUTION_TIME / max_statement_time côté serveur,
+        et asyncio.wait_for(budget + QUERY_KILL_GRACE_S) côté client → QueryTimeout (repli WSGI).
+        """
+        q = str(sql)
+        if isinstance(params, dict):
+            q = re.sub(r":([A-Za-z_]\w*)", r"%(\1)s", q)
+        _BREAKER.before_checkout()
+        async with self._slots:
+            try:
+                cnx = await (await self._get_pool()).get_connection()
+            except Exception:
+                _BREAKER.record_failure()
+                raise
+            _BREAKER.record_success()
+            try:
+                info = cnx.get_server_info()
+                if asyncio.iscoroutine(info):
+                    info = await info
+                q = _with_time_hint(cnx, q, budget_ms, server=str(info or ""))
+                cur = await cnx.cursor(dictionary=True)
+                try:
+                    async def _run():
+                        await cur.execute(q, params)
+                        return [dict(r) for r in await cur.fetchall()]
+                    return await asyncio.wait_for(_run(), budget_ms / 1000.0 + QUERY_KILL_GRACE_S)
+                except asyncio.TimeoutError:
+                    _QUERY_WATCHDOG.count_timeout(endpoint)
+                    raise QueryTimeout(budget_ms) from None
+                except Exception as e:
+                    if getattr(e, "errno", None) in _TIMEOUT_ERRNOS:
+                        _QUERY_WATCHDOG.count_timeout(endpoint)
+                        raise QueryTimeout(budget_ms) from e
+                    raise
+                finally:
+                    try:
+                        await cur.close()
+                    except Exception:
+                        pass   # curseur interrompu par wait_for : l'erreur utile est déjà levée
+            finally:
+                try:
+                    await cnx.close()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            try:
+                await self._pool.close_pool()
+            except Exception:
+                pass
+            self._pool = None
+
+# Abonnés SSE (/events) : une asyncio.Queue par client, alimentée par on_write depuis n'importe quel thread
+_SSE_CLIENTS: "set[asyncio.Queue]" = set()
+_ASGI_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+def _sse_push(q: asyncio.Queue, payload: str) -> None:
+    try:
+        q.put_nowait(payload)
+    except asyncio.QueueFull:
+        pass  # client trop lent : il rechargera à la prochaine notification
+
+@on_write
+def _sse_on_write(table, ns):
+    loop = _ASGI_LOOP
+    if loop is None or not _SSE_CLIENTS:
+        return
+    payload = json.dumps({"table": table, "ns": list(ns) if ns is not None else None}, default=str)
+    for q in list(_SSE_CLIENTS):
+        loop.call_soon_threadsafe(_sse_push, q, payload)
+
+def _build_asgi_app(wsgi_threads: int):
+    """
+    Application ASGI :
+      - GET /orders/<n> : cache / miroir puis MySQL asynchrone (aucun thread bloqué)
+      - GET /events     : flux SSE des écritures (aucun thread par client)
+      - tout le reste (et tout échec ci-dessus) : Flask, via a2wsgi sur `wsgi_threads` threads
+    """
+    from a2wsgi import WSGIMiddleware
+
+    wsgi = WSGIMiddleware(app, workers=wsgi_threads)
+    adb = _AsyncDB(ASYNC_DB_POOL_SIZE)
+    cors = [(b"access-control-allow-origin", b"*")]
+
+    async def send_json(send, status: int, body: dict, extra_headers=()):
+        raw = app.json.dumps(body, separators=(",", ":")).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(raw)).encode()), *cors, *extra_headers]})
+        await send({"type": "http.response.body", "body": raw})
+
+    async def get_order(n: int, args: list, send) -> bool:
+        """Lecture native de la table chaude ; False si absente (la route Flask regarde l'archive et répond)."""
+        loop = asyncio.get_running_loop()
+        fields = dict(args).get("fields")
+        select_cols, (row, sql) = await loop.run_in_executor(
+            None, lambda: (_order_select_columns(fields), _order_row_local(n))
+        )
+        if sql is not None:
+            budget = QUERY_BUDGETS_MS.get("get_order", QUERY_BUDGET_READ_MS)
+            row = _remember_order_row(n, await adb.fetch_all(sql, {"n": n}, budget, endpoint="get_order"))
+        if not row:
+            return False
+        body = {"ok": True, "row": _project_row(row, select_cols), "version": row["_version"]}
+        _remember_last_good((f"/orders/{n}", tuple(sorted(args))), body)
+        await send_json(send, 200, body, [(b"etag", f'"{row["_version"]}"'.encode())])
+        return True
+
+    async def events(receive, send) -> None:
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAX)
+        _SSE_CLIENTS.add(q)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"),
+                                (b"cache-control", b"no-cache"), *cors]})
+
+        async def wait_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        gone = asyncio.ensure_future(wait_disconnect())
+        try:
+            while True:
+                nxt = asyncio.ensure_future(q.get())
+                done, _ = await asyncio.wait({nxt, gone}, timeout=SSE_HEARTBEAT_S,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if gone in done:
+                    nxt.cancel()
+                    return
+                chunk = f"event: write\ndata: {nxt.result()}\n\n" if nxt in done else ": ping\n\n"
+                if nxt not in done:
+                    nxt.cancel()
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        finally:
+            gone.cancel()
+            _SSE_CLIENTS.discard(q)
+
+    async def asgi_app(scope, receive, send):
+        global _ASGI_LOOP
+        if scope["type"] == "lifespan":
+            while True:
+                msg = await receive()
+                if msg["type"] == "lifespan.startup":
+                    _ASGI_LOOP = asyncio.get_running_loop()
+                    await send({"type": "lifespan.startup.complete"})
+                elif msg["type"] == "lifespan.shutdown":
+                    _ASGI_LOOP = None
+                    await adb.close()
+                    # uvicorn relance ensuite le signal reçu : le finally du lancement ne s'exécuterait pas
+                    await asyncio.get_running_loop().run_in_executor(None, _shutdown)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] == "http" and scope["method"] == "GET":
+            args = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+            headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+            token = headers.get("x-app-token") or dict(args).get("token")  # EventSource : pas d'en-têtes
+            if token == APP_SECRET_TOKEN:
+                if scope["path"] == "/events":
+                    await events(receive, send)
+                    return
+                m = re.fullmatch(r"/orders/(\d+)", scope["path"])
+                if m:
+                    try:
+                        if await get_order(int(m.group(1)), args, send):
+                            return
+                    except Exception as e:
+                        # base lente/injoignable : Flask gère disjoncteur et copie périmée
+                        _log(f"[asgi] GET {scope['path']} → repli WSGI", e)
+
+        await wsgi(scope, receive, send)
+
+    return asgi_app
+
+# ========== Tâches de fond ==========
+if _MIRROR is not None:
+    _MIRROR.start()
+if ARCHIVE_INTERVAL_H > 0:
+    _ARCHIVE.start()
+
 # ========== 4) Lancement ==========
+# Serveur : waitress (production, pool de threads borné) ou serveur de dev Flask.
+# Réglable par variables d'environnement ou en ligne de commande (voir --help).
+import argparse
+import signal
+
+SERVER_MODE = (os.getenv("SERVER_MODE") or "waitress").strip().lower()   # waitress | asgi | dev
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "5000"))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", str(DB_POOL_SIZE)))     # 1 thread ↔ 1 connexion du pool
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "64"))
+SERVER_KEEPALIVE_S = int(os.getenv("SERVER_KEEPALIVE_S", "30"))          # fermeture des connexions inactives
+SERVER_CONNECTION_LIMIT = int(os.getenv("SERVER_CONNECTION_LIMIT", "100"))
+SERVER_MAX_BODY = int(os.getenv("SERVER_MAX_BODY", str(16 * 1024 * 1024)))
+SERVER_SHUTDOWN_GRACE_S = 5.0
+
+app.config["MAX_CONTENT_LENGTH"] = SERVER_MAX_BODY   # 413 au-delà, quel que soit le serveur
+_boot_mark("imports")   # module entièrement chargé (imports + initialisations)
+
+def _shutdown() -> None:
+    """Arrêt propre : laisse partir l'audit en file (borné), puis ferme le tunnel SSH."""
+    deadline = time.time() + SERVER_SHUTDOWN_GRACE_S
+    while _AUDIT_QUEUE.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.1)
+    try:
+        _AUDIT_STORE.flush()
+    except Exception as e:
+        _log("audit store flush at shutdown", e)
+    print("[STOP] Fermeture du tunnel SSH…")
+    try:
+        if _tunnel is not None:
+            _tunnel.stop()
+    except Exception:
+        pass
+
+def _serve_waitress(host: str, port: int, threads: int) -> None:
+    from waitress.server import create_server
+
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        backlog=SERVER_BACKLOG,
+        channel_timeout=SERVER_KEEPALIVE_S,
+        connection_limit=SERVER_CONNECTION_LIMIT,
+        max_request_body_size=SERVER_MAX_BODY,
+        ident="BackendGDP",
+    )
+    _boot_mark("http_bound")   # socket en écoute : waitForApi peut se connecter
+
+    def _on_signal(signum, _frame):
+        # waitress.run() intercepte SystemExit : plus d'acceptation, requêtes en cours terminées (5 s max)
+        raise SystemExit(0)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _on_signal)
+    print(f"[SERVE] waitress http://{host}:{port} threads={threads} backlog={SERVER_BACKLOG} "
+          f"keepalive={SERVER_KEEPALIVE_S}s pool={DB_POOL_SIZE}", flush=True)
+    server.run()
+
+def _serve_asgi(host: str, port: int, threads: int) -> None:
+    global AUDIT_ASYNC
+    import uvicorn
+
+    AUDIT_ASYNC = True   # aucun SFTP dans les requêtes : l'audit part par le thread audit-writer
+    print(f"[SERVE] asgi (uvicorn) http://{host}:{port} wsgi_threads={threads} "
+          f"async_pool={ASYNC_DB_POOL_SIZE} pool={DB_POOL_SIZE}", flush=True)
+    uvicorn.run(
+        _build_asgi_app(threads),
+        host=host,
+        port=port,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEPALIVE_S,
+        timeout_graceful_shutdown=int(SERVER_SHUTDOWN_GRACE_S),
+        lifespan="on",
+        log_level="warning",
+    )
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backend GDP")
+    parser.add_argument("--server", choices=("waitress", "asgi", "dev"), default=SERVER_MODE)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS)
+    parser.add_argument("--rollup-backfill", action="store_true",
+                        help="reconstruit le cumul mensuel des modules puis quitte")
+    parser.add_argument("--archive", action="store_true",
+                        help="archive les commandes livrées depuis plus de --archive-days jours puis quitte")
+    parser.add_argument("--archive-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="avec --archive / --geocode-backfill : candidats seulement")
+    parser.add_argument("--audit-backfill", action="store_true",
+                        help="importe les fichiers d'audit du NAS dans l'historique structuré puis quitte")
+    parser.add_argument("--geocode-backfill", action="store_true",
+                        help="géocode les commandes sans coordonnées (GEOCODE_PROVIDER) puis quitte")
+    parser.add_argument("--geocode-limit", type=int, default=None, help="avec --geocode-backfill : nombre max")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = _parse_args()
+    if args.rollup_backfill:
+        try:
+            print(f"[ROLLUP] {_ROLLUP.rebuild()}", flush=True)
+        finally:
+            _shutdown()
+        sys.exit(0)
+    if args.archive:
+        try:
+            print(f"[ARCHIVE] {_ARCHIVE.run(args.archive_days, dry_run=args.dry_run)}", flush=True)
+        finally:
+            _shutdown()
+        sys.exit(0)
+    if args.audit_backfill:
+        try:
+            print(f"[AUDIT] {_AUDIT_STORE.backfill()}", flush=True)
+        finally:
+            _shutdown()
+        sys.exit(0)
+    if args.geocode_backfill:
+        try:
+            print(f"[GEOCODE] {_GEOCODE_BACKFILL.run(args.geocode_limit, dry_run=args.dry_run)}", flush=True)
+        finally:
+            _shutdown()
+        sys.exit(0)
+    if args.server == "asgi":
+        try:
+            import uvicorn, a2wsgi  # noqa: F401
+            from mysql.connector import aio  # noqa: F401
+        except ImportError as e:
+            print(f"[SERVE] mode asgi indisponible ({e}) → waitress", flush=True)
+            args.server = "waitress"
+    if args.server == "waitress":
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            print("[SERVE] waitress absent → serveur de dev Flask", flush=True)
+            args.server = "dev"
     try:
-        app.run(host="127.0.0.1", port=5000, threaded=True, use_reloader=False)
+        if args.server == "asgi":
+            _serve_asgi(args.host, args.port, args.threads)
+        elif args.server == "waitress":
+            _serve_waitress(args.host, args.port, args.threads)
+        else:
+            app.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
     finally:
-        print("[STOP] Fermeture du tunnel SSH…")
-        try:
-            tunnel.stop()
-        except Exception:
-            pass
+        _shutdown()
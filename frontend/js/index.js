@@ -22,8 +22,31 @@ async function loadAppToken() {
   console.log("TOKEN FRONT =", window.APP_TOKEN);
 }
 
+// Réponses pré-chargées via POST /batch (consommées une seule fois par apiGet)
+const batchPrefetched = new Map();
+
+// Regroupe plusieurs GET en UN aller-retour (POST /batch) ; apiGet les servira ensuite
+// opts.poll : rafraîchissement auto (classe "poll" côté serveur)
+async function apiBatchPrefetch(urls, opts = {}) {
+  try {
+    const json = await apiPost("/batch", { requests: urls.map(path => ({ path })) }, { poll: opts.poll });
+    for (const r of json.responses || []) {
+      if (r.status === 200 && r.body && r.body.ok !== false) batchPrefetched.set(r.path, r.body);
+    }
+  } catch (e) {
+    console.warn("apiBatchPrefetch failed:", e);  // apiGet fera les appels un par un
+  }
+}
+
 // GET générique avec gestion du token + retry si 401
+// opts.poll : rafraîchissement auto → priorité basse côté serveur (peut recevoir un 429)
 async function apiGet(url, opts = {}) {
+  if (batchPrefetched.has(url)) {
+    const json = batchPrefetched.get(url);
+    batchPrefetched.delete(url);
+    return json;
+  }
+
   // s’il n’y a pas de token, on le charge d’abord
   if (!window.APP_TOKEN) {
     await loadAppToken();
@@ -34,7 +57,8 @@ async function apiGet(url, opts = {}) {
       method: "GET",
       cache: "no-store",
       headers: {
-        "X-App-Token": window.APP_TOKEN || ""
+        "X-App-Token": window.APP_TOKEN || "",
+        ...(opts.poll ? { "X-Request-Class": "poll" } : {})
       }
     });
 
@@ -59,7 +83,7 @@ async function apiGet(url, opts = {}) {
     if (e.status === 401 && !opts._retried) {
       console.warn("Token invalide, rechargement…");
       await loadAppToken();
-      return apiGet(url, { _retried: true });
+      return apiGet(url, { ...opts, _retried: true });
     }
     throw e;
   }
@@ -77,7 +101,8 @@ async function apiPost(url, body, opts = {}) {
       cache: "no-store",
       headers: {
         "Content-Type": "application/json",
-        "X-App-Token": window.APP_TOKEN || ""
+        "X-App-Token": window.APP_TOKEN || "",
+        ...(opts.poll ? { "X-Request-Class": "poll" } : {})
       },
       body: JSON.stringify(body || {})
     });
@@ -101,7 +126,7 @@ async function apiPost(url, body, opts = {}) {
     if (e.status === 401 && !opts._retried) {
       console.warn("Token invalide (POST), rechargement…");
       await loadAppToken();
-      return apiPost(url, body, { _retried: true });
+      return apiPost(url, body, { ...opts, _retried: true });
     }
     throw e;
   }
@@ -126,14 +151,16 @@ function getActivePageKey() {
 
 async function autoRefreshTick() {
   const page = getActivePageKey();
+  // classe "poll" passée explicitement : une action de l'utilisateur pendant le tick reste en "read"
+  const poll = { poll: true };
 
   try {
     // 1) Tableau de bord → stats + graphique
     if (page === "dashboard") {
       if (typeof window.refreshDashboard === "function") {
-        await window.refreshDashboard();          // /orders/stats + /orders/modules-evolution
+        await window.refreshDashboard(poll);      // /orders/stats + /orders/modules-evolution
       } else if (typeof window.loadDashboardStats === "function") {
-        await window.loadDashboardStats();        // fallback
+        await window.loadDashboardStats(poll);    // fallback
       }
 
     // 2) Page commandes
@@ -147,20 +174,20 @@ async function autoRefreshTick() {
 
       // b) Sinon, on recharge simplement la liste des commandes
       if (typeof window.refreshOrdersList === "function") {
-        await window.refreshOrdersList();   // garde le filtre actuel
+        await window.refreshOrdersList(poll);   // garde le filtre actuel
       } else if (typeof window.loadOrders === "function") {
-        await window.loadOrders();          // fallback
+        await window.loadOrders(poll);          // fallback
       }
 
     // 3) Page clients → recharge la liste clients
     } else if (page === "clients") {
       if (typeof window.loadClients === "function") {
-        await window.loadClients();
+        await window.loadClients(poll);
       }
     }
 
   } catch (e) {
-    console.warn("autoRefreshTick failed:", e);
+    console.warn("autoRefreshTick failed:", e);  // 429 : serveur occupé, on réessaiera au prochain tick
   }
 }
 
@@ -371,7 +398,10 @@ async function saveOrder() {
       headers: {
         "Content-Type": "application/json",
         "X-Client-PC": pcName,
-        "X-App-Token": window.APP_TOKEN || ""   // ← token obligatoire
+        "X-App-Token": window.APP_TOKEN || "",  // ← token obligatoire
+        ...(method === "PUT" && window.currentOrderVersion
+          ? { "If-Match": `"${window.currentOrderVersion}"` }
+          : {})
       },
       body: JSON.stringify(data)
     });
@@ -380,6 +410,12 @@ async function saveOrder() {
     let json = {};
     try { json = JSON.parse(text); } catch {}
 
+    // Conflit : la commande a été modifiée ailleurs depuis l'ouverture du formulaire
+    if (res.status === 412) {
+      showNotif("error", "Cette commande a été modifiée par un autre utilisateur. Rouvre-la pour voir ses changements.");
+      return;
+    }
+
     if (!res.ok || !json.ok) throw new Error(json.error || `HTTP ${res.status} ${text}`);
 
     // --- Notifs de mail selon le backend ---
@@ -822,16 +858,14 @@ async function updateCoordonneesFromAdresse() {
   // Besoin d'un minimum d'info pour éviter les faux positifs
   if (!voie || (!cp && !ville)) return;
 
-  const q = [voie, [cp, ville].filter(Boolean).join(" "), pays].filter(Boolean).join(", ");
+  // backend : cache partagé entre postes + un seul appel au fournisseur par adresse
+  const params = new URLSearchParams({ voie, cp, ville, pays });
+  const previous = out.value;   // rendu tel quel si l'adresse n'est pas trouvée
   try {
     out.value = "Recherche…";
-    const res = await fetch(
-      `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(q)}&addressdetails=0`,
-      { headers: { "Accept-Language": "fr" } }
-    );
-    const data = await res.json();
-    if (Array.isArray(data) && data.length) {
-      const lat = Number(data[0].lat), lon = Number(data[0].lon);
+    const data = await apiGet(`/geocode?${params.toString()}`);
+    if (data && data.found) {
+      const lat = Number(data.lat), lon = Number(data.lon);
       if (Number.isFinite(lat) && Number.isFinite(lon)) {
         out.value = `${lat},${lon}`;
         // recentrer la carte si présente (facultatif)
@@ -842,14 +876,14 @@ async function updateCoordonneesFromAdresse() {
         return;
       }
     }
-    out.value = ""; // pas trouvé
+    out.value = previous; // pas trouvé : coordonnées existantes conservées
   } catch (e) {
-    console.error("Géocodage OSM échoué :", e);
-    out.value = "";
+    console.error("Géocodage échoué :", e);
+    out.value = previous;
   }
 }
 
-// Debounce utilitaire pour ne pas spammer l’API
+// Debounce utilitaire pour ne pas spammer le backend
 function debounce(fn, d = 600) {
   let t; return (...a) => { clearTimeout(t); t = setTimeout(() => fn(...a), d); };
 }
@@ -931,6 +965,7 @@ async function openOrderForEdit(n) {
 
   const row = data.row || {};
   window.currentOrder = { ...row };
+  window.currentOrderVersion = data.version || null;   // renvoyé en If-Match à l'enregistrement
 
   // 2) ouvre la modale tout de suite
   if (typeof openModal === "function") openModal("orderModal");
@@ -1270,10 +1305,10 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 });
 
-async function loadDashboardStats() {
+async function loadDashboardStats(opts = {}) {
   try {
     // Pas de cache → on tape vraiment le backend à chaque fois
-    const data = await apiGet(`/orders/stats`);
+    const data = await apiGet(`/orders/stats`, { poll: opts.poll });
     if (!data || !data.ok) throw new Error(data?.error || "Erreur stats");
 
     const s = data.stats || {};
@@ -1302,14 +1337,17 @@ async function loadDashboardStats() {
   }
 }
 
-async function refreshDashboard() {
+async function refreshDashboard(opts = {}) {
   try {
+    // Stats + graphique en un seul aller-retour
+    await apiBatchPrefetch(["/orders/stats", "/orders/modules-evolution"], opts);
+
     // Stats (compteurs + CA)
-    await loadDashboardStats();
+    await loadDashboardStats(opts);
 
     // Graphique d’évolution, si défini côté script.js
     if (typeof window.loadOrdersEvolutionChart === "function") {
-      await window.loadOrdersEvolutionChart();
+      await window.loadOrdersEvolutionChart(opts);
     }
   } catch (e) {
     console.error("refreshDashboard failed:", e);
@@ -2162,7 +2200,7 @@ let currentMarketingFilter = '';
 let currentSearchQuery     = '';
 let allOrders = [];
 
-async function loadOrders({ status, marketing, q, limit = 500, offset = 0 } = {}) {
+async function loadOrders({ status, marketing, q, limit = 500, offset = 0, poll = false } = {}) {
 
     if (status    !== undefined) currentStatusFilter    = status;
     if (marketing !== undefined) currentMarketingFilter = marketing;
@@ -2170,25 +2208,36 @@ async function loadOrders({ status, marketing, q, limit = 500, offset = 0 } = {}
 
     const params = new URLSearchParams();
 
-    // Statut (API)
+    // Statut (API) : filtre explicite, sinon celui du bouton actif de la barre latérale
+    const sidebarStatuses = ORDER_STATUS_FILTERS[currentOrderFilter] || [];
     if (Array.isArray(currentStatusFilter) && currentStatusFilter.length > 0) {
-        params.set("status", currentStatusFilter.join(","));
+        currentStatusFilter.forEach(s => params.append("status", s));
     } else if (typeof currentStatusFilter === "string" && currentStatusFilter.trim() !== "") {
-        params.set("status", currentStatusFilter.trim());
+        params.append("status", currentStatusFilter.trim());
+    } else {
+        sidebarStatuses.forEach(s => params.append("status", s));
     }
 
     // Marketing (API)
     if (currentMarketingFilter) {
-        params.set("marketing", currentMarketingFilter);
+        params.append("marketing", currentMarketingFilter);
+    } else if (currentOrderFilter === "orders_marketing") {
+        params.append("marketing", "OUI");
+    }
+
+    // Recherche (API) : le serveur ne renvoie que les lignes affichées
+    if (currentSearchQuery) {
+        params.set("q", currentSearchQuery);
     }
 
     params.set("limit",  String(limit));
     params.set("offset", String(offset));
 
-    const data = await apiGet(`/orders?` + params.toString());
+    const data = await apiGet(`/orders?` + params.toString(), { poll });
     if (!data || !data.ok) throw new Error(data?.error || "Erreur API /orders");
 
     allOrders = data.rows || [];
+    window.ordersTotal = data.total ?? allOrders.length;   // nb total correspondant aux filtres
 
     applyOrdersFilter();
 }
@@ -2297,8 +2346,8 @@ function setActiveOrdersFilter(filterKey = "") {
   if (window.lucide) lucide.createIcons();
 }
 
-async function refreshOrdersList() {
-    await loadOrders();       // recharge les données brutes
+async function refreshOrdersList(opts = {}) {
+    await loadOrders({ poll: opts.poll });   // recharge les données brutes
     applyOrdersFilter();      // applique filtre (statut + marketing + recherche)
 }
 
@@ -2342,9 +2391,16 @@ document.querySelectorAll('.nav-item[data-filter]').forEach(btn => {
 // === Recherche locale + (option) déclenchement serveur ===
 const ordersSearch = document.getElementById('orders-search');
 if (ordersSearch) {
+    let ordersSearchTimer = null;
     ordersSearch.addEventListener('input', function () {
         currentSearchQuery = this.value.trim().toLowerCase();
-        applySearchFilter();   // ← OBLIGATOIRE
+        applySearchFilter();   // ← OBLIGATOIRE (retour immédiat sur la page déjà chargée)
+
+        // puis recherche serveur (au-delà des lignes déjà téléchargées), après la frappe
+        clearTimeout(ordersSearchTimer);
+        ordersSearchTimer = setTimeout(() => {
+            loadOrders().catch(e => console.warn("recherche commandes:", e));
+        }, 300);
     });
 }
 
@@ -2378,13 +2434,13 @@ function renderClients(rows) {
   if (window.lucide) lucide.createIcons();
 }
 
-async function loadClients({ q = '', limit = 500, offset = 0 } = {}) {
+async function loadClients({ q = '', limit = 500, offset = 0, poll = false } = {}) {
   const params = new URLSearchParams();
   if (q) params.set('q', q);
   params.set('limit', String(limit));
   params.set('offset', String(offset));
 
-const data = await apiGet(`/clients?` + params.toString());
+const data = await apiGet(`/clients?` + params.toString(), { poll });
 if (!data || !data.ok) {
     throw new Error(data?.error || "Erreur API /clients");
 }
@@ -2474,13 +2530,13 @@ document.addEventListener('keydown', function(e) {
     }
 });
 
-async function loadOrdersEvolutionChart() {
+async function loadOrdersEvolutionChart(opts = {}) {
     const ordersCtx = document.getElementById('ordersChart');
     if (!ordersCtx) return;
 
     try {
         // 📌 apiGet retourne DIRECTEMENT un objet JSON
-        const data = await apiGet(`/orders/modules-evolution`);
+        const data = await apiGet(`/orders/modules-evolution`, { poll: opts.poll });
 
         if (!data || !data.ok) {
             throw new Error(data?.error || "Erreur API /orders/modules-evolution");
@@ -93,7 +93,12 @@ function startLocalBackend() {
             log(`[backend] trying: ${cand.cmd} ${cand.args.join(" ")} ${backendPath}`);
             const p = spawn(cand.cmd, [...cand.args, backendPath], {
                 cwd,
-                env: { ...process.env, PYTHONUTF8: "1" },
+                // imports différés : /health répond avant le chargement de SQLAlchemy/paramiko/win32com
+                // géocodage : Nominatim via le cache du backend (offline réservé au banc d'essai)
+                env: {
+                    ...process.env, PYTHONUTF8: "1", DEFERRED_IMPORTS: process.env.DEFERRED_IMPORTS || "1",
+                    GEOCODE_PROVIDER: process.env.GEOCODE_PROVIDER || "nominatim",
+                },
                 stdio: ["ignore", "pipe", "pipe"],
                 windowsHide: true,
             });